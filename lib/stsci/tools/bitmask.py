@@ -9,16 +9,21 @@ A module that provides functions for manipulating bitmasks and data quality
 """
 
 import sys
+import threading
 import warnings
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 import six
 import numpy as np
 from astropy.utils import deprecated
 
-__version__ = '1.1.1'
-__vdate__ = '30-January-2018'
+__version__ = '1.6.0'
+__vdate__ = '18-October-2026'
 __author__ = 'Mihai Cara'
 
-__all__ = ['interpret_bit_flags', 'bitfield_to_boolean_mask', 'is_bit_flag']
+__all__ = ['interpret_bit_flags', 'bitfield_to_boolean_mask',
+           'bitfield_to_boolean_masks', 'is_bit_flag', 'BitFlagExpr',
+           'compile_bit_flags', 'PackedMask', 'RLEMask', 'flag_statistics']
 
 # Revision history:
 # 0.1.0 (29-March-2015) - initial release based on code from stsci.skypac
@@ -48,6 +53,21 @@ __all__ = ['interpret_bit_flags', 'bitfield_to_boolean_mask', 'is_bit_flag']
 #          `ignore_flags` argument contains bit flags beyond what the type of
 #          the argument `bitfield` can hold.
 # 1.1.1 (30-January-2018) - Improved filtering of high bits in flags.
+# 1.2.0 (18-October-2026) - `bitfield_to_boolean_mask()` now processes the
+#       input in cache-sized chunks written directly into the output array,
+#       which can be supplied through the new 'out' argument, and can spread
+#       the chunks over a pool of threads ('nthreads' argument).
+# 1.3.0 (18-October-2026) - Added `bitfield_to_boolean_masks()` which builds
+#       masks for several sets of bit flags in a single pass over the input
+#       bit field array, optionally packed into the bits of an integer array.
+# 1.4.0 (18-October-2026) - String bit flag expressions are now compiled into
+#       hashable `BitFlagExpr` objects kept in an LRU cache
+#       (`compile_bit_flags()`), and flags can be given by name through the
+#       new 'flag_name_map' argument.
+# 1.5.0 (18-October-2026) - Added `PackedMask` (1 bit per element) and
+#       `RLEMask` (run-length encoded) compact mask representations.
+# 1.6.0 (18-October-2026) - Added `flag_statistics()` which counts the
+#       elements having each bit (or flag) set in a single pass.
 #
 INT_TYPE = (int, long,) if sys.version_info < (3,) else (int,)
 MAX_UINT_TYPE = np.maximum_sctype(np.uint)
@@ -55,6 +75,21 @@ SUPPORTED_FLAGS = int(np.bitwise_not(
     0, dtype=MAX_UINT_TYPE, casting='unsafe'
 ))
 
+# Approximate number of bytes of the input bit field array processed at a
+# time, chosen so that a chunk and its temporaries stay in the CPU cache
+CHUNK_SIZE = 256 * 1024
+
+# Maximum number of compiled bit flag expressions kept by compile_bit_flags()
+BIT_FLAG_CACHE_SIZE = 256
+_bit_flag_cache = OrderedDict()
+_bit_flag_cache_lock = threading.Lock()
+
+# Number of bits set in each possible byte value
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+# Bits of each possible byte value: _BYTE_BITS[v, k] is bit k of v
+_BYTE_BITS = (np.arange(256)[:, None] >> np.arange(8)) & 1
+
 
 def is_bit_flag(n):
     """
@@ -79,6 +114,69 @@ def is_bit_flag(n):
     return bin(n).count('1') == 1
 
 
+def _as_rows(*arrays):
+    """
+    Returns views of the input arrays, all of the same shape, that can be
+    sliced along their first axis: zero-dimensional arrays are given one
+    dimension and arrays are flattened when all of them are C-contiguous.
+
+    """
+    if all([a.flags.c_contiguous for a in arrays]):
+        return [a.reshape(-1) for a in arrays]
+    return [a.reshape((1,) + a.shape) if a.ndim == 0 else a for a in arrays]
+
+
+def _chunk_slices(a, chunk_size=CHUNK_SIZE):
+    """
+    Returns a list of slices that split array ``a`` along its first axis in
+    chunks of about ``chunk_size`` bytes (but of at least one row).
+
+    """
+    nrows = a.shape[0]
+    if nrows == 0:
+        return []
+    rowbytes = max(1, a.itemsize * (a.size // nrows))
+    step = max(1, chunk_size // rowbytes)
+    return [slice(k, min(k + step, nrows)) for k in range(0, nrows, step)]
+
+
+def _map_chunks(func, chunks, nthreads=1):
+    """
+    Calls ``func`` for every chunk (slice) in ``chunks``, using a pool of
+    ``nthreads`` threads when ``nthreads`` is larger than 1, and returns the
+    list of results.
+
+    """
+    if nthreads is not None and nthreads > 1 and len(chunks) > 1:
+        pool = ThreadPool(min(nthreads, len(chunks)))
+        try:
+            return pool.map(func, chunks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        return [func(chunk) for chunk in chunks]
+
+
+def _good_bits(ignore_flags, flip_bits, dtype, flag_name_map=None):
+    """
+    Returns the bitmask, of type ``dtype``, of the bits that are *not*
+    ignored according to ``ignore_flags`` and ``flip_bits`` (see
+    `bitfield_to_boolean_mask`) or `None` when all elements are "good".
+
+    """
+    ignore_mask = interpret_bit_flags(ignore_flags, flip_bits=flip_bits,
+                                      flag_name_map=flag_name_map)
+    if ignore_mask is None:
+        return None
+
+    # filter out bits beyond the maximum supported by the data type:
+    ignore_mask = ignore_mask & SUPPORTED_FLAGS
+
+    # invert the "ignore" mask:
+    return np.bitwise_not(ignore_mask, dtype=dtype, casting='unsafe')
+
+
 def _is_int(n):
     return (
         (isinstance(n, INT_TYPE) and not isinstance(n, bool)) or
@@ -86,7 +184,7 @@ def _is_int(n):
     )
 
 
-def interpret_bit_flags(bit_flags, flip_bits=None):
+def interpret_bit_flags(bit_flags, flip_bits=None, flag_name_map=None):
     """
     Converts input bit flags to a single integer value (bitmask) or `None`.
 
@@ -104,20 +202,26 @@ def interpret_bit_flags(bit_flags, flip_bits=None):
 
     Parameters
     ----------
-    bit_flags : int, str, list, None
+    bit_flags : int, str, list, BitFlagExpr, None
         An integer bitmask or flag, `None`, a string of comma- or
         '+'-separated list of integer bit flags, or a Python list of integer
         bit flags. If `bit_flags` is a `str` and if it is prepended with '~',
         then the output bitmask will have its bits flipped (compared to simple
         sum of input flags). For input `bit_flags` that is already a bitmask
         or a Python list of bit flags, bit-flipping can be controlled through
-        `flip_bits` parameter.
+        `flip_bits` parameter. String expressions are compiled once and
+        cached (see `compile_bit_flags`); an already compiled `BitFlagExpr`
+        is also accepted.
 
     flip_bits : bool, None
         Indicates whether or not to flip the bits of the returned bitmask
         obtained from input bit flags. This parameter must be set to `None`
         when input `bit_flags` is either `None` or a Python list of flags.
 
+    flag_name_map : dict, None
+        A mapping of flag names to integer bit flags, allowing flags in
+        string `bit_flags` to be given by name, e.g., ``'~(SATURATED+HOT)'``.
+
     Returns
     -------
     bitmask : int or None
@@ -142,11 +246,12 @@ def interpret_bit_flags(bit_flags, flip_bits=None):
         '0000000000011100'
         >>> "{0:016b}".format(0xFFFF & interpret_bit_flags([4, 8, 16], flip_bits=True))
         '1111111111100011'
+        >>> "{0:016b}".format(0xFFFF & interpret_bit_flags('~(CR+HOT)', flag_name_map={'CR': 4096, 'HOT': 16}))
+        '1110111111101111'
 
     """
     has_flip_bits = flip_bits is not None
     flip_bits = bool(flip_bits)
-    allow_non_flags = False
 
     if _is_int(bit_flags):
         return (~int(bit_flags) if flip_bits else int(bit_flags))
@@ -159,7 +264,7 @@ def interpret_bit_flags(bit_flags, flip_bits=None):
             )
         return None
 
-    elif isinstance(bit_flags, six.string_types):
+    elif isinstance(bit_flags, (six.string_types, BitFlagExpr)):
         if has_flip_bits:
             raise TypeError(
                 "Keyword argument 'flip_bits' is not permitted for "
@@ -167,8 +272,110 @@ def interpret_bit_flags(bit_flags, flip_bits=None):
                 "the string to indicate bit-flipping."
             )
 
-        bit_flags = str(bit_flags).strip()
+        if isinstance(bit_flags, BitFlagExpr):
+            return bit_flags.bitmask
+
+        return compile_bit_flags(bit_flags, flag_name_map).bitmask
+
+    elif hasattr(bit_flags, '__iter__'):
+        if not all([_is_int(flag) for flag in bit_flags]):
+            raise TypeError("Each bit flag in a list must be an integer.")
+
+    else:
+        raise TypeError("Unsupported type for argument 'bit_flags'.")
+
+    return _sum_bit_flags(list(map(int, bit_flags)), flip_bits, False)
+
+
+def _sum_bit_flags(bit_flags, flip_bits, allow_non_flags):
+    """
+    Returns the bitmask obtained by summing a list of integer bit flags,
+    flipping its bits if ``flip_bits`` is `True`.
+
+    """
+    bitset = set(bit_flags)
+    if len(bitset) != len(bit_flags):
+        warnings.warn("Duplicate bit flags will be ignored")
+
+    bitmask = 0
+    for v in bitset:
+        if not is_bit_flag(v) and not allow_non_flags:
+            raise ValueError("Input list contains invalid (not powers of two) "
+                             "bit flags")
+        bitmask += v
+
+    if flip_bits:
+        bitmask = ~bitmask
+
+    return bitmask
 
+
+def _flag_name_key(flag_name_map):
+    """
+    Returns a hashable, normalized version of a mapping of flag names to
+    flags: a sorted tuple of (upper-case name, int flag) pairs.
+
+    """
+    if not flag_name_map:
+        return ()
+    return tuple(sorted([(str(name).strip().upper(), int(flag))
+                         for name, flag in flag_name_map.items()]))
+
+
+class BitFlagExpr(object):
+    """
+    A compiled string expression of bit flags: ``'4,8'``, ``'~(4+8)'``, etc.
+    (see `interpret_bit_flags` for the syntax). The expression is parsed
+    only once, when the object is created.
+
+    Bit flags in the expression can also be given by name when a mapping of
+    flag names to (integer) flags is provided, e.g., ``'~(SATURATED+HOT)'``.
+    Names are not case sensitive.
+
+    Objects are hashable and compare equal when their bitmasks are equal.
+    Use `compile_bit_flags` to get objects from a cache instead of creating
+    new ones.
+
+    Parameters
+    ----------
+    bit_flags : str
+        A string of comma- or '+'-separated list of integer bit flags or
+        flag names, optionally prepended with '~' and enclosed in
+        parenthesis.
+
+    flag_name_map : dict, None
+        A mapping of flag names to integer bit flags.
+
+    Attributes
+    ----------
+    expression : str
+        The input expression, stripped of leading and trailing white space.
+
+    bitmask : int or None
+        The integer bitmask corresponding to the expression (see
+        `interpret_bit_flags`).
+
+    Examples
+    --------
+        >>> from stsci.tools.bitmask import BitFlagExpr
+        >>> dq_flags = {'SATURATED': 256, 'HOT': 16}
+        >>> expr = BitFlagExpr('~(SATURATED+hot)', flag_name_map=dq_flags)
+        >>> "{0:016b}".format(0xFFFF & expr.bitmask)
+        '1111111011101111'
+        >>> expr == BitFlagExpr('~(16,256)')
+        True
+
+    """
+    def __init__(self, bit_flags, flag_name_map=None):
+        if not isinstance(bit_flags, six.string_types):
+            raise TypeError("Bit flag expressions must be strings.")
+
+        self.expression = str(bit_flags).strip()
+        self.bitmask = self._compile(self.expression,
+                                     dict(_flag_name_key(flag_name_map)))
+
+    @staticmethod
+    def _compile(bit_flags, flag_names):
         if bit_flags.upper() in ['', 'NONE', 'INDEF']:
             return None
 
@@ -216,37 +423,78 @@ def interpret_bit_flags(bit_flags, flip_bits=None):
                 )
             bit_flags = [bit_flags]
 
-        allow_non_flags = len(bit_flags) == 1
+        flags = []
+        for flag in bit_flags:
+            name = flag.strip().upper()
+            if name in flag_names:
+                flags.append(flag_names[name])
+            else:
+                flags.append(int(flag))
 
-    elif hasattr(bit_flags, '__iter__'):
-        if not all([_is_int(flag) for flag in bit_flags]):
-            raise TypeError("Each bit flag in a list must be an integer.")
+        return _sum_bit_flags(flags, flip_bits, len(flags) == 1)
 
-    else:
-        raise TypeError("Unsupported type for argument 'bit_flags'.")
+    def __eq__(self, other):
+        if not isinstance(other, BitFlagExpr):
+            return NotImplemented
+        return self.bitmask == other.bitmask
 
-    bitset = set(map(int, bit_flags))
-    if len(bitset) != len(bit_flags):
-        warnings.warn("Duplicate bit flags will be ignored")
+    def __ne__(self, other):
+        if not isinstance(other, BitFlagExpr):
+            return NotImplemented
+        return self.bitmask != other.bitmask
 
-    bitmask = 0
-    for v in bitset:
-        if not is_bit_flag(v) and not allow_non_flags:
-            raise ValueError("Input list contains invalid (not powers of two) "
-                             "bit flags")
-        bitmask += v
+    def __hash__(self):
+        return hash((BitFlagExpr, self.bitmask))
 
-    if flip_bits:
-        bitmask = ~bitmask
+    def __repr__(self):
+        return "{0}({1!r})".format(self.__class__.__name__, self.expression)
 
-    return bitmask
+
+def compile_bit_flags(bit_flags, flag_name_map=None):
+    """
+    Returns a `BitFlagExpr` for a string expression of bit flags, from an
+    LRU cache of the last `BIT_FLAG_CACHE_SIZE` expressions compiled, so that
+    an expression (and mapping of flag names) is only parsed once.
+
+    Parameters
+    ----------
+    bit_flags : str
+        A string expression of bit flags; see `BitFlagExpr`.
+
+    flag_name_map : dict, None
+        A mapping of flag names to integer bit flags; see `BitFlagExpr`.
+
+    Returns
+    -------
+    expr : BitFlagExpr
+        The compiled expression.
+
+    """
+    key = (str(bit_flags).strip(), _flag_name_key(flag_name_map))
+
+    with _bit_flag_cache_lock:
+        expr = _bit_flag_cache.pop(key, None)
+        if expr is not None:
+            _bit_flag_cache[key] = expr
+            return expr
+
+    expr = BitFlagExpr(key[0], flag_name_map=dict(key[1]))
+
+    with _bit_flag_cache_lock:
+        _bit_flag_cache[key] = expr
+        while len(_bit_flag_cache) > BIT_FLAG_CACHE_SIZE:
+            _bit_flag_cache.popitem(last=False)
+
+    return expr
 
 
 def bitfield_to_boolean_mask(bitfield, ignore_flags=0, flip_bits=None,
-                             good_mask_value=True, dtype=np.bool_):
+                             good_mask_value=True, dtype=np.bool_, out=None,
+                             nthreads=1, flag_name_map=None):
     """
     bitfield_to_boolean_mask(bitfield, ignore_flags=None, flip_bits=None, \
-good_mask_value=True, dtype=numpy.bool\_)
+good_mask_value=True, dtype=numpy.bool\_, out=None, nthreads=1, \
+flag_name_map=None)
     Converts an array of bit fields to a boolean (or integer) mask array
     according to a bitmask constructed from the supplied bit flags (see
     ``ignore_flags`` parameter).
@@ -370,7 +618,23 @@ good_mask_value=True, dtype=numpy.bool\_)
         to "bad" flags will be `True` (or 1).
 
     dtype : data-type (Default = numpy.bool\_)
-        The desired data-type for the output binary mask array.
+        The desired data-type for the output binary mask array. Ignored when
+        ``out`` is provided.
+
+    out : numpy.ndarray, None (Default = None)
+        An array of the same shape as ``bitfield`` in which to place the
+        output mask. Its data type is used instead of ``dtype``.
+
+    nthreads : int (Default = 1)
+        The input ``bitfield`` array is processed in chunks of about
+        `CHUNK_SIZE` bytes, each written directly into the output mask.
+        When ``nthreads`` is larger than 1, the chunks are processed
+        by a pool of ``nthreads`` threads.
+
+    flag_name_map : dict, None (Default = None)
+        A mapping of flag names to integer bit flags, allowing flags to be
+        given by name in a string ``ignore_flags``
+        (see `interpret_bit_flags`).
 
     Returns
     -------
@@ -379,7 +643,8 @@ good_mask_value=True, dtype=numpy.bool\_)
         array whose elements can have two possible values,
         e.g., `True` or `False` (or 1 or 0 for integer ``dtype``) according to
         values of to the input ``bitfield`` elements, ``ignore_flags``
-        parameter, and the ``good_mask_value`` parameter.
+        parameter, and the ``good_mask_value`` parameter. When ``out`` is
+        provided, it is returned.
 
     Examples
     --------
@@ -413,29 +678,613 @@ good_mask_value=True, dtype=numpy.bool\_)
     if not np.issubdtype(bitfield.dtype, np.integer):
         raise TypeError("Input bitfield array must be of integer type.")
 
-    ignore_mask = interpret_bit_flags(ignore_flags, flip_bits=flip_bits)
+    good_bits = _good_bits(ignore_flags, flip_bits, bitfield.dtype,
+                           flag_name_map=flag_name_map)
 
-    if ignore_mask is None:
-        if good_mask_value:
-            mask = np.ones_like(bitfield, dtype=dtype)
-        else:
-            mask = np.zeros_like(bitfield, dtype=dtype)
+    if out is None:
+        mask = np.empty_like(bitfield, dtype=dtype, subok=False)
+    else:
+        if out.shape != bitfield.shape:
+            raise ValueError("Output array must have the same shape as the "
+                             "input bitfield array.")
+        mask = out
+
+    if good_bits is None:
+        mask[...] = 1 if good_mask_value else 0
         return mask
 
-    # filter out bits beyond the maximum supported by the data type:
-    ignore_mask = ignore_mask & SUPPORTED_FLAGS
+    # "good" elements are those with no bits set after ignoring flags:
+    compare = np.equal if good_mask_value else np.not_equal
+    bits, rows = _as_rows(bitfield, mask)
 
-    # invert the "ignore" mask:
-    ignore_mask = np.bitwise_not(ignore_mask, dtype=bitfield.dtype,
-                                 casting='unsafe')
+    def convert(chunk):
+        compare(np.bitwise_and(bits[chunk], good_bits), 0, out=rows[chunk],
+                casting='unsafe')
 
-    mask = np.empty_like(bitfield, dtype=np.bool_)
-    np.bitwise_and(bitfield, ignore_mask, out=mask, casting='unsafe')
+    _map_chunks(convert, _chunk_slices(bits), nthreads=nthreads)
 
-    if good_mask_value:
-        np.logical_not(mask, out=mask)
+    return mask
 
-    return mask.astype(dtype=dtype, subok=False, copy=False)
+
+def bitfield_to_boolean_masks(bitfield, ignore_flags, flip_bits=None,
+                              good_mask_value=True, dtype=np.bool_,
+                              packed=False, nthreads=1, flag_name_map=None):
+    """
+    bitfield_to_boolean_masks(bitfield, ignore_flags, flip_bits=None, \
+good_mask_value=True, dtype=numpy.bool\_, packed=False, nthreads=1, \
+flag_name_map=None)
+    Converts an array of bit fields to several boolean (or integer) mask
+    arrays, one for each bitmask constructed from the items of
+    ``ignore_flags``, reading the input ``bitfield`` array only once.
+
+    This is equivalent to calling `bitfield_to_boolean_mask` for each item
+    of ``ignore_flags``, but the input array is processed in chunks of about
+    `CHUNK_SIZE` bytes and all the masks are computed for a chunk while it is
+    in the CPU cache.
+
+    Parameters
+    ----------
+    bitfield : numpy.ndarray
+        An array of bit flags. See `bitfield_to_boolean_mask`.
+
+    ignore_flags : list
+        A list of bit flag specifications, each of which can take any of the
+        values allowed for the ``ignore_flags`` argument of
+        `bitfield_to_boolean_mask`: integer bitmasks, Python lists of bit
+        flags, strings, or `None`. Each item is interpreted only once.
+
+    flip_bits : bool, None (Default = None)
+        Specifies whether or not to invert the bits of each of the bitmasks
+        built from ``ignore_flags``. See `bitfield_to_boolean_mask`; it must
+        be `None` if any item of ``ignore_flags`` is `None` or a `str`.
+
+    good_mask_value : int, bool (Default = True)
+        Value of the "good" elements of the masks. See
+        `bitfield_to_boolean_mask`.
+
+    dtype : data-type (Default = numpy.bool\_)
+        The desired data-type for the output mask arrays. Ignored when
+        ``packed`` is `True`.
+
+    packed : bool (Default = False)
+        When `True`, return a single array of unsigned integers of the same
+        shape as ``bitfield`` whose bit ``k`` holds the value (1 for `True`)
+        of the mask built from ``ignore_flags[k]``. The smallest of the
+        `numpy.uint8`, `numpy.uint16`, `numpy.uint32` and `numpy.uint64`
+        types that can hold all the masks is used.
+
+    nthreads : int (Default = 1)
+        Number of threads used to process the chunks of ``bitfield``.
+
+    flag_name_map : dict, None (Default = None)
+        A mapping of flag names to integer bit flags used to interpret string
+        items of ``ignore_flags`` (see `interpret_bit_flags`).
+
+    Returns
+    -------
+    masks : numpy.ndarray
+        An array of shape ``(len(ignore_flags),) + bitfield.shape`` whose
+        item ``k`` is the mask built from ``ignore_flags[k]``, or, when
+        ``packed`` is `True`, an array of unsigned integers of the same shape
+        as ``bitfield`` with the masks packed in its bits.
+
+    Examples
+    --------
+        >>> from stsci.tools import bitmask
+        >>> import numpy as np
+        >>> dqbits = np.asarray([[0,0,1,2,0,8,12,0],[10,4,0,0,0,16,6,0]])
+        >>> bitmask.bitfield_to_boolean_masks(dqbits, [0, '~(2+4)'], dtype=int)
+        array([[[1, 1, 0, 0, 1, 0, 0, 1],
+                [0, 0, 1, 1, 1, 0, 0, 1]],
+        <BLANKLINE>
+               [[1, 1, 1, 0, 1, 1, 0, 1],
+                [0, 0, 1, 1, 1, 1, 0, 1]]])
+        >>> bitmask.bitfield_to_boolean_masks(dqbits, [0, '~(2+4)'], packed=True)
+        array([[3, 3, 2, 0, 3, 2, 0, 3],
+               [0, 0, 3, 3, 3, 2, 0, 3]], dtype=uint8)
+
+    """
+    bitfield = np.asarray(bitfield)
+    if not np.issubdtype(bitfield.dtype, np.integer):
+        raise TypeError("Input bitfield array must be of integer type.")
+
+    good_bits = [_good_bits(flags, flip_bits, bitfield.dtype,
+                            flag_name_map=flag_name_map)
+                 for flags in ignore_flags]
+    nmasks = len(good_bits)
+
+    if packed:
+        for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+            if nmasks <= 8 * np.dtype(dtype).itemsize:
+                break
+        else:
+            raise ValueError("At most 64 masks can be packed.")
+        masks = np.zeros_like(bitfield, dtype=dtype, subok=False)
+        rows = _as_rows(bitfield, masks)
+    else:
+        masks = np.empty((nmasks,) + bitfield.shape, dtype=dtype)
+        rows = _as_rows(bitfield, *masks)
+
+    bits = rows.pop(0)
+    compare = np.equal if good_mask_value else np.not_equal
+
+    def convert(chunk):
+        chunk_bits = bits[chunk]
+        for k, good in enumerate(good_bits):
+            if packed:
+                if good is None:
+                    mask = np.full(chunk_bits.shape, bool(good_mask_value))
+                else:
+                    mask = compare(np.bitwise_and(chunk_bits, good), 0)
+                mask = mask.astype(dtype)
+                np.left_shift(mask, k, out=mask, casting='unsafe')
+                np.bitwise_or(rows[0][chunk], mask, out=rows[0][chunk])
+            elif good is None:
+                rows[k][chunk] = 1 if good_mask_value else 0
+            else:
+                compare(np.bitwise_and(chunk_bits, good), 0,
+                        out=rows[k][chunk], casting='unsafe')
+
+    _map_chunks(convert, _chunk_slices(bits), nthreads=nthreads)
+
+    return masks
+
+
+def flag_statistics(bitfield, flags=None, flag_name_map=None, nthreads=1):
+    """
+    Counts the elements of a bit field array that have each bit (or each of
+    the requested bit flags) set, in a single pass over the array.
+
+    The array is processed in chunks of about `CHUNK_SIZE` bytes, so that
+    memory-mapped arrays are never loaded as a whole. For each chunk, a
+    histogram of the values of every byte of the array elements is computed
+    and converted to per-bit counts at the end, instead of testing each bit
+    separately.
+
+    Parameters
+    ----------
+    bitfield : numpy.ndarray
+        An array of bit flags of integer type.
+
+    flags : list, None (Default = None)
+        A list of bit flags or bitmasks, each of which can be anything
+        accepted by `interpret_bit_flags` (integers, lists of integer flags
+        or strings, but not `None`). When `None`, the elements are counted
+        for every bit of the data type of ``bitfield``.
+
+    flag_name_map : dict, None (Default = None)
+        A mapping of flag names to integer bit flags used to interpret string
+        items of ``flags`` (see `interpret_bit_flags`).
+
+    nthreads : int (Default = 1)
+        Number of threads used to process the chunks of ``bitfield``.
+
+    Returns
+    -------
+    counts : numpy.ndarray
+        The number of elements of ``bitfield`` having bit ``k`` (i.e., flag
+        ``2**k``) set, for every bit ``k`` of the data type of ``bitfield``
+        when ``flags`` is `None`, or the number of elements having any of the
+        bits of ``flags[k]`` set.
+
+    Examples
+    --------
+        >>> from stsci.tools import bitmask
+        >>> import numpy as np
+        >>> dqbits = np.asarray([[0,0,1,2,0,8,12,0],[10,4,0,0,0,16,6,0]],
+        ...                     dtype=np.uint8)
+        >>> bitmask.flag_statistics(dqbits)
+        array([1, 3, 3, 3, 1, 0, 0, 0])
+        >>> bitmask.flag_statistics(dqbits, flags=[4, '2+8', 64])
+        array([3, 5, 0])
+
+    """
+    bitfield = np.asarray(bitfield)
+    if not np.issubdtype(bitfield.dtype, np.integer):
+        raise TypeError("Input bitfield array must be of integer type.")
+
+    itemsize = bitfield.dtype.itemsize
+    nbits = 8 * itemsize
+
+    # bitmasks (of the bitfield's type) of flags that are not single bits:
+    multibit = []
+    if flags is not None:
+        bitmasks = []
+        for flag in flags:
+            bitmask = interpret_bit_flags(flag, flag_name_map=flag_name_map)
+            if bitmask is None:
+                raise ValueError("Flags cannot be None.")
+            bitmask &= (1 << nbits) - 1
+            bitmasks.append(bitmask)
+            if not is_bit_flag(bitmask):
+                multibit.append(np.array(bitmask).astype(bitfield.dtype))
+
+    bits = _as_rows(bitfield)[0]
+
+    def histogram(chunk):
+        data = np.ascontiguousarray(bits[chunk]).reshape(-1)
+        lanes = data.view(np.uint8).reshape(-1, itemsize)
+        hist = np.empty((itemsize, 256), dtype=np.int64)
+        for lane in range(itemsize):
+            hist[lane] = np.bincount(lanes[:, lane], minlength=256)
+        counts = [np.count_nonzero(np.bitwise_and(data, m)) for m in multibit]
+        return hist, np.array(counts, dtype=np.int64)
+
+    results = _map_chunks(histogram, _chunk_slices(bits), nthreads=nthreads)
+
+    hist = np.zeros((itemsize, 256), dtype=np.int64)
+    multicounts = np.zeros(len(multibit), dtype=np.int64)
+    for chunk_hist, chunk_counts in results:
+        hist += chunk_hist
+        multicounts += chunk_counts
+
+    # byte lanes in order of increasing significance:
+    big_endian = (bitfield.dtype.byteorder == '>' or
+                  (bitfield.dtype.byteorder == '=' and
+                   sys.byteorder == 'big'))
+    if big_endian:
+        hist = hist[::-1]
+    bitcounts = np.dot(hist, _BYTE_BITS).reshape(-1)
+
+    if flags is None:
+        return bitcounts
+
+    counts = np.empty(len(bitmasks), dtype=np.int64)
+    multicounts = list(multicounts)
+    for k, bitmask in enumerate(bitmasks):
+        if is_bit_flag(bitmask):
+            counts[k] = bitcounts[bitmask.bit_length() - 1]
+        else:
+            counts[k] = multicounts.pop(0)
+
+    return counts
+
+
+def _mask_shape_cards(shape):
+    """
+    Returns header cards recording the shape of a mask, in FITS axis order.
+
+    """
+    cards = [('MSKNAXIS', len(shape), 'number of axes of the mask')]
+    for i, n in enumerate(shape[::-1]):
+        cards.append(('MSKAXIS{0:d}'.format(i + 1), n,
+                      'length of mask axis {0:d}'.format(i + 1)))
+    return cards
+
+
+def _mask_shape(header):
+    """
+    Returns the shape of a mask recorded in a header by `_mask_shape_cards`.
+
+    """
+    naxis = header['MSKNAXIS']
+    return tuple(header['MSKAXIS{0:d}'.format(i)]
+                 for i in range(naxis, 0, -1))
+
+
+def _check_mask_type(header, masktype):
+    if header.get('MASKTYPE') != masktype:
+        raise ValueError("HDU does not hold a mask of type '{0}'."
+                         .format(masktype))
+
+
+class PackedMask(object):
+    """
+    A boolean mask stored with one bit per element, as packed by
+    `numpy.packbits` from the flattened (C order) boolean mask array. It takes
+    8 times less memory than a `numpy.bool_` array.
+
+    Masks can be combined with the ``&``, ``|``, ``^`` and ``~`` operators,
+    which work directly on the packed bytes.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Packed bits of the mask: a 1-D `numpy.uint8` array of
+        ``ceil(prod(shape) / 8)`` bytes; padding bits must be zero.
+
+    shape : tuple of int
+        Shape of the (unpacked) mask.
+
+    Examples
+    --------
+        >>> from stsci.tools import bitmask
+        >>> import numpy as np
+        >>> dqbits = np.asarray([[0,0,1,2,0,8,12,0],[10,4,0,0,0,16,6,0]])
+        >>> mask = bitmask.PackedMask.from_boolean(
+        ...     bitmask.bitfield_to_boolean_mask(dqbits))
+        >>> mask.data
+        array([201,  57], dtype=uint8)
+        >>> (~mask).to_boolean().astype(int)
+        array([[0, 0, 1, 1, 0, 1, 1, 0],
+               [1, 1, 0, 0, 0, 1, 1, 0]])
+
+    """
+    def __init__(self, data, shape):
+        self.shape = tuple(int(n) for n in shape)
+        self.data = np.asarray(data, dtype=np.uint8).reshape(-1)
+        if self.data.size != (self.size + 7) // 8:
+            raise ValueError("Packed data size does not match mask shape.")
+
+    @classmethod
+    def from_boolean(cls, mask):
+        """
+        Create a `PackedMask` from a boolean array (non-zero elements are
+        `True`).
+
+        """
+        mask = np.asarray(mask)
+        return cls(np.packbits(mask.reshape(-1)), mask.shape)
+
+    def to_boolean(self):
+        """
+        Returns the mask as a `numpy.bool_` array.
+
+        """
+        bits = np.unpackbits(self.data)[:self.size]
+        return bits.view(np.bool_).reshape(self.shape)
+
+    def __array__(self, dtype=None):
+        mask = self.to_boolean()
+        return mask if dtype is None else mask.astype(dtype)
+
+    @property
+    def size(self):
+        """ Number of elements of the mask. """
+        return int(np.prod(self.shape, dtype=np.int64))
+
+    @property
+    def nbytes(self):
+        """ Number of bytes used to store the mask. """
+        return self.data.nbytes
+
+    def count(self):
+        """
+        Returns the number of `True` elements of the mask.
+
+        """
+        return int(_POPCOUNT[self.data].sum(dtype=np.int64))
+
+    def _combine(self, other, op):
+        if not isinstance(other, PackedMask):
+            other = PackedMask.from_boolean(other)
+        if other.shape != self.shape:
+            raise ValueError("Masks must have the same shape.")
+        return PackedMask(op(self.data, other.data), self.shape)
+
+    def __and__(self, other):
+        return self._combine(other, np.bitwise_and)
+
+    def __or__(self, other):
+        return self._combine(other, np.bitwise_or)
+
+    def __xor__(self, other):
+        return self._combine(other, np.bitwise_xor)
+
+    __rand__ = __and__
+    __ror__ = __or__
+    __rxor__ = __xor__
+
+    # make numpy defer to the reflected operators above for
+    # ``ndarray & mask`` instead of broadcasting over the mask object
+    __array_ufunc__ = None
+
+    def __invert__(self):
+        data = np.invert(self.data)
+        # keep the padding bits of the last byte zero:
+        npad = 8 * data.size - self.size
+        if npad:
+            data[-1] &= (0xFF << npad) & 0xFF
+        return PackedMask(data, self.shape)
+
+    def __eq__(self, other):
+        if not isinstance(other, PackedMask):
+            return NotImplemented
+        return (self.shape == other.shape and
+                np.array_equal(self.data, other.data))
+
+    def __ne__(self, other):
+        if not isinstance(other, PackedMask):
+            return NotImplemented
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "{0}(shape={1!r})".format(self.__class__.__name__, self.shape)
+
+    def to_hdu(self, name='MASK'):
+        """
+        Returns a `~astropy.io.fits.ImageHDU` holding the packed bytes of the
+        mask, with the shape of the mask recorded in the header.
+
+        """
+        from astropy.io import fits
+
+        hdu = fits.ImageHDU(self.data, name=name)
+        hdu.header['MASKTYPE'] = ('PACKED', 'boolean mask packed in bits')
+        hdu.header.extend(_mask_shape_cards(self.shape))
+        return hdu
+
+    @classmethod
+    def from_hdu(cls, hdu):
+        """
+        Create a `PackedMask` from an HDU written by `to_hdu`.
+
+        """
+        _check_mask_type(hdu.header, 'PACKED')
+        return cls(hdu.data, _mask_shape(hdu.header))
+
+
+class RLEMask(object):
+    """
+    A boolean mask stored as the runs of `True` elements of the flattened
+    (C order) mask: their start indices and lengths. Masks that flag a few
+    compact regions (saturated stars, bad columns, chip edges) take a tiny
+    fraction of the memory of a `numpy.bool_` array.
+
+    Masks can be combined with the ``&``, ``|``, ``^`` and ``~`` operators.
+
+    Parameters
+    ----------
+    starts, lengths : numpy.ndarray
+        Start index and length of each run of `True` elements, in increasing
+        order of start index; runs must not overlap or touch.
+
+    shape : tuple of int
+        Shape of the (decoded) mask.
+
+    Examples
+    --------
+        >>> from stsci.tools import bitmask
+        >>> import numpy as np
+        >>> mask = bitmask.RLEMask.from_boolean([0, 1, 1, 0, 0, 1, 0, 1])
+        >>> mask.starts, mask.lengths
+        (array([1, 5, 7]), array([2, 1, 1]))
+        >>> (~mask).to_boolean().astype(int)
+        array([1, 0, 0, 1, 1, 0, 1, 0])
+
+    """
+    def __init__(self, starts, lengths, shape):
+        self.shape = tuple(int(n) for n in shape)
+        self.starts = np.asarray(starts, dtype=np.int64).reshape(-1)
+        self.lengths = np.asarray(lengths, dtype=np.int64).reshape(-1)
+        if self.starts.shape != self.lengths.shape:
+            raise ValueError("Run starts and lengths must have the same size.")
+
+    @classmethod
+    def from_boolean(cls, mask):
+        """
+        Create an `RLEMask` from a boolean array (non-zero elements are
+        `True`).
+
+        """
+        mask = np.asarray(mask)
+        flat = np.zeros(mask.size + 2, dtype=np.int8)
+        flat[1:-1] = mask.reshape(-1) != 0
+        edges = np.diff(flat)
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        return cls(starts, ends - starts, mask.shape)
+
+    def to_boolean(self):
+        """
+        Returns the mask as a `numpy.bool_` array.
+
+        """
+        # alternate runs of False and True elements:
+        nruns = self.starts.size
+        counts = np.empty(2 * nruns + 1, dtype=np.int64)
+        ends = self.starts + self.lengths
+        counts[0:-1:2] = self.starts - np.concatenate(([0], ends[:-1]))
+        counts[1::2] = self.lengths
+        counts[-1] = self.size - (ends[-1] if nruns else 0)
+        values = np.zeros(2 * nruns + 1, dtype=np.bool_)
+        values[1::2] = True
+        return np.repeat(values, counts).reshape(self.shape)
+
+    def __array__(self, dtype=None):
+        mask = self.to_boolean()
+        return mask if dtype is None else mask.astype(dtype)
+
+    @property
+    def size(self):
+        """ Number of elements of the mask. """
+        return int(np.prod(self.shape, dtype=np.int64))
+
+    @property
+    def nbytes(self):
+        """ Number of bytes used to store the mask. """
+        return self.starts.nbytes + self.lengths.nbytes
+
+    def count(self):
+        """
+        Returns the number of `True` elements of the mask.
+
+        """
+        return int(self.lengths.sum())
+
+    def _combine(self, other, op):
+        if isinstance(other, (PackedMask, RLEMask)):
+            other_shape = other.shape
+            other = other.to_boolean()
+        else:
+            other = np.asarray(other, dtype=np.bool_)
+            other_shape = other.shape
+        if other_shape != self.shape:
+            raise ValueError("Masks must have the same shape.")
+        return RLEMask.from_boolean(op(self.to_boolean(), other))
+
+    def __and__(self, other):
+        return self._combine(other, np.logical_and)
+
+    def __or__(self, other):
+        return self._combine(other, np.logical_or)
+
+    def __xor__(self, other):
+        return self._combine(other, np.logical_xor)
+
+    __rand__ = __and__
+    __ror__ = __or__
+    __rxor__ = __xor__
+
+    # make numpy defer to the reflected operators above for
+    # ``ndarray & mask`` instead of broadcasting over the mask object
+    __array_ufunc__ = None
+
+    def __invert__(self):
+        # the complement runs fill the gaps between runs:
+        ends = self.starts + self.lengths
+        starts = np.concatenate(([0], ends))
+        stops = np.concatenate((self.starts, [self.size]))
+        keep = stops > starts
+        return RLEMask(starts[keep], (stops - starts)[keep], self.shape)
+
+    def __eq__(self, other):
+        if not isinstance(other, RLEMask):
+            return NotImplemented
+        return (self.shape == other.shape and
+                np.array_equal(self.starts, other.starts) and
+                np.array_equal(self.lengths, other.lengths))
+
+    def __ne__(self, other):
+        if not isinstance(other, RLEMask):
+            return NotImplemented
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "{0}(shape={1!r}, nruns={2:d})".format(
+            self.__class__.__name__, self.shape, self.starts.size
+        )
+
+    def to_hdu(self, name='MASK'):
+        """
+        Returns a `~astropy.io.fits.BinTableHDU` with the ``START`` and
+        ``LENGTH`` of each run, with the shape of the mask recorded in the
+        header.
+
+        """
+        from astropy.io import fits
+
+        hdu = fits.BinTableHDU.from_columns([
+            fits.Column(name='START', format='K', array=self.starts),
+            fits.Column(name='LENGTH', format='K', array=self.lengths)
+        ], name=name)
+        hdu.header['MASKTYPE'] = ('RLE', 'run-length encoded boolean mask')
+        hdu.header.extend(_mask_shape_cards(self.shape))
+        return hdu
+
+    @classmethod
+    def from_hdu(cls, hdu):
+        """
+        Create an `RLEMask` from an HDU written by `to_hdu`.
+
+        """
+        _check_mask_type(hdu.header, 'RLE')
+        return cls(hdu.data['START'], hdu.data['LENGTH'],
+                   _mask_shape(hdu.header))
 
 
 @deprecated(since='3.4.6', message='', name='interpret_bits_value',
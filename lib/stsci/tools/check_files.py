@@ -1,8 +1,11 @@
 from __future__ import division, print_function # confidence high
 
-from stsci.tools import parseinput, fileutil
+from stsci.tools import parseinput, fileutil, irafglob
 from astropy.io import fits
+import multiprocessing
 import os
+import sys
+import time
 
 def checkFiles(filelist,ivmlist = None):
     """
@@ -443,6 +446,241 @@ def geis2mef(sciname, convert_dq=True):
 
     return newsciname
 
+def _convert_one(args):
+    """
+    Converts a single file for `convert_batch`, returning its
+    ``(input, output, status, seconds, error)`` result.
+    """
+    filename, clobber, convert_dq = args
+    start = time.time()
+    output = None
+    try:
+        if not os.path.exists(filename):
+            return (filename, output, 'failed', time.time() - start,
+                    'file not found')
+        imgfits, imgtype = fileutil.isFits(filename)
+        if not imgfits:
+            converter = geis2mef
+            outputs = _geis_outputs(filename, convert_dq)
+        elif imgtype == 'waiver':
+            converter = waiver2mef
+            outputs = _waiver_outputs(filename, convert_dq)
+        else:
+            return (filename, filename, 'skipped', time.time() - start,
+                    'already MEF')
+        output = outputs[0][0]
+
+        if not clobber and all([_up_to_date(out, ins)
+                                for out, ins in outputs]):
+            return (filename, output, 'skipped', time.time() - start, None)
+
+        if converter(filename, convert_dq=convert_dq) is None:
+            return (filename, output, 'failed', time.time() - start,
+                    'could not convert %s to MEF' % filename)
+    except Exception as e:
+        return (filename, output, 'failed', time.time() - start, str(e))
+
+    return (filename, output, 'converted', time.time() - start, None)
+
+def _geis_outputs(filename, convert_dq):
+    """
+    Returns the ``(output, inputs)`` pairs of the MEF files written by
+    `geis2mef` from the GEIS science file `filename` and, if present and
+    converted, its data quality file.
+    """
+    names = [filename]
+    dqname = _dq_input(filename)
+    if convert_dq and os.path.exists(dqname):
+        names.append(dqname)
+    return [(fileutil.buildFITSName(name), [name, name[:-1] + 'd'])
+            for name in names]
+
+def _waiver_outputs(filename, convert_dq):
+    """
+    Returns the ``(output, inputs)`` pairs of the MEF files written by
+    `waiver2mef` from the waivered FITS file `filename` and, if present
+    and converted, its data quality file.
+    """
+    names = [filename]
+    dqname = _dq_input(filename)
+    if convert_dq and os.path.exists(dqname):
+        names.append(dqname)
+    return [(fileutil.buildNewRootname(name, extn='_c0h.fits'), [name])
+            for name in names]
+
+def _up_to_date(output, inputs):
+    """
+    Returns whether `output` exists and is newer than all the `inputs`
+    which exist.
+    """
+    if not os.path.exists(output):
+        return False
+    input_times = [os.path.getmtime(f) for f in inputs if os.path.exists(f)]
+    return os.path.getmtime(output) > max(input_times)
+
+def _expand_input(input):
+    """
+    Expands `input` as `irafglob.irafglob` does, but keeps the names and
+    wild-cards which match no file, so that they can be reported.
+    """
+    if isinstance(input, list):
+        filelist = []
+        for f in input:
+            filelist += _expand_input(f)
+        return filelist
+    input = input.strip()
+    if not input:
+        return []
+    if ',' in input:
+        return _expand_input(input.split(','))
+    if input[0] == '@':
+        with open(input[1:], 'r') as atfile:
+            return _expand_input([line.strip() for line in atfile])
+    return irafglob.irafglob(input) or [input]
+
+def _dq_input(filename):
+    """
+    Returns the data quality file converted along with `filename` by
+    `geis2mef` or `waiver2mef`.
+    """
+    if filename.endswith('.fits'):
+        return fileutil.buildNewRootname(filename, extn='_c1h.fits')
+    return filename.split('.')[0] + '.c1h'
+
+def convert_batch(input, nprocs=1, clobber=False, verbose=True):
+    """
+    Converts GEIS and waivered FITS images to MEF files, along with their
+    data quality files, using a pool of processes.
+
+    Inputs which are already MEF (or simple FITS) files are skipped, as are
+    inputs whose MEF outputs (including that of the data quality file)
+    already exist and are newer than the inputs.  Input names, and
+    wild-cards, which match no file are reported as failed.
+    Repeated inputs are converted once, and data quality files listed
+    alongside their science files are converted on their own rather than
+    along with the science file.
+
+    Parameters
+    ----------
+    input : str or list
+        Input file names in any form accepted by `irafglob.irafglob`:
+        a list, wild-cards, comma-separated names or an @-file.
+
+    nprocs : int
+        Number of processes used for the conversions; with 1 the files
+        are converted serially in this process.
+
+    clobber : bool
+        Convert inputs even when their MEF output is up to date.
+
+    verbose : bool
+        Print the result of each file as it completes and a summary
+        at the end.
+
+    Returns
+    -------
+    results : list
+        One ``(input, output, status, seconds, error)`` tuple per distinct
+        input file, in input order, where ``status`` is one of 'converted',
+        'skipped' or 'failed' and ``error`` describes the reason of a
+        failure, or is 'already MEF' for inputs which need no conversion.
+    """
+    filelist = []
+    seen = set()
+    for f in _expand_input(input):
+        if os.path.abspath(f) not in seen:
+            seen.add(os.path.abspath(f))
+            filelist.append(f)
+    tasks = [(f, clobber, os.path.abspath(_dq_input(f)) not in seen)
+             for f in filelist]
+
+    start = time.time()
+    results = {}
+    if nprocs > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(min(nprocs, len(tasks)))
+        try:
+            done = pool.imap_unordered(_convert_one, tasks)
+            for result in done:
+                results[result[0]] = result
+                if verbose:
+                    _print_result(result)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for task in tasks:
+            result = _convert_one(task)
+            results[result[0]] = result
+            if verbose:
+                _print_result(result)
+
+    results = [results[f] for f in filelist]
+    if verbose:
+        nfailed = len([r for r in results if r[2] == 'failed'])
+        nskipped = len([r for r in results if r[2] == 'skipped'])
+        print("Converted %d, skipped %d and failed %d of %d files in %.2f s" %
+              (len(results) - nfailed - nskipped, nskipped, nfailed,
+               len(results), time.time() - start))
+    return results
+
+def _print_result(result):
+    filename, output, status, seconds, error = result
+    if status == 'failed':
+        print("%s: FAILED (%.2f s): %s" % (filename, seconds, error))
+    elif status == 'skipped' and error:
+        print("%s: skipped, %s" % (filename, error))
+    elif status == 'skipped':
+        print("%s: skipped, %s is up to date" % (filename, output))
+    else:
+        print("%s -> %s (%.2f s)" % (filename, output, seconds))
+
+def main():
+    """
+    convert-batch: convert GEIS and waivered FITS images to MEF files.
+
+    Usage:
+
+        convert-batch [options] input [input ...]
+
+        Each input can be a file name, a list of names separated by commas,
+        a name with wild-cards (in quotes) or an @-file.
+
+    Options:
+
+        -h     print this help
+
+        -c     convert inputs even if their MEF output is up to date
+
+        -p N   number of processes to use (default: number of CPUs)
+    """
+    import getopt
+
+    try:
+        optlist, args = getopt.getopt(sys.argv[1:], 'hcp:')
+    except getopt.error as e:
+        print(str(e))
+        print(main.__doc__)
+        sys.exit(2)
+
+    clobber = False
+    nprocs = multiprocessing.cpu_count()
+    for o, a in optlist:
+        if o == '-h':
+            print(main.__doc__)
+            sys.exit()
+        elif o == '-c':
+            clobber = True
+        elif o == '-p':
+            nprocs = int(a)
+
+    if len(args) == 0:
+        print(main.__doc__)
+        sys.exit(2)
+
+    results = convert_batch(args, nprocs=nprocs, clobber=clobber)
+    if 'failed' in [r[2] for r in results]:
+        sys.exit(1)
+
 def countInput(input):
     files = parseinput.parseinput(input)
     count = len(files[0])
@@ -37,6 +37,11 @@
             (do whatever with hdulist)
             >>> hdulist.writeto(FITSFileName)  # doctest: +SKIP
 
+        or, to write the FITS file one group at a time without reading
+        the whole GEIS file into memory::
+
+            >>> convertgeis.convert_to_file(GEISFileName, FITSFileName)  # doctest: +SKIP
+
         The most basic usage from the command line::
 
             convertgeis.py test1.hhh test1_c0f.fits
@@ -77,6 +82,8 @@ from astropy.io import fits
 import numpy
 import array
 
+from stsci.tools import readgeis
+
 if sys.version_info[0] > 2:
     from functools import reduce
 
@@ -99,16 +106,18 @@ def stsci2(hdulist, filename):
     if instrument in ("WFPC2", "FOC"):
         hdulist[0].header['FILENAME'] = filename
 
-def convert(input):
+def _open_geis(input, check='full'):
 
-    """Input GEIS files "input" will be read and a HDUList object will
-       be returned that matches the waiver-FITS format written out by 'stwfits' in IRAF.
+    """Read the header and group parameters of the GEIS file "input".
 
-       The user can use the writeto method to write the HDUList object to
-       a FITS file.
+       Returns the waivered-FITS primary header, the group parameter table,
+       the shape and data type of the stacked group data, a generator
+       yielding the data of one group at a time and the list to which the
+       generator adds the byte-order problems it finds (see
+       `readgeis.check_byteorder`).  The data file is memory-mapped, so
+       only the group being processed is read into memory.
     """
 
-    global dat
     cardLen = fits.Card.length
 
     # input file(s) must be of the form *.??h and *.??d
@@ -242,97 +251,30 @@ def convert(input):
         _after += str(_naxis0)
     phdr.set('EXTEND', value=True, comment="FITS dataset may contain extensions", after=_after)
 
-    # Use copy-on-write for all data types since byteswap may be needed
-    # in some platforms.
-    f1 = open(data_file, mode='rb')
-    dat = f1.read()
-    errormsg = ""
+    dat = numpy.memmap(data_file, mode='r')
 
-    # Define data array for all groups
-    arr_shape = _naxis[:]
-    arr_shape[0] = gcount
-    arr_stack = numpy.zeros(arr_shape,dtype=_code)
-
-    loc = 0
-    for k in range(gcount):
-        ext_dat = numpy.fromstring(dat[loc:loc+data_size], dtype=_code)
-        ext_dat = ext_dat.reshape(_shape)
-        if _uint16:
-            ext_dat += _bzero
-        # Check to see whether there are any NaN's or infs which might indicate
-        # a byte-swapping problem, such as being written out on little-endian
-        #   and being read in on big-endian or vice-versa.
-        if _code.find('float') >= 0 and \
-            (numpy.any(numpy.isnan(ext_dat)) or numpy.any(numpy.isinf(ext_dat))):
-            errormsg += "===================================\n"
-            errormsg += "= WARNING:                        =\n"
-            errormsg += "=  Input image:                   =\n"
-            errormsg += input+"[%d]\n"%(k+1)
-            errormsg += "=  had floating point data values =\n"
-            errormsg += "=  of NaN and/or Inf.             =\n"
-            errormsg += "===================================\n"
-        elif _code.find('int') >= 0:
-            # Check INT data for max values
-            ext_dat_frac,ext_dat_exp = numpy.frexp(ext_dat)
-            if ext_dat_exp.max() == int(_bitpix) - 1:
-                # Potential problems with byteswapping
-                errormsg += "===================================\n"
-                errormsg += "= WARNING:                        =\n"
-                errormsg += "=  Input image:                   =\n"
-                errormsg += input+"[%d]\n"%(k+1)
-                errormsg += "=  had integer data values        =\n"
-                errormsg += "=  with maximum bitvalues.        =\n"
-                errormsg += "===================================\n"
-
-        arr_stack[k] = ext_dat
-        #ext_hdu = fits.hdu.ImageHDU(data=ext_dat)
-
-        rec = numpy.fromstring(dat[loc+data_size:loc+group_size], dtype=formats)
-
-        loc += group_size
-
-        # Add data from this GPB to table
+    # Decode the group parameters of all groups at once and use them
+    # to fill the columns of the group parameter table
+    gpb = readgeis.read_gpb(dat, formats, data_size, group_size, gcount)
+    for i in range(1, pcount+1):
+        val = gpb[key[i-1]]
+        if i in bools:
+            val = numpy.where(val, 'T', 'F')
+        cols[i-1].array[:] = val
+
+    # Based on the first group, add GPB keywords to PRIMARY header
+    if gcount > 0:
+        # Update Primary HDU with these keywords after PSIZE
+        _cards = readgeis.gpb_cards(gpb[:1], comm, bools=bools,
+                                    floats=floats, float_format='%20.13G')
         for i in range(1, pcount+1):
-            val = rec[0][i-1]
-            if i in bools:
-                if val:
-                    val = 'T'
-                else:
-                    val = 'F'
-            cols[i-1].array[k] = val
-
-        # Based on the first group, add GPB keywords to PRIMARY header
-        if k == 0:
-            # Create separate PyFITS Card objects for each entry in 'rec'
-            # and update Primary HDU with these keywords after PSIZE
-            for i in range(1, pcount+1):
-                #val = rec.field(i-1)[0]
-                val = rec[0][i-1]
-                if val.dtype.kind == 'S':
-                    val = val.decode('ascii')
-
-                if i in bools:
-                    if val:
-                        val = True
-                    else:
-                        val = False
-
-                elif i in floats:
-                    # use fromstring, format in Card is deprecated in pyfits 0.9
-                    _str = '%-8s= %20.13G / %s' % (key[i-1], val, comm[i-1])
-                    _card = fits.Card.fromstring(_str)
-
-                else:
-                    _card = fits.Card(key=key[i-1], value=val, comment=comm[i-1])
+            phdr.insert(phdr_indx+i, _cards[0][i-1])
 
-                phdr.insert(phdr_indx+i, _card)
+        # deal with bscale/bzero
+        if (_bscale != 1 or _bzero != 0):
+            phdr['BSCALE'] = _bscale
+            phdr['BZERO'] = _bzero
 
-            # deal with bscale/bzero
-            if (_bscale != 1 or _bzero != 0):
-                phdr['BSCALE'] = _bscale
-                phdr['BZERO'] = _bzero
-
-        #hdulist.append(ext_hdu)
     # Define new table based on Column definitions
     ext_table = fits.TableHDU.from_columns(cols)
     ext_table.header.set('EXTNAME', value=input+'.tab', after='TFIELDS')
@@ -340,26 +282,127 @@ def convert(input):
     for i in range(len(key)):
         ext_table.header.append(fits.Card(keyword=key[i], value=comm[i]))
 
-    if errormsg != "":
-        errormsg += "===================================\n"
-        errormsg += "=  This file may have been        =\n"
-        errormsg += "=  written out on a platform      =\n"
-        errormsg += "=  with a different byte-order.   =\n"
-        errormsg += "=                                 =\n"
-        errormsg += "=  Please verify that the values  =\n"
-        errormsg += "=  are correct or apply the       =\n"
-        errormsg += "=  '.byteswap()' method.          =\n"
-        errormsg += "===================================\n"
-        print(errormsg)
+    problems = []
+
+    def groups():
+        group_data = readgeis.read_group_data(dat, _code, _shape, data_size,
+                                              group_size, gcount)
+        for k in range(gcount):
+            ext_dat = group_data[k]
+            if _uint16:
+                ext_dat = ext_dat.copy()
+                ext_dat += _bzero
+            # Check to see whether there are any NaN's or infs or integers
+            # with maximum bitvalues which might indicate a byte-swapping
+            # problem, such as being written out on little-endian and being
+            # read in on big-endian or vice-versa.
+            problem = readgeis.check_byteorder(ext_dat, _bitpix, mode=check)
+            if problem is not None:
+                problems.append((k+1, problem))
+
+            yield ext_dat
 
-    f1.close()
+        if problems:
+            print(readgeis.byteorder_message(input, problems))
+
+    return phdr, ext_table, [gcount] + _shape, _code, groups(), problems
+
+
+def convert(input, check='full'):
+
+    """Input GEIS files "input" will be read and a HDUList object will
+       be returned that matches the waiver-FITS format written out by 'stwfits' in IRAF.
+
+       The user can use the writeto method to write the HDUList object to
+       a FITS file, or use `convert_to_file` to write the FITS file
+       without holding all of the data in memory at once.
+
+       The byte-order sanity check of the group data can be set to
+       'full', 'sampled' or 'off' with "check" (see
+       `readgeis.check_byteorder`); the suspect groups are listed in the
+       ``byteorder_problems`` attribute of the returned HDUList.
+    """
+
+    phdr, ext_table, arr_shape, _code, groups, problems = _open_geis(
+        input, check=check)
+
+    # Define data array for all groups
+    arr_stack = numpy.zeros(arr_shape, dtype=_code)
+    for k, ext_dat in enumerate(groups):
+        arr_stack[k] = ext_dat
 
     hdulist = fits.HDUList([fits.PrimaryHDU(header=phdr, data=arr_stack)])
     hdulist.append(ext_table)
+    hdulist.byteorder_problems = problems
 
     stsci2(hdulist,input)
     return hdulist
 
+
+def convert_to_file(input, output, clobber=True, check='full'):
+
+    """Convert the GEIS file "input" to the waivered-FITS file "output".
+
+       The result is the same as writing out the HDUList returned by
+       `convert`, but the primary header is written first and the data
+       of each group is then copied from the memory-mapped GEIS data file
+       straight into the output file, followed by the group parameter
+       table.  Peak memory use is therefore that of a single group.
+
+       Parameters
+       ----------
+       input : str
+           Name of the GEIS header file (``*.??h``).
+
+       output : str
+           Name of the output FITS file.
+
+       clobber : bool
+           Overwrite "output" if it already exists.
+
+       check : str
+           Byte-order sanity check of the group data: 'full', 'sampled'
+           or 'off' (see `readgeis.check_byteorder`).
+
+       Returns
+       -------
+       problems : list
+           ``(group, problem)`` tuples of the groups which failed the
+           byte-order sanity check.
+    """
+
+    if os.path.exists(output):
+        if clobber:
+            os.remove(output)
+        else:
+            raise IOError("Output file %s already exists." % output)
+
+    phdr, ext_table, arr_shape, _code, groups, problems = _open_geis(
+        input, check=check)
+
+    # Let astropy build the primary header from a zero-stride stand-in
+    # for the stacked data, so that it matches what `convert` writes
+    stand_in = numpy.lib.stride_tricks.as_strided(
+        numpy.zeros(1, dtype=_code), shape=arr_shape,
+        strides=[0] * len(arr_shape))
+    hdulist = fits.HDUList([fits.PrimaryHDU(header=phdr, data=stand_in)])
+    hdulist.append(ext_table)
+    hdulist.update_extend()
+    stsci2(hdulist, input)
+
+    shdu = fits.StreamingHDU(output, hdulist[0].header)
+    try:
+        for ext_dat in groups:
+            shdu.write(ext_dat)
+    finally:
+        shdu.close()
+
+    fitsobj = fits.open(output, mode='append')
+    fitsobj.append(ext_table)
+    fitsobj.close()
+
+    return problems
+
 def parse_path(f1, f2):
 
     """Parse two input arguments and return two lists of file names"""
@@ -447,9 +490,7 @@ if __name__ == "__main__":
                     print("Output file %s already exists, skip." % list2[i])
                     break
             try:
-                hdulist = convert(list1[i])
-                hdulist.writeto(list2[i])
-                hdulist.close()
+                convert_to_file(list1[i], list2[i])
                 print("%s -> %s" % (list1[i], list2[i]))
             except Exception as e:
                 print("Conversion fails for %s: %s" % (list1[i], str(e)))
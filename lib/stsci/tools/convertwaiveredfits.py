@@ -7,7 +7,7 @@ Convert a waivered FITS file to various other formats.
 
 Syntax for the command line::
 
-    convertwaiveredfits.py [-hm] [-o <outputFileName>,...] FILE ...
+    convertwaiveredfits.py [-hms] [-o <outputFileName>,...] FILE ...
 
 Convert the waivered FITS files (wFITS) to various formats.
 The default conversion format is multi-extension FITS (MEF).
@@ -21,6 +21,9 @@ Options::
     -m, --multiExtensionConversion   convert to multi-extension
                                      FITS format (Default)
 
+    -s, --stream                     write the output file one
+                                     plane at a time
+
     -o, --outputFileName             comma separated list of
                                      output file specifications
                                      one per input FILE
@@ -75,6 +78,12 @@ verbose: boolean
     provide verbose output.
     Default: `False`
 
+stream: boolean
+    write the output file one plane at a time instead of
+    building the whole converted object in memory; an output
+    file is required.
+    Default: `False`
+
 Returns
 =======
 hduList : fits.HDUList
@@ -121,6 +130,7 @@ from __future__ import division, print_function  # confidence high
 import os
 import sys
 import astropy
+import numpy as np
 from astropy.io import fits
 from distutils.version import LooseVersion
 
@@ -150,7 +160,7 @@ def _usage():
         Exceptions: NONE
     """
 
-    print("usage: convertwaiveredfits.py [-hmv] [-o <outputFileName>, ...] FILE ...")
+    print("usage: convertwaiveredfits.py [-hmsv] [-o <outputFileName>, ...] FILE ...")
 
 
 def _processCommandLineArgs():
@@ -173,16 +183,20 @@ def _processCommandLineArgs():
            verbose          flag indicating if verbose output is desired
                              Default: False
 
+           stream           flag indicating if the output should be streamed
+                             Default: False
+
         Exceptions: NONE
     """
 
     import getopt
 
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "hvmo:",
+        opts, args = getopt.getopt(sys.argv[1:], "hvmso:",
                                    ["help",
                                     "verbose",
                                     "multiExtensionConversion",
+                                    "stream",
                                     "outputFileName"])
     except getopt.GetoptError as e:
         print(str(e))
@@ -192,6 +206,7 @@ def _processCommandLineArgs():
     conversionFormat = ""
     outputFileNames = []
     verbose = False
+    stream = False
 
     for o, a in opts:
         if o in ("-h", "--help"):
@@ -202,6 +217,7 @@ def _processCommandLineArgs():
             print("         -h,  --help                       display this help message and exit")
             print("         -v,  --verbose                    provide verbose output")
             print("         -m,  --multiExtensionConversion   convert to multiExtension FITS format")
+            print("         -s,  --stream                     write the output file one plane at a time")
             print("         -o,  --outputFileName             comma separated list of output file")
             print("                                           specifications (one per input FILE)")
             sys.exit()
@@ -217,6 +233,9 @@ def _processCommandLineArgs():
 
             conversionFormat = "multiExtension"
 
+        if o in ("-s", "--stream"):
+            stream = True
+
         if o in ("-o", "--outputFileName"):
             outputFileNames = a.split(',')
 
@@ -243,7 +262,7 @@ def _processCommandLineArgs():
             for i in range(0,len(files)):
                 outputFileNames.append(None)
 
-    return files,outputFileNames,conversionFormat,verbose
+    return files,outputFileNames,conversionFormat,verbose,stream
 
 def _verify(waiveredHdul):
     """
@@ -272,7 +291,8 @@ def _verify(waiveredHdul):
                 #
                 # The Alternate HDU must be a TableHDU
                 #
-                if waiveredHdul[0].data.shape[0] == \
+                naxis = waiveredHdul[0].header['NAXIS']
+                if waiveredHdul[0].header['NAXIS%d' % naxis] == \
                    waiveredHdul[1].data.shape[0] or \
                    waiveredHdul[1].data.shape[0] == 1:
                     #
@@ -287,10 +307,56 @@ def _verify(waiveredHdul):
     raise ValueError("Input object does not represent a valid waivered" + \
                       " FITS file")
 
+def _formatted_value(string):
+    """
+        Return the number written in the string, as an integer if it has
+        neither a decimal point nor an exponent and as a float otherwise.
+
+        Parameters:
+
+           string           number formatted with a '%G' format
+
+        Returns: int or float
+    """
+
+    try:
+        return int(string)
+    except ValueError:
+        return float(string)
+
+def _dataType(header):
+    """
+        Return the data type astropy.io.fits uses for the data of an image
+        HDU with the given header, without reading the data.
+
+        Parameters:
+
+          header          image HDU header
+
+        Returns: numpy.dtype
+    """
+
+    bitpix = header['BITPIX']
+    bscale = header.get('BSCALE', 1)
+    bzero = header.get('BZERO', 0)
+
+    if bscale == 1:
+        if bitpix == 8 and bzero == -128:
+            return np.dtype('int8')
+        if bitpix in (16, 32, 64) and bzero == 1 << (bitpix - 1):
+            return np.dtype('uint%d' % bitpix)
+    if bitpix > 0 and (bscale != 1 or bzero != 0):
+        if bitpix > 16:
+            return np.dtype('float64')
+        return np.dtype('float32')
+    return np.dtype(fits.BITPIX2DTYPE[bitpix])
+
 def toMultiExtensionFits(waiveredObject,
                          multiExtensionFileName=None,
                          forceFileOutput=False,
-                         verbose=False):
+                         verbose=False,
+                         stream=False,
+                         headerOnly=False):
     """
         Convert the input waivered FITS object to a multi-extension FITS
         HDUList object.  Generate an output multi-extension FITS file if
@@ -315,22 +381,44 @@ def toMultiExtensionFits(waiveredObject,
           verbose         provide verbose output
                           Default: False
 
+          stream          read the input one plane at a time and write each
+                          extension to the output file as soon as it has
+                          been built, so that only a single plane is ever
+                          held in memory; an output file is required
+                          Default: False
+
+          headerOnly      only build the headers of the multi-extension FITS
+                          object, without reading any pixel data; no output
+                          file is generated
+                          Default: False
+
         Returns:
 
-          mhdul           an HDUList object in multi-extension FITS format.
+          mhdul           an HDUList object in multi-extension FITS format;
+                          when streaming, the output file opened for
+                          reading; with headerOnly, a list with the header
+                          of each HDU.
 
         Exceptions:
 
           TypeError       Input object is not a HDUList, a file object or a
                           file name
+
+          ValueError      Streaming was requested without an output file
     """
 
+    if headerOnly:
+        stream = False
+
     if isinstance(waiveredObject, fits.HDUList):
         whdul = waiveredObject
         inputObjectDescription = "HDUList object"
     else:
         try:
-            whdul = fits.open(waiveredObject)
+            # When streaming, sections of the primary array are read
+            # straight from the file: astropy cannot memory-map sections
+            # of scaled (e.g. unsigned) data
+            whdul = fits.open(waiveredObject, memmap=not stream)
             if isinstance(waiveredObject, string_types):
                 inputObjectDescription = "file " + waiveredObject
             else:
@@ -400,51 +488,101 @@ def toMultiExtensionFits(waiveredObject,
     instrument = mPHeader.get('INSTRUME', '')
     nrows = whdul[1].data.shape[0]
 
+    if not multiExtensionFileName and forceFileOutput:
+        base,ext = os.path.splitext(whdul[0]._file.name)
+        multiExtensionFileName = base[:-1]+'h'+ext
+
+    if multiExtensionFileName and instrument in ('WFPC2','FOC'):
+        #
+        # write the FILENAME card to the header for the WFPC2 and FOC
+        # instruments
+        #
+        head,tail = os.path.split(multiExtensionFileName)
+        mhdul[0].header.set('FILENAME', value=tail, after='NEXTEND')
+
+    if stream:
+        if not multiExtensionFileName:
+            raise ValueError("An output file is required to stream the " + \
+                             "multi-extension FITS file")
+        #
+        # Write out the primary header now; each extension is appended
+        # to the output file as soon as it has been built
+        #
+        if os.path.exists(multiExtensionFileName):
+            os.remove(multiExtensionFileName)
+        fits.StreamingHDU(multiExtensionFileName, mhdul[0].header).close()
+    #
+    # Build a template header with a card for each keyword in the column
+    # names of the secondary HDU table from the wavered file, and fetch
+    # the values of each column for all of the rows at once
+    #
+    template = fits.Header()
+    values = []
+    for keyword,format,unit in zip(wcols.names,wcols.formats,wcols.units):
+        kw_descr = ""
+        if keyword in whdul[1].header:
+            kw_descr = whdul[1].header[keyword]
+        template.append((keyword, '', kw_descr))
+
+        column = whdul[1].data.field(keyword)
+        if unit == 'LOGICAL-':
+            #
+            # Handle logical values
+            #
+            values.append([d.strip() == 'T' for d in column])
+        elif format[0] == 'E':
+            #
+            # Handle floating point values
+            #
+            fmt = '%'+format[1:]+'G'
+            values.append([_formatted_value(fmt % float(d)) for d in column])
+        else:
+            values.append(list(column))
+
     for i in range(0,nrows):
         #
         # Create the basic HDU from the data
         #
-        if nrows == 1:
+        if headerOnly:
+            #
+            # Use a zero-stride stand-in for the data, so that the header
+            # matches the one built from the actual data
+            #
+            shape = whdul[0].shape
+            if nrows != 1:
+                shape = shape[1:]
+            data = np.lib.stride_tricks.as_strided(
+                np.zeros(1, dtype=_dataType(whdul[0].header)),
+                shape=shape, strides=[0] * len(shape))
+        elif nrows == 1:
             #
             # Handle case where there is only one row in the table
             #
             data = whdul[0].data
+        elif stream:
+            #
+            # Only read this plane
+            #
+            data = whdul[0].section[i]
         else:
             data = whdul[0].data[i]
 
-        mhdul.append(fits.ImageHDU(data))
         #
         # Add cards to the header for each keyword in the column
         # names of the secondary HDU table from the wavered file
+        # by filling in a copy of the template with the row values
         #
-        for keyword,format,unit in zip(wcols.names,wcols.formats,wcols.units):
-            if unit == 'LOGICAL-':
-                #
-                # Handle logical values
-                #
-                if whdul[1].data.field(keyword)[i].strip() == 'T':
-                    d = True
-                else:
-                    d = False
-            elif format[0] == 'E':
-                #
-                # Handle floating point values
-                #
-                fmt = '%'+format[1:]+'G'
-                d = eval(fmt % float(whdul[1].data.field(keyword)[i]))
-            else:
-                d = whdul[1].data.field(keyword)[i]
+        header = template.copy()
+        for j in range(len(values)):
+            header[j] = values[j][i]
 
-            kw_descr = ""
-            if keyword in whdul[1].header:
-                kw_descr = whdul[1].header[keyword]
-            mhdul[i+1].header[keyword] = (d, kw_descr)
+        ehdu = fits.ImageHDU(data, header=header)
         #
         # If original data is unsigned short then scale the data.
         #
         if originalDataType == 'USHORT':
-            mhdul[i+1].scale('int16','',bscale=1,bzero=32768)
-            mhdul[i+1].header.set('BSCALE', value=1, before='BZERO')
+            ehdu.scale('int16','',bscale=1,bzero=32768)
+            ehdu.header.set('BSCALE', value=1, before='BZERO')
         #
         # For WFPC2 and FOS instruments require additional header cards
         #
@@ -452,52 +590,64 @@ def toMultiExtensionFits(waiveredObject,
             #
             # Add EXTNAME card to header
             #
-            mhdul[i+1].header['EXTNAME'] = (mPHeader.get('FILETYPE',''),
-                                            'extension name')
+            ehdu.header['EXTNAME'] = (mPHeader.get('FILETYPE',''),
+                                      'extension name')
             #
             # Add EXTVER card to the header
             #
-            mhdul[i+1]._extver = i+1
-            mhdul[i+1].header.set('EXTVER', value=i+1,
-                                  comment='extension version number',
-                                  after='EXTNAME')
+            ehdu._extver = i+1
+            ehdu.header.set('EXTVER', value=i+1,
+                            comment='extension version number',
+                            after='EXTNAME')
             #
             # Add the EXPNAME card to the header
             #
-            mhdul[i+1].header.set('EXPNAME',
-                                  mPHeader.get('ROOTNAME', ''),
-                                  '9 character exposure identifier',
-                                  before='EXTVER')
+            ehdu.header.set('EXPNAME',
+                            mPHeader.get('ROOTNAME', ''),
+                            '9 character exposure identifier',
+                            before='EXTVER')
             #
             # Add the INHERIT card to the header.
             #
-            mhdul[i+1].header.set('INHERIT', True,
-                                  'inherit the primary header',
-                                  after='EXTVER')
+            ehdu.header.set('INHERIT', True,
+                            'inherit the primary header',
+                            after='EXTVER')
             #
             # Add the ROOTNAME card to the header
             #
-            mhdul[i+1].header.set('ROOTNAME',
-                                  mPHeader.get('ROOTNAME', ''),
-                                  'rootname of the observationset',
-                                  after='INHERIT')
+            ehdu.header.set('ROOTNAME',
+                            mPHeader.get('ROOTNAME', ''),
+                            'rootname of the observationset',
+                            after='INHERIT')
+
+        if stream:
+            shdu = fits.StreamingHDU(multiExtensionFileName, ehdu.header)
+            shdu.write(ehdu.data)
+            shdu.close()
+        else:
+            mhdul.append(ehdu)
 
-    if not multiExtensionFileName and forceFileOutput:
-        base,ext = os.path.splitext(whdul[0]._file.name)
-        multiExtensionFileName = base[:-1]+'h'+ext
+    if headerOnly:
+        if whdul is not waiveredObject:
+            whdul.close()
+        return [hdu.header for hdu in mhdul]
 
     verboseString = "Input " + inputObjectDescription + \
                     " converted to multi-extension FITS format."
 
-    if multiExtensionFileName:
-        if instrument in ('WFPC2','FOC'):
-            #
-            # write the FILENAME card to the header for the WFPC2 and FOC
-            # instruments
-            #
-            head,tail = os.path.split(multiExtensionFileName)
-            mhdul[0].header.set('FILENAME', value=tail, after='NEXTEND')
+    if stream:
+        if whdul is not waiveredObject:
+            whdul.close()
+        #
+        # Scaled (unsigned short) extensions cannot be memory-mapped
+        #
+        mhdul = fits.open(multiExtensionFileName,
+                          memmap=(originalDataType != 'USHORT'))
+
+        verboseString = verboseString[:-1] + " and written to " + \
+                        multiExtensionFileName + "."
 
+    elif multiExtensionFileName:
         if ASTROPY_VER_GE13:
             mhdul.writeto(multiExtensionFileName, overwrite=True)
         else:
@@ -516,7 +666,8 @@ def convertwaiveredfits(waiveredObject,
                         outputFileName=None,
                         forceFileOutput=False,
                         convertTo='multiExtension',
-                        verbose=False):
+                        verbose=False,
+                        stream=False):
     """
         Convert the input waivered FITS object to various formats.  The
         default conversion format is multi-extension FITS.  Generate an output
@@ -546,6 +697,11 @@ def convertwaiveredfits(waiveredObject,
           verbose         provide verbose output
                           Default: False
 
+          stream          write the output file one plane at a time instead
+                          of building the whole converted object in memory;
+                          an output file is required
+                          Default: False
+
         Returns:
 
           hdul            an HDUList object in the requested format.
@@ -560,7 +716,8 @@ def convertwaiveredfits(waiveredObject,
     else:
         raise ValueError('Conversion type ' + convertTo + ' unknown')
 
-    return func(*(waiveredObject,outputFileName,forceFileOutput,verbose))
+    return func(*(waiveredObject,outputFileName,forceFileOutput,verbose,
+                   stream))
 #
 # *****************************************************************************
 # Main Program callable from the shell
@@ -568,10 +725,11 @@ def convertwaiveredfits(waiveredObject,
 #
 
 def main() :
-    files,outputFiles,conversionFormat,verbose = _processCommandLineArgs()
+    files,outputFiles,conversionFormat,verbose,stream = _processCommandLineArgs()
 
     for f,outputfile in zip(files,outputFiles):
-        convertwaiveredfits(f,outputfile,True,conversionFormat,verbose)
+        convertwaiveredfits(f,outputfile,True,conversionFormat,verbose,
+                            stream)
 
     sys.exit()
 
@@ -25,10 +25,16 @@ General functions included are::
 
     getKeyword(filename, keyword, default=None, handle=None)
 
+    getKeywords(files, keywords, default=None)
+        Returns a table with the values of the keywords for each file.
+
     getHeader(filename,handle=None)
          Return a copy of the PRIMARY header, along with any group/extension
          header, for this filename specification.
 
+    getHeaders(filename)
+        Returns the headers of all extensions, without reading pixel data.
+
     getExtn(fimg,extn=None)
         Returns a copy of the specified extension with data from PyFITS object
         'fimg' for desired file.
@@ -62,6 +68,9 @@ IRAF compatibility functions (abbreviated list)::
     osfn(filename)
         Convert IRAF virtual path name to OS pathname
 
+    expandCacheInfo(), clearExpandCache()
+        Report on and empty the cache of expanded IRAF virtual path names
+
     show(*args, **kw)
         Print value of IRAF or OS environment variables
 
@@ -88,9 +97,11 @@ import os
 import re
 import shutil
 import sys
+import threading
 
 import time as _time
 import numpy as np
+from collections import OrderedDict
 from distutils.version import LooseVersion
 
 PY3K = sys.version_info[0] > 2
@@ -529,46 +540,128 @@ def buildRootname(filename, ext=None):
     return rootname
 
 
-def getKeyword(filename, keyword, default=None, handle=None):
+def getHeaders(filename):
     """
-    General, write-safe method for returning a keyword value from the header of
-    a IRAF recognized image.
+    Return the headers of all the extensions of a FITS, waivered FITS or
+    GEIS image, without reading any pixel data.
 
-    Returns the value as a string.
-    """
+    Waivered FITS and GEIS images are not converted: their headers are built
+    from the FITS header blocks, or from the GEIS header file and group
+    parameter blocks, the same way as those of the multi-extension FITS
+    object that `openImage` converts them to (before its WCS is updated).
 
-    # Insure that there is at least 1 extension specified...
-    if filename.find('[') < 0:
-        filename += '[0]'
+    Parameters
+    ----------
+    filename: str
+        name of input file; any extension specification is ignored
 
-    _fname, _extn = parseFilename(filename)
+    Returns
+    -------
+    headers: list
+        the header of each extension, starting with the primary header
+    """
 
-    if not handle:
-        # Open image whether it is FITS or GEIS
-        _fimg = openImage(_fname)
+    _fname, _extn = parseFilename(osfn(filename))
+
+    if True in [_fname.endswith(l) for l in ['fits', 'fit', 'FITS', 'FIT']]:
+        # Only the header blocks are read until the data is accessed
+        _fimg = fits.open(_fname, mode='readonly')
+        try:
+            headers = [hdu.header for hdu in _fimg]
+        finally:
+            _fimg.close()
+
+        # A waivered FITS file has data in the primary array followed
+        # by an ASCII table (see `isFits`)
+        if (len(headers) > 1 and headers[0].get('NAXIS', 0) > 0 and
+                headers[1].get('XTENSION') == 'TABLE'):
+            headers = convertwaiveredfits.toMultiExtensionFits(
+                _fname, headerOnly=True)
     else:
-        # Use what the user provides, after insuring
-        # that it is a proper PyFITS object.
-        if isinstance(handle, fits.HDUList):
-            _fimg = handle
-        else:
-            raise ValueError('Handle must be %r object!' % fits.HDUList)
+        geis = readgeis.GeisFile(_fname)
+        headers = [geis.header]
+        for extver in range(1, geis.gcount + 1):
+            headers.append(geis.group_header(extver))
+
+    return headers
+
+
+def _getExtnHeader(headers, extn=None):
+    """
+    Returns the header, out of a list of extension headers, corresponding to
+    the extension specified in a filename; see `getExtn`.
+    """
+
+    if extn is None:
+        # Default to the first extension with data, else the PRIMARY header
+        for _hdr in headers:
+            if _hdr.get('NAXIS', 0) > 0:
+                return _hdr
+        return headers[0]
+
+    if isinstance(extn, tuple):
+        # We have a tuple possibly created by parseExtn()
+        extn = ','.join([str(e) for e in extn if e != ''])
+    extn = str(extn)
+
+    _nextn = None
+    if extn.find(',') > 0:
+        # Two values given for extension: for example, 'sci,1' or 'dq,1'
+        _extns = extn.split(',')
+        for i, _hdr in enumerate(headers):
+            if (str(_hdr.get('EXTNAME', '')).strip().lower() ==
+                    _extns[0].strip().lower() and
+                    _hdr.get('EXTVER', 1) == int(_extns[1])):
+                _nextn = i
+                break
+    elif extn.find('/') > 0:
+        # We are working with GEIS group syntax
+        _nextn = int(extn[:extn.find('/')])
+    elif extn.strip().isdigit():
+        _nextn = int(extn)
+    elif extn.strip().lower() == 'primary':
+        _nextn = 0
+    elif extn.strip() != '':
+        # We only have EXTNAME specified...
+        for i, _hdr in enumerate(headers):
+            if str(_hdr.get('EXTNAME', '')).strip().lower() == extn.lower():
+                _nextn = i
+                break
+
+    if _nextn is None or _nextn >= len(headers):
+        raise KeyError('Extension %s not found' % extn)
+
+    return headers[_nextn]
+
+
+def _handleHeaders(handle):
+    """Return the extension headers of a user-provided PyFITS object."""
+
+    # Use what the user provides, after insuring
+    # that it is a proper PyFITS object.
+    if not isinstance(handle, fits.HDUList):
+        raise ValueError('Handle must be %r object!' % fits.HDUList)
+
+    return [hdu.header for hdu in handle]
+
+
+def _keywordValue(headers, extn, keyword, default=None):
+    """
+    Return the value of a keyword from the header of extension ``extn``, or
+    from the first extension which has it; see `getKeyword`.
+    """
 
     # Address the correct header
-    _hdr = getExtn(_fimg, _extn).header
+    _hdr = _getExtnHeader(headers, extn)
 
     try:
-        value =  _hdr[keyword]
+        value = _hdr[keyword]
     except KeyError:
-        _nextn = findKeywordExtn(_fimg, keyword)
-        try:
-            value = _fimg[_nextn].header[keyword]
-        except KeyError:
-            value = ''
-
-    if not handle:
-        _fimg.close()
-        del _fimg
+        value = ''
+        for _hdr in headers:
+            if keyword in _hdr:
+                value = _hdr[keyword]
+                break
 
     if value == '':
         if default is None:
@@ -598,10 +691,80 @@ def getKeyword(filename, keyword, default=None, handle=None):
     return value
 
 
+def getKeyword(filename, keyword, default=None, handle=None):
+    """
+    General, write-safe method for returning a keyword value from the header of
+    a IRAF recognized image.
+
+    Only the headers are read (see `getHeaders`): GEIS and waivered FITS
+    images are not converted to multi-extension FITS.
+
+    Returns the value as a string.
+    """
+
+    # Insure that there is at least 1 extension specified...
+    if filename.find('[') < 0:
+        filename += '[0]'
+
+    _fname, _extn = parseFilename(filename)
+
+    if not handle:
+        # Read the headers whether it is FITS or GEIS
+        _hdrs = getHeaders(_fname)
+    else:
+        _hdrs = _handleHeaders(handle)
+
+    return _keywordValue(_hdrs, _extn, keyword, default=default)
+
+
+def getKeywords(files, keywords, default=None):
+    """
+    Return the values of several keywords for a list of images, reading the
+    headers of each image only once (see `getKeyword`).
+
+    Parameters
+    ----------
+    files: str or list
+        image name(s), each with an optional extension specification
+    keywords: str or list
+        keyword name(s)
+    default: obj
+        value for keywords not found in an image
+
+    Returns
+    -------
+    table: `~astropy.table.Table`
+        one row per image, with a ``filename`` column followed by one column
+        for each keyword
+    """
+    from astropy.table import Table
+
+    if isinstance(files, string_types):
+        files = [files]
+    if isinstance(keywords, string_types):
+        keywords = [keywords]
+
+    values = [[] for keyword in keywords]
+    for filename in files:
+        _name = filename
+        if _name.find('[') < 0:
+            _name += '[0]'
+        _fname, _extn = parseFilename(_name)
+        _hdrs = getHeaders(_fname)
+        for keyword, column in zip(keywords, values):
+            column.append(_keywordValue(_hdrs, _extn, keyword,
+                                        default=default))
+
+    return Table([list(files)] + values, names=['filename'] + list(keywords))
+
+
 def getHeader(filename, handle=None):
     """
     Return a copy of the PRIMARY header, along with any group/extension header
     for this filename specification.
+
+    Only the headers are read (see `getHeaders`): GEIS and waivered FITS
+    images are not converted to multi-extension FITS.
     """
 
     _fname, _extn = parseFilename(filename)
@@ -609,17 +772,12 @@ def getHeader(filename, handle=None):
     # to derive the header from...
     #
     if not handle:
-        # Open image whether it is FITS or GEIS
-        _fimg = openImage(_fname, mode='readonly')
+        # Read the headers whether it is FITS or GEIS
+        _hdrs = getHeaders(_fname)
     else:
-        # Use what the user provides, after insuring
-        # that it is a proper PyFITS object.
-        if isinstance(handle, fits.HDUList):
-            _fimg = handle
-        else:
-            raise ValueError('Handle must be a %r object!' % fits.HDUList)
+        _hdrs = _handleHeaders(handle)
 
-    _hdr = _fimg['PRIMARY'].header.copy()
+    _hdr = _hdrs[0].copy()
 
     # if the data is not in the primary array delete NAXIS
     # so that the correct value is read from the extension header
@@ -628,14 +786,8 @@ def getHeader(filename, handle=None):
 
     if not (_extn is None or (_extn.isdigit() and int(_extn) == 0)):
         # Append correct extension/chip/group header to PRIMARY...
-        #for _card in getExtn(_fimg,_extn).header.ascard:
-            #_hdr.ascard.append(_card)
-        for _card in getExtn(_fimg, _extn).header.cards:
+        for _card in _getExtnHeader(_hdrs, _extn).cards:
             _hdr.append(_card)
-    if not handle:
-        # Close file handle now...
-        _fimg.close()
-        del _fimg
 
     return _hdr
 
@@ -694,7 +846,9 @@ def openImage(filename, mode='readonly', memmap=False, writefits=True,
     mode: str
         mode for opening file based on PyFITS `mode` parameter values
     memmap: bool
-        switch for using memory mapping, `False` for no, `True` for yes
+        switch for using memory mapping, `False` for no, `True` for yes;
+        also used when reading GEIS images (which are always memory-mapped
+        when ``writefits = True``)
     writefits: bool
         if `True`, will write out GEIS as multi-extension FITS
         and return handle to that opened GEIS-derived MEF file
@@ -771,9 +925,12 @@ def openImage(filename, mode='readonly', memmap=False, writefits=True,
         # Input was specified as a GEIS image, but no FITS copy
         # exists.  Read it in with 'readgeis' and make a copy
         # then open the FITS copy...
+        # When writing out the copy, memory-map the GEIS data so that
+        # only one group at a time is held in memory while it is written.
+        gmemmap = memmap or writefits
         try:
             # Open as a GEIS image for reading only
-            fimg = readgeis.readgeis(_fname)
+            fimg = readgeis.readgeis(_fname, memmap=gmemmap)
         except:
             raise IOError("Could not open GEIS input: %s" % _fname)
 
@@ -782,7 +939,7 @@ def openImage(filename, mode='readonly', memmap=False, writefits=True,
         dqexists = os.path.exists(_dqname)
         if dqexists:
             try:
-                dqfile = readgeis.readgeis(_dqname)
+                dqfile = readgeis.readgeis(_dqname, memmap=gmemmap)
                 dqfitsname = buildFITSName(_dqname)
             except:
                 print("Could not read data quality file %s" % _dqname)
@@ -1394,6 +1551,7 @@ def set(*args, **kw):
                 keyword = untranslateName(keyword)
                 svalue = str(value)
                 _varDict[keyword] = svalue
+            _invalidateExpandCache()
         else:
             # set with no arguments lists all variables (using same format
             # as IRAF)
@@ -1444,6 +1602,7 @@ def unset(*args, **kw):
     for arg in args:
         if arg in _varDict:
             del _varDict[arg]
+    _invalidateExpandCache()
 
 
 def time(**kw):
@@ -1473,6 +1632,54 @@ __re_var_match2 = re.compile(r'\$(?P<varname>\w*)')
 # search for string embedded in parentheses
 __re_var_paren = re.compile(r'\((?P<varname>[^()]*)\)')
 
+# LRU cache of expanded strings: maps (instring, noerror) to the expanded
+# string, the names of the variables used to expand it and their values.
+# Entries are dropped by set and unset, and an entry is only used if the
+# variables it depends on still have the same values.
+EXPAND_CACHE_SIZE = 1024
+
+_expandCache = OrderedDict()
+_expandCacheStats = {'hits': 0, 'misses': 0}
+_expandCacheLock = threading.Lock()
+
+# os.path.expanduser looks up the home directory in these variables
+_homeVars = ('HOME', 'USERPROFILE')
+
+
+def expandCacheInfo():
+    """
+    Returns a dictionary with the number of 'hits' and 'misses' of the
+    `Expand` cache, its 'maxsize' and its current size 'currsize'.
+    """
+
+    with _expandCacheLock:
+        return {'hits': _expandCacheStats['hits'],
+                'misses': _expandCacheStats['misses'],
+                'maxsize': EXPAND_CACHE_SIZE,
+                'currsize': len(_expandCache)}
+
+
+def clearExpandCache():
+    """Empties the `Expand` cache and resets its counters."""
+
+    with _expandCacheLock:
+        _expandCache.clear()
+        _expandCacheStats['hits'] = 0
+        _expandCacheStats['misses'] = 0
+
+
+def _invalidateExpandCache():
+    """Drops all the entries of the `Expand` cache."""
+
+    with _expandCacheLock:
+        _expandCache.clear()
+
+
+def _varState(varname):
+    """Returns the values of an IRAF variable and an OS variable."""
+
+    return _varDict.get(varname), os.environ.get(varname)
+
 
 def Expand(instring, noerror=0):
     """
@@ -1485,19 +1692,63 @@ def Expand(instring, noerror=0):
     variable name or null (so Expand('abc$def') = 'abcdef' and
     Expand('(abc)def') = 'def').  This is the IRAF behavior, though it is
     confusing and hides errors.
+
+    Results are kept in an LRU cache of `EXPAND_CACHE_SIZE` entries (see
+    `expandCacheInfo`), unless PyRAF is loaded.
+    """
+
+    if '$' not in instring and '(' not in instring and '~' not in instring:
+        # Nothing to expand
+        return instring
+
+    if 'pyraf' in sys.modules:
+        # IRAF variables can be changed behind our back
+        return _expand(instring, noerror, [])
+
+    key = (instring, noerror)
+    with _expandCacheLock:
+        entry = _expandCache.pop(key, None)
+        if entry is not None:
+            outstring, varnames, states = entry
+            if [_varState(v) for v in varnames] == states:
+                _expandCache[key] = entry
+                _expandCacheStats['hits'] += 1
+                return outstring
+
+    varnames = list(_homeVars)
+    outstring = _expand(instring, noerror, varnames)
+    states = [_varState(v) for v in varnames]
+
+    with _expandCacheLock:
+        _expandCacheStats['misses'] += 1
+        _expandCache[key] = (outstring, varnames, states)
+        while len(_expandCache) > EXPAND_CACHE_SIZE:
+            _expandCache.popitem(last=False)
+
+    return outstring
+
+
+def _expand(instring, noerror, varnames):
+    """
+    Expand a comma-separated list of strings, appending the names of the
+    variables looked up to the list varnames.
     """
 
     # call _expand1 for each entry in comma-separated list
     wordlist = instring.split(",")
     outlist = []
     for word in wordlist:
-        outlist.append(os.path.expanduser(_expand1(word, noerror=noerror)))
+        outlist.append(os.path.expanduser(_expand1(word, noerror=noerror,
+                                                   varnames=varnames)))
     return ",".join(outlist)
 
 
-def _expand1(instring, noerror):
+def _expand1(instring, noerror, varnames=None):
     """Expand a string with embedded IRAF variables (IRAF virtual filename)."""
 
+    if varnames is None:
+        varnames = []
+
     # first expand names in parentheses
     # note this works on nested names too, expanding from the
     # inside out (just like IRAF)
@@ -1505,6 +1756,7 @@ def _expand1(instring, noerror):
     while mm is not None:
         # remove embedded dollar signs from name
         varname = mm.group('varname').replace('$','')
+        varnames.append(varname)
         if defvar(varname):
             varname = envget(varname)
         elif noerror:
@@ -1524,11 +1776,13 @@ def _expand1(instring, noerror):
         mm = __re_var_match2.match(instring)
         varname = mm.group('varname')
 
+    varnames.append(varname)
     if defvar(varname):
         # recursively expand string after substitution
-        return _expand1(envget(varname) + instring[mm.end():], noerror)
+        return _expand1(envget(varname) + instring[mm.end():], noerror,
+                        varnames)
     elif noerror:
-        return _expand1(varname + instring[mm.end():], noerror)
+        return _expand1(varname + instring[mm.end():], noerror, varnames)
     else:
         raise ValueError("Undefined variable `%s' in string `%s'" %
                          (varname, instring))
@@ -5,9 +5,69 @@ License: http://www.stsci.edu/resources/software_hardware/pyraf/LICENSE
 """
 from __future__ import division # confidence high
 
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import six
 from astropy.io import fits
+from six.moves import queue
+
+__version__ = '0.4 (18-October-2026)'
+
+# Maximum number of FITS files kept open in the handle pool
+MAX_OPEN_FILES = 64
+
+# Process-wide pool of open HDUList objects, most recently used last,
+# shared by all IterFitsFile objects which are neither kept in memory nor
+# explicitly opened.  Past MAX_OPEN_FILES, the least recently used files
+# are closed.  The lock also serializes reads, as a handle may be shared
+# between threads.
+_handlePool = OrderedDict()
+_handlePoolLock = threading.RLock()
+
+
+def _trimPool():
+    """ Close the least recently used files of the pool beyond
+        MAX_OPEN_FILES.  Must be called with _handlePoolLock held.
+    """
+    while len(_handlePool) > max(1, MAX_OPEN_FILES):
+        _handlePool.popitem(last=False)[1].close()
+
 
-__version__ = '0.3 (01-July-2014)'
+def _pooledHandle(fname):
+    """ Return an open HDUList for fname from the pool, opening it as
+        needed.  Must be called with _handlePoolLock held.
+    """
+    key = os.path.abspath(fname)
+    handle = _handlePool.pop(key, None)
+    if handle is None:
+        handle = fits.open(fname, mode='readonly')
+    _handlePool[key] = handle
+    _trimPool()
+    return handle
+
+
+def set_max_open_files(maxfiles):
+    """ Sets the maximum number of FITS files kept open by the handle pool
+        used by IterFitsFile, closing the least recently used files beyond
+        that number.
+    """
+    global MAX_OPEN_FILES
+    with _handlePoolLock:
+        MAX_OPEN_FILES = int(maxfiles)
+        _trimPool()
+
+
+def close_handle_pool():
+    """ Closes all the FITS files kept open by the handle pool, e.g. before
+        the files are modified or removed.
+    """
+    with _handlePoolLock:
+        while _handlePool:
+            _handlePool.popitem(last=False)[1].close()
 
 
 class IterFitsFile(object):
@@ -15,6 +75,12 @@ class IterFitsFile(object):
         access the data from a FITS file without leaving
         the file-handle open between reads.
 
+        Unless kept in memory or opened with open(), the file is read
+        through a process-wide pool of at most MAX_OPEN_FILES open files
+        (see set_max_open_files), so that reading many files row by row
+        does not re-open and re-parse each of them for every row.  Use
+        close_handle_pool() to close them.
+
     """
     def __init__(self,name):
         self.name = name
@@ -33,52 +99,72 @@ class IterFitsFile(object):
         self.inmemory = val
 
     def _shape(self):
-        """ Returns the shape of the data array associated with this file."""
-        hdu = self.open()
-        _shape = hdu.shape
-        if not self.inmemory:
-            self.close()
-            del hdu
-        return _shape
+        """ Returns the shape of the data array associated with this file,
+            as given by its header."""
+        with _handlePoolLock:
+            return _headerShape(self._open().header)
 
     def _data(self):
-        """ Returns the data array associated with this file/extenstion."""
-        hdu = self.open()
-        _data = hdu.data.copy()
-        if not self.inmemory:
-            self.close()
-            del hdu
-        return _data
+        """ Returns the data array associated with this file/extenstion.
+
+            Unscaled, uncompressed data is returned as a read-only view of
+            the memory-mapped file, rather than as a copy.
+        """
+        with _handlePoolLock:
+            hdu = self._open()
+            if self.compress:
+                return hdu.data.copy()
+            if _headerShape(hdu.header) == ():
+                return None
+            if _isScaled(hdu.header):
+                # A scaled copy, without keeping it in the pooled HDU
+                return self.read_rows(0, _headerShape(hdu.header)[0])
+            _data = hdu.data.view()
+            _data.flags.writeable = False
+            return _data
 
     def type(self):
-        """ Returns the shape of the data array associated with this file."""
-        hdu = self.open()
-        _type = hdu.data.dtype.name
-        if not self.inmemory:
-            self.close()
-            del hdu
-        return _type
+        """ Returns the type name of the data array associated with this
+            file, as given by its header."""
+        with _handlePoolLock:
+            return _headerDtype(self._open().header).name
 
     def open(self):
-        """ Opens the file for subsequent access. """
+        """ Opens the file for subsequent access.  The file is kept open,
+            outside of the handle pool, until close() is called.
+        """
 
         if self.handle is None:
             self.handle = fits.open(self.fname, mode='readonly')
+        return self._hdu(self.handle)
+
+    def _open(self):
+        """ Returns the HDU to read from: that of the file opened by open()
+            or kept in memory, or else one from the handle pool.  Must be
+            called with _handlePoolLock held.
+        """
+        if self.handle is not None or self.inmemory:
+            return self.open()
+        return self._hdu(_pooledHandle(self.fname))
 
+    def _hdu(self, handle):
+        """ Returns the HDU of this file/extension from an open HDUList. """
         if self.extn:
             if len(self.extn) == 1:
-                hdu = self.handle[self.extn[0]]
+                hdu = handle[self.extn[0]]
             else:
-                hdu = self.handle[self.extn[0],self.extn[1]]
+                hdu = handle[self.extn[0],self.extn[1]]
         else:
-            hdu = self.handle[0]
+            hdu = handle[0]
         if isinstance(hdu,fits.hdu.compressed.CompImageHDU):
             self.compress = True
         return hdu
 
 
     def close(self):
-        """ Closes file handle for this FITS object."""
+        """ Closes the file handle opened by open() for this FITS object.
+            Files read through the handle pool stay open until evicted
+            from it."""
         if self.handle is not None:
             self.handle.close()
         self.handle = None
@@ -86,19 +172,25 @@ class IterFitsFile(object):
     def __getitem__(self,i):
         """ Returns a PyFITS section for the rows specified. """
         # All I/O must be done here, starting with open
-        hdu = self.open()
-        if self.inmemory or self.compress:
-            _data = hdu.data[i,:]
-        else:
-            _data = hdu.section[i,:]
-
-        if not self.inmemory:
-            self.close()
-            del hdu
+        with _handlePoolLock:
+            hdu = self._open()
+            if self.inmemory or self.compress:
+                _data = hdu.data[i,:]
+            else:
+                _data = hdu.section[i,:]
 
         return _data
 
 
+    def read_rows(self, start, stop, out=None):
+        """ Reads rows start to stop (excluded) into the array <out>,
+            which is allocated if not given, and returns it.  Unscaled,
+            uncompressed data is copied straight from the memory-mapped
+            file, without any intermediate array.
+        """
+        with _handlePoolLock:
+            return _readRows(self._open(), start, stop, out, self.inmemory)
+
     def __getattribute__(self,name):
         if name == 'data':
             return self._data()
@@ -108,6 +200,208 @@ class IterFitsFile(object):
             return object.__getattribute__(self,name)
 
 
+def _readRows(hdu, start, stop, out=None, inmemory=False):
+    """ Reads rows start to stop (excluded) of an image HDU into the array
+        <out>, as for IterFitsFile.read_rows.
+    """
+    if inmemory or isinstance(hdu, fits.hdu.compressed.CompImageHDU):
+        rows = hdu.data[start:stop]
+    elif _isScaled(hdu.header):
+        rows = hdu.section[start:stop]
+    else:
+        rows = hdu.data[start:stop]
+    if out is None:
+        return np.array(rows)
+    np.copyto(out, rows, casting='unsafe')
+    return out
+
+
+# Type of the data stored for each BITPIX value
+_BITPIX2DTYPE = {8: 'uint8', 16: 'int16', 32: 'int32', 64: 'int64',
+                 -32: 'float32', -64: 'float64'}
+
+
+def _isScaled(header):
+    """ Returns whether data with this header is scaled on reading. """
+    return (header.get('BSCALE', 1) != 1 or header.get('BZERO', 0) != 0 or
+            (header['BITPIX'] > 0 and 'BLANK' in header))
+
+
+def _headerShape(header):
+    """ Returns the shape of the data described by a header. """
+    naxis = header['NAXIS']
+    return tuple(header['NAXIS'+str(i)] for i in range(naxis, 0, -1))
+
+
+def _headerDtype(header):
+    """ Returns the type of the data, as read by astropy.io.fits, described
+        by a header: integer data with BZERO set for unsigned (or, for
+        bytes, signed) values is read as such, other scaled or blanked
+        integer data as floating point.
+    """
+    bitpix = header['BITPIX']
+    dtype = np.dtype(_BITPIX2DTYPE[bitpix])
+    if bitpix < 0:
+        return dtype
+    bscale = header.get('BSCALE', 1)
+    bzero = header.get('BZERO', 0)
+    if bscale == 1:
+        if bitpix == 8 and bzero == -128:
+            return np.dtype(np.int8)
+        if bitpix > 8 and bzero == 2**(bitpix - 1):
+            return np.dtype('uint' + str(bitpix))
+    if _isScaled(header):
+        return np.dtype(np.float32 if bitpix <= 16 else np.float64)
+    return dtype
+
+
+class StackIterator(object):
+    """ Iterates over blocks of rows of a stack of images of the same shape.
+
+        Each block is an array of shape (nfiles, rows, ncols) holding the
+        same rows of all the files, read into a buffer which is allocated
+        once and re-used for the next block: copy a block if it is needed
+        after moving on to the next.  All blocks have <rows_per_block> rows
+        except, possibly, the last one.
+
+        With readahead=True, the next block is read by a background thread
+        (into a second buffer) while the caller works on the current one.
+
+        Each iteration opens all the files for its own use, rather than
+        through the handle pool, and closes them once it is over.
+
+        Parameters
+        ----------
+        files : list of IterFitsFile or str
+            Images to iterate over; file names, with an optional
+            extension, are turned into IterFitsFile objects.
+
+        rows_per_block : int
+            Number of rows in each block.
+
+        dtype : data-type, optional
+            Type of the blocks; defaults to one which can hold the data
+            of all the files.
+
+        readahead : bool, optional
+            Whether to read the next block in a background thread.
+
+        Examples
+        --------
+        >>> stack = StackIterator(['a.fits', 'b.fits', 'c.fits'], 100,
+        ...                       dtype=np.float32)  # doctest: +SKIP
+        >>> median = np.empty(stack.shape[1:], dtype=np.float32)  # doctest: +SKIP
+        >>> for i, block in enumerate(stack):  # doctest: +SKIP
+        ...     np.median(block, axis=0, out=median[i * 100:(i + 1) * 100])
+    """
+    def __init__(self, files, rows_per_block, dtype=None, readahead=False):
+        self.files = [f if isinstance(f, IterFitsFile) else IterFitsFile(f)
+                      for f in files]
+        if not self.files:
+            raise ValueError("No files to iterate over")
+        self.rows_per_block = int(rows_per_block)
+        if self.rows_per_block < 1:
+            raise ValueError("rows_per_block must be at least 1")
+
+        shape = tuple(self.files[0].shape)
+        for f in self.files[1:]:
+            if tuple(f.shape) != shape:
+                raise ValueError("Shape " + str(tuple(f.shape)) + " of " +
+                                 f.name + " differs from the shape " +
+                                 str(shape) + " of " + self.files[0].name)
+        self.shape = (len(self.files),) + shape
+        if dtype is None:
+            dtype = np.result_type(*[f.type() for f in self.files])
+        self.dtype = np.dtype(dtype)
+        self.readahead = readahead
+
+    def __len__(self):
+        """ Returns the number of blocks. """
+        return -(-self.shape[1] // self.rows_per_block)
+
+    def _blocks(self):
+        """ Yields the (start, stop) rows of each block. """
+        for start in range(0, self.shape[1], self.rows_per_block):
+            yield start, min(start + self.rows_per_block, self.shape[1])
+
+    def _read(self, hdus, buf, start, stop):
+        block = buf[:, :stop - start]
+        for f, hdu, out in zip(self.files, hdus, block):
+            _readRows(hdu, start, stop, out, f.inmemory)
+        return block
+
+    def _new_buffer(self):
+        return np.empty((self.shape[0], self.rows_per_block) + self.shape[2:],
+                        dtype=self.dtype)
+
+    def __iter__(self):
+        # Reading the files in turn would cycle through the handle pool,
+        # re-opening them for every block when they do not all fit in it.
+        handles = []
+        try:
+            hdus = []
+            for f in self.files:
+                if f.inmemory or f.handle is not None:
+                    with _handlePoolLock:
+                        hdus.append(f._open())
+                else:
+                    handles.append(fits.open(f.fname, mode='readonly'))
+                    hdus.append(f._hdu(handles[-1]))
+            blocks = self._iterate(hdus)
+            try:
+                for block in blocks:
+                    yield block
+            finally:
+                blocks.close()
+        finally:
+            for handle in handles:
+                handle.close()
+
+    def _iterate(self, hdus):
+        if not self.readahead:
+            buf = self._new_buffer()
+            for start, stop in self._blocks():
+                yield self._read(hdus, buf, start, stop)
+            return
+
+        # A buffer being read by the thread comes back through <ready>, and
+        # returns through <free> once the caller has moved past it.
+        free = queue.Queue()
+        ready = queue.Queue()
+
+        def reader():
+            try:
+                for start, stop in self._blocks():
+                    buf = free.get()
+                    if buf is None:
+                        return
+                    block = self._read(hdus, buf, start, stop)
+                    ready.put((buf, block, None))
+            except Exception:
+                ready.put((None, None, sys.exc_info()))
+            ready.put(None)
+
+        for i in range(min(2, len(self))):
+            free.put(self._new_buffer())
+        thread = threading.Thread(target=reader, name='StackIterator')
+        thread.daemon = True
+        thread.start()
+        try:
+            while True:
+                item = ready.get()
+                if item is None:
+                    break
+                buf, block, exc_info = item
+                if exc_info is not None:
+                    six.reraise(*exc_info)
+                yield block
+                free.put(buf)
+        finally:
+            # Stop the thread should the caller leave early
+            free.put(None)
+            thread.join()
+
+
 def parseFilename(filename):
     """
         Parse out filename from any specified extensions.
@@ -2,8 +2,31 @@
 #
 from __future__ import division, print_function
 
+import collections
 import math
+import multiprocessing
 import time
+import traceback
+
+import numpy as np
+import six
+
+try:
+    from multiprocessing.connection import wait as _wait
+except ImportError:  # Python 2 has no wait() on process sentinels
+    _wait = None
+
+try:
+    from multiprocessing import resource_tracker, shared_memory
+except ImportError:  # Python < 3.8
+    resource_tracker = shared_memory = None
+
+# Polling interval (seconds) used only when process sentinels are unavailable
+POLL_INTERVAL = 0.01
+
+# Arrays returned by a ResultProcess target which are at least this large
+# (in bytes) are handed back through shared memory instead of the pipe
+SHARED_RESULT_NBYTES = 1024 * 1024
 
 
 class WatchedProcess(object):
@@ -33,6 +56,165 @@ class WatchedProcess(object):
         return "WatchedProcess for: "+str(self.process)+', state='+str(self.state)
 
 
+class RemoteTraceback(Exception):
+    """ Carries the formatted traceback of an exception raised in a child
+    process.  It is attached as the cause of the re-raised exception. """
+
+    def __init__(self, tb):
+        Exception.__init__(self, tb)
+        self.tb = tb
+
+    def __str__(self):
+        return self.tb
+
+
+class ResultProcess(multiprocessing.Process):
+    """ multiprocessing.Process whose target's return value, or the
+    exception it raised, is sent back to the parent process.
+
+    Use it in place of multiprocessing.Process in the list given to
+    launch_and_wait, which then returns the results of the targets and
+    re-raises their exceptions in the parent.  A numpy array result of at
+    least SHARED_RESULT_NBYTES bytes is passed through shared memory
+    (Python 3.8+) rather than being pickled through the pipe.
+    """
+
+    def __init__(self, *args, **kwargs):
+        multiprocessing.Process.__init__(self, *args, **kwargs)
+        self._reader = self._writer = None
+        self._received = False
+        self.result = None
+        self.error = None
+
+    def start(self):
+        # The pipe is only created now, so that no sibling process forked
+        # earlier holds on to its writing end.
+        self._reader, self._writer = multiprocessing.Pipe(duplex=False)
+        multiprocessing.Process.start(self)
+        # Only the child writes; closing our end lets the reader see EOF
+        # should the child die without sending anything.
+        self._writer.close()
+
+    def run(self):
+        interrupt = None
+        try:
+            message = ('result', _share_result(
+                self._target(*self._args, **self._kwargs)))
+        except Exception as e:
+            message = ('error', e, traceback.format_exc())
+        except BaseException as e:
+            # SystemExit, KeyboardInterrupt...: report it, but do not have
+            # the parent re-raise it
+            interrupt = e
+            message = ('error', RuntimeError(self.name + ' raised ' + repr(e)),
+                       traceback.format_exc())
+        try:
+            self._writer.send(message)
+        except Exception as e:
+            # The result or exception could not be pickled
+            if message[0] == 'result':
+                _unlink_result(message[1])
+                tb = traceback.format_exc()
+            else:
+                tb = message[2]
+            self._writer.send(('error', RuntimeError(str(e)), tb))
+        self._writer.close()
+        if interrupt is not None:
+            # Exit as a plain Process would have
+            raise interrupt
+
+    def receive(self):
+        """ Read the message sent by the child, if not yet done.  Only
+        blocks while the child has not finished sending it; once the child
+        has exited, an empty pipe means that it sent nothing. """
+        if self._received:
+            return
+        self._received = True
+        try:
+            if not self._reader.poll():
+                raise EOFError
+            message = self._reader.recv()
+        except EOFError:
+            # Died before sending; its exit code tells the story
+            message = ('result', None)
+        except Exception as e:
+            message = ('error', RuntimeError('Unable to receive the result '
+                       'of ' + self.name + ': ' + str(e)), '')
+        finally:
+            self._reader.close()
+        if message[0] == 'result':
+            self.result = _fetch_result(message[1])
+        else:
+            self.error = (message[1], message[2])
+
+    @property
+    def reader(self):
+        """ Connection on which the child's message arrives. """
+        return self._reader
+
+    def reraise(self):
+        """ Raise the exception of the child, if it raised one, with the
+        child's traceback attached. """
+        if self.error is not None:
+            exc, tb = self.error
+            six.raise_from(exc, RemoteTraceback(tb))
+
+
+_SharedResult = collections.namedtuple('_SharedResult',
+                                       ['name', 'shape', 'dtype'])
+
+
+def _share_result(result):
+    """ Move large array results into shared memory, returning what is to
+    be sent to the parent. """
+    if shared_memory is None or not isinstance(result, np.ndarray) or \
+       result.dtype.hasobject or result.nbytes < SHARED_RESULT_NBYTES:
+        return result
+    shm = shared_memory.SharedMemory(create=True, size=result.nbytes)
+    try:
+        np.ndarray(result.shape, dtype=result.dtype,
+                   buffer=shm.buf)[...] = result
+        return _SharedResult(shm.name, result.shape, result.dtype.str)
+    finally:
+        shm.close()
+
+
+def _fetch_result(result):
+    """ Inverse of _share_result, in the parent: copy an array out of
+    shared memory and release the block. """
+    if not isinstance(result, _SharedResult):
+        return result
+    shm = shared_memory.SharedMemory(name=result.name)
+    try:
+        return np.ndarray(result.shape, dtype=result.dtype,
+                          buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _unlink_result(result):
+    if isinstance(result, _SharedResult):
+        shm = shared_memory.SharedMemory(name=result.name)
+        shm.close()
+        shm.unlink()
+
+
+def _wait_for_any(running, readers):
+    """ Block until at least one of the running processes has finished, or
+    one of the result readers has data, and return the keys (in the
+    <running> or <readers> dict) of all those which have. """
+    if _wait is not None:
+        return _wait(list(running) + list(readers))
+    while True:
+        done = [key for key, p in running.items()
+                if not p.process.is_alive()]
+        done += [key for key in readers if key.poll()]
+        if done:
+            return done
+        time.sleep(POLL_INTERVAL)
+
+
 def launch_and_wait(mp_proc_list, pool_size):
     """ Given a list of multiprocessing.Process objects which have not yet
     been started, this function launches them and blocks until the last
@@ -44,64 +226,69 @@ def launch_and_wait(mp_proc_list, pool_size):
         1 - The caller will get to use the multiprocessing.Process model of
             using shared memory (inheritance) to pass arg data to the child,
         2 - maxtasksperchild is always 1,
-        3 - no function return value is kept/tranferred (not yet implemented)
+        3 - function return values are only kept/transferred for
+            ResultProcess objects (see below)
+
+    Processes are started in list order.  The parent sleeps on the process
+    sentinels and starts the next process as soon as any running one exits,
+    so no time is lost polling between short-lived processes.
+
+    Returns a list with, for each process in <mp_proc_list>, the return
+    value of its target if it is a ResultProcess, and None otherwise.  If
+    the target of a ResultProcess raised, that exception is re-raised here
+    (after all the processes have finished) with the child's traceback
+    attached as a RemoteTraceback cause.
     """
 
     # Sanity check
     if len(mp_proc_list) < 1:
-        return
+        return []
 
     # Create or own list with easy state watching
-    procs = []
-    for p in mp_proc_list:
-        procs.append(WatchedProcess(p))
+    procs = [WatchedProcess(p) for p in mp_proc_list]
+    pending = collections.deque(procs)
+    running = {}
+    readers = {}
+    pool_size = max(1, pool_size)
+
+    if resource_tracker is not None and \
+       any(isinstance(p, ResultProcess) for p in mp_proc_list):
+        # Children must share our tracker, or one of their own would
+        # reclaim shared memory results as soon as they exit.
+        resource_tracker.ensure_running()
 
     # Launch all of them, but only so pool_size are running at any time
-    keep_going = True
-    while (keep_going):
-        # Before we start any more, find out how many are running.  First go
-        # through the list of those started and see if alive.  Update state.
-        for p in procs:
-            if p.state == 1: # been started
-                if not p.process.is_alive():
-                    p.state = 2 # process has finished or been terminated
-                    assert p.process.exitcode is not None, \
-                           "Process is not alive but has no exitcode? "+ \
-                           str(p.process)
-
-        # now figure num_running
-        num_running = len([p for p in procs if p.state == 1])
-
-        # Start some.  Only as many as pool_size should ever be running.
-        num_avail_cpus = pool_size - num_running
-        num_to_start = len([p for p in procs if p.state == 0])
-        if num_to_start < 1:
-            # all have been started, can finally leave loop and go wait
-            break
-        if num_avail_cpus > 0 and num_to_start > 0:
-            num_to_start_now = min(num_avail_cpus, num_to_start)
-            started_now = 0
-            for p in procs:
-                if started_now < num_to_start_now and p.state == 0:
-                    p.start_process()
-                    # debug "launch_and_wait: started: "+str(p.process)
-                    started_now += 1
-        # else: otherwise, all cpus are in use, just wait ...
-
-        # sleep to tame loop activity, but also must sleep a bit after each
-        # start call so that the call to is_alive() woorks correctly
-        time.sleep(1)
-
-    # Out of the launching loop, can now wait on all procs left.
-    for p in procs:
-        p.join_process()
+    while pending or running:
+        while pending and len(running) < pool_size:
+            p = pending.popleft()
+            p.start_process()
+            # key on the sentinel where there is one, so that it can be
+            # handed directly to wait()
+            running[getattr(p.process, 'sentinel', p)] = p
+            if isinstance(p.process, ResultProcess):
+                # Results are read as they arrive, so that a child never
+                # blocks on a full pipe
+                readers[p.process.reader] = p
+
+        for key in _wait_for_any(running, readers):
+            if key in readers:
+                readers.pop(key).process.receive()
+            elif key in running:
+                p = running.pop(key)
+                p.join_process()
+                if isinstance(p.process, ResultProcess):
+                    readers.pop(p.process.reader, None)
+                    p.process.receive()
 
     # Check all exit codes before returning
     for p in procs:
+        if isinstance(p.process, ResultProcess):
+            p.process.reraise()
         if 0 != p.process.exitcode:
             raise RuntimeError("Problem during: "+str(p.process.name)+ \
                   ', exitcode: '+str(p.process.exitcode)+'. Check log.')
-    # all is well, can return
+
+    return [getattr(p.process, 'result', None) for p in procs]
 
 
 def best_tile_layout(pool_size):
@@ -158,3 +345,305 @@ def best_tile_layout(pool_size):
     xnum = int(math.sqrt(pool_size))
     ynum = int((1.*pool_size)/xnum)
     return (xnum, ynum)
+
+
+def tile_layout(shape, pool_size, memory_per_worker=None, tile_overhead=0.,
+                halo=0, itemsize=8, pixel_time=1e-8):
+    """ Determine the layout of tiles which minimizes the predicted time
+    (makespan) to process an image of the given <shape> with <pool_size>
+    processes, taking into account the shape of the image, the halo of
+    each tile, the memory available to each worker and the cost of
+    starting a tile.
+
+    Unlike best_tile_layout, the image need not be square: e.g. 7
+    processes split a 2048x4096 image into 7 strips of rows, where
+    best_tile_layout would leave one of them idle.
+
+    The makespan is predicted as ``ntiles * tile_overhead + rounds *
+    pixel_time * npix``: tiles are started one after the other by the
+    parent (see launch_and_wait), so their overhead adds up, while the
+    pixels are processed in parallel, in ``rounds = ceil(ntiles /
+    pool_size)`` rounds each as long as the largest tile, of npix pixels
+    including its halo.  A large overhead therefore keeps small images
+    from being split over all the processes.  More tiles than pool_size
+    are only used when required by <memory_per_worker>, and then only as
+    many rounds as needed.  Among equally fast layouts, the one with the
+    fewest tiles and then the fewest columns wins, so that strips of whole
+    rows, which are contiguous in memory and on disk, are favoured.
+
+    Parameters
+    ----------
+    shape : tuple of int
+        Shape (ny, nx) of the image.
+
+    pool_size : int
+        Number of processes which can work at the same time.
+
+    memory_per_worker : int, optional
+        Maximum number of bytes a worker may use for its tile.
+
+    tile_overhead : float, optional
+        Measured time, in seconds, the parent spends to start a tile and
+        collect its result.
+
+    halo : int or tuple of int, optional
+        Pixels of overlap on each side of the tiles, as for TiledExecutor.
+
+    itemsize : int, optional
+        Number of bytes a worker needs per pixel of its tile (input,
+        output and any temporaries).
+
+    pixel_time : float, optional
+        Time, in seconds, to process a pixel; only its ratio to
+        <tile_overhead> matters.
+
+    Returns a tuple of ( <num tiles in X dir>, <num in Y direction> ).
+
+    Raises ValueError if even single pixel tiles do not fit in
+    <memory_per_worker>.
+
+    Examples
+    --------
+    >>> tile_layout((2048, 4096), 7)
+    (1, 7)
+    >>> tile_layout((1024, 1024), 4, memory_per_worker=1024**2)
+    (1, 8)
+    """
+    pool_size = max(1, pool_size)
+    ny, nx = shape
+    if np.ndim(halo) == 0:
+        halo = (halo, halo)
+    yhalo, xhalo = halo
+
+    if ny * nx == 0:
+        return (1, 1)
+
+    rounds = 1
+    if memory_per_worker is not None:
+        max_pixels = 1. * memory_per_worker / itemsize
+        if _max_extent(ny, ny, yhalo) * _max_extent(nx, nx, xhalo) > \
+           max_pixels:
+            raise ValueError("No layout of " + str(shape) + " fits in " +
+                             str(memory_per_worker) + " bytes per worker")
+
+        # Halos may push the fewest tiles which hold the image over
+        # budget: find the fewest rounds for which some layout fits, by
+        # doubling them and then bisecting.  Single pixel tiles, in as
+        # many rounds as max_rounds, are known to fit.
+        max_rounds = int(math.ceil(1. * ny * nx / pool_size))
+        min_tiles = int(math.ceil(1. * ny * nx * itemsize /
+                                  memory_per_worker))
+        rounds = int(math.ceil(1. * min_tiles / pool_size))
+        low = rounds - 1
+        while not _layout_fits(shape, halo, pool_size * rounds, max_pixels):
+            low, rounds = rounds, min(2 * rounds, max_rounds)
+        while rounds - low > 1:
+            middle = (low + rounds) // 2
+            if _layout_fits(shape, halo, pool_size * middle, max_pixels):
+                rounds = middle
+            else:
+                low = middle
+    max_tiles = min(pool_size * rounds, ny * nx)
+
+    # Largest extent of a tile, halo included, along each axis
+    heights = [_max_extent(ny, num, yhalo)
+               for num in range(1, min(ny, max_tiles) + 1)]
+    widths = [_max_extent(nx, num, xhalo)
+              for num in range(1, min(nx, max_tiles) + 1)]
+
+    best = None
+    for ynum, height in enumerate(heights, 1):
+        for xnum, width in enumerate(widths[:max_tiles // ynum], 1):
+            npix = height * width
+            if memory_per_worker is not None and \
+               npix * itemsize > memory_per_worker:
+                continue
+            ntiles = xnum * ynum
+            makespan = (ntiles * tile_overhead +
+                        int(math.ceil(1. * ntiles / pool_size)) *
+                        pixel_time * npix)
+            key = (makespan, ntiles, xnum)
+            if best is None or key < best[0]:
+                best = (key, (xnum, ynum))
+    return best[1]
+
+
+def _layout_fits(shape, halo, max_tiles, max_pixels):
+    """ Whether the image can be split into at most <max_tiles> tiles of at
+    most <max_pixels> pixels each, halo included. """
+    ny, nx = shape
+    yhalo, xhalo = halo
+    for ynum in range(1, min(ny, max_tiles) + 1):
+        # The more columns, the narrower the tiles
+        xnum = min(nx, max_tiles // ynum)
+        if _max_extent(ny, ynum, yhalo) * _max_extent(nx, xnum, xhalo) <= \
+           max_pixels:
+            return True
+    return False
+
+
+Tile = collections.namedtuple('Tile', ['region', 'core', 'inner'])
+Tile.__doc__ = """ One tile of an image, as a tuple of (y, x) slice pairs:
+    <region> is the part of the image handed to the function (the tile plus
+    its halo), <core> the part of the output the tile is responsible for,
+    and <inner> where that core lies within <region>. """
+
+
+def _tile_edges(npix, num, halo):
+    """ Return (region, core, inner) slices along one axis for <num>
+    (nearly) equal tiles of an axis <npix> pixels long. """
+    num = max(1, min(num, npix))
+    edges = [i * npix // num for i in range(num + 1)]
+    result = []
+    for start, stop in zip(edges[:-1], edges[1:]):
+        rstart = max(0, start - halo)
+        rstop = min(npix, stop + halo)
+        result.append((slice(rstart, rstop), slice(start, stop),
+                       slice(start - rstart, stop - rstart)))
+    return result
+
+
+def _max_extent(npix, num, halo):
+    """ Length of the longest tile region produced by _tile_edges. """
+    edges = np.arange(num + 1) * npix // num
+    starts = np.maximum(edges[:-1] - halo, 0)
+    stops = np.minimum(edges[1:] + halo, npix)
+    return int((stops - starts).max())
+
+
+def _run_tile(func, in_spec, out_spec, tile, args, kwargs):
+    """ Process one tile, in the child: attach to the shared input and
+    output arrays and write the core of func's result into the output. """
+    blocks = [shared_memory.SharedMemory(name=spec[0])
+              for spec in (in_spec, out_spec)]
+    indata, outdata = [np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+                       for shm, (name, shape, dtype)
+                       in zip(blocks, (in_spec, out_spec))]
+    # Neighbouring tiles share their halos; do not let func alter them
+    indata.flags.writeable = False
+    region = indata[tile.region]
+    result = np.asarray(func(region, *args, **kwargs))
+    if result.shape != region.shape:
+        raise ValueError("Function returned shape " + str(result.shape) +
+                         " for a tile of shape " + str(region.shape))
+    outdata[tile.core] = result[tile.inner]
+
+    # Should anything above raise, the traceback holds views of the blocks
+    # and they are left to be unmapped when the process exits.
+    del indata, outdata, region, result
+    for shm in blocks:
+        shm.close()
+
+
+class TiledExecutor(object):
+    """ Run a function on the tiles of a 2-D image in parallel processes.
+
+    The image is copied once into shared memory, split into the tile grid
+    given by tile_layout for its shape and the pool size, and each tile, together with a
+    halo of <halo> pixels from its neighbours, is handed to <func> in its
+    own process (see launch_and_wait).  <func> must return an array with
+    the same shape as the tile it was given; only the part of the result
+    which is not halo is written into the output, which also lives in
+    shared memory, so that no pixel data is ever pickled.
+
+    Parameters
+    ----------
+    func : callable
+        Called as ``func(tile, *args, **kwargs)`` with a read-only view of
+        the tile.  It must be picklable if the 'spawn' start method is used.
+
+    pool_size : int, optional
+        Number of processes to run at once; defaults to the number of CPUs.
+
+    halo : int or tuple of int, optional
+        Number of pixels of overlap added on each side of the tiles, either
+        the same for both axes or as ``(ny, nx)``.
+
+    dtype : data-type, optional
+        Type of the output image; defaults to the type of the input.
+
+    memory_per_worker : int, optional
+        Bytes each process may use for its tile (see tile_layout).
+
+    tile_overhead : float, optional
+        Measured time, in seconds, to start a tile (see tile_layout).
+
+    Examples
+    --------
+    >>> import numpy as np
+    >>> negate = TiledExecutor(np.negative, pool_size=2)
+    >>> negate(np.arange(6.).reshape(2, 3))
+    array([[-0., -1., -2.],
+           [-3., -4., -5.]])
+    """
+
+    def __init__(self, func, pool_size=None, halo=0, dtype=None,
+                 memory_per_worker=None, tile_overhead=0.):
+        if shared_memory is None:
+            raise ImportError("TiledExecutor requires "
+                              "multiprocessing.shared_memory (Python 3.8+)")
+        self.func = func
+        self.pool_size = pool_size or multiprocessing.cpu_count()
+        if np.ndim(halo) == 0:
+            halo = (halo, halo)
+        self.halo = tuple(int(h) for h in halo)
+        if len(self.halo) != 2 or min(self.halo) < 0:
+            raise ValueError("halo must be a non-negative int or (ny, nx)")
+        self.dtype = dtype
+        self.memory_per_worker = memory_per_worker
+        self.tile_overhead = tile_overhead
+
+    def layout(self, shape, itemsize=8):
+        """ Return the (nx, ny) tile grid used for an image of <shape>,
+        for <itemsize> bytes of input and output per pixel. """
+        return tile_layout(shape, self.pool_size,
+                           memory_per_worker=self.memory_per_worker,
+                           tile_overhead=self.tile_overhead,
+                           halo=self.halo, itemsize=itemsize)
+
+    def tiles(self, shape, itemsize=8):
+        """ Return the list of Tile objects covering an image of <shape>. """
+        if len(shape) != 2:
+            raise ValueError("TiledExecutor only works on 2-D images")
+        xnum, ynum = self.layout(shape, itemsize)
+        rows = _tile_edges(shape[0], ynum, self.halo[0])
+        cols = _tile_edges(shape[1], xnum, self.halo[1])
+        return [Tile(*[(r, c) for r, c in zip(row, col)])
+                for row in rows for col in cols]
+
+    def __call__(self, data, *args, **kwargs):
+        """ Apply the function to <data>, an array or an image HDU (whose
+        data may be memory-mapped), and return the assembled result. """
+        if hasattr(data, 'data') and not isinstance(data, np.ndarray):
+            data = data.data
+        data = np.asanyarray(data)
+        dtype = np.dtype(self.dtype or data.dtype)
+        tiles = self.tiles(data.shape, data.dtype.itemsize + dtype.itemsize)
+        if data.size == 0 or dtype.itemsize == 0:
+            return np.empty(data.shape, dtype=dtype)
+
+        blocks = []
+        try:
+            specs = []
+            for dt in (data.dtype, dtype):
+                shm = shared_memory.SharedMemory(
+                    create=True, size=data.size * dt.itemsize)
+                blocks.append(shm)
+                specs.append((shm.name, data.shape, dt.str))
+            # a single copy, read straight from the file if memory-mapped
+            np.ndarray(data.shape, dtype=data.dtype,
+                       buffer=blocks[0].buf)[...] = data
+
+            procs = [ResultProcess(target=_run_tile,
+                                   args=(self.func, specs[0], specs[1], tile,
+                                         args, kwargs),
+                                   name='TiledExecutor tile ' + str(i))
+                     for i, tile in enumerate(tiles)]
+            launch_and_wait(procs, self.pool_size)
+
+            return np.ndarray(data.shape, dtype=dtype,
+                              buffer=blocks[1].buf).copy()
+        finally:
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
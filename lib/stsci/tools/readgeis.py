@@ -79,22 +79,29 @@ from functools import reduce
 def stsci(hdulist):
     """For STScI GEIS files, need to do extra steps."""
 
-    instrument = hdulist[0].header.get('INSTRUME', '')
+    for i in range(1, len(hdulist)):
+        stsci_extension(hdulist[0].header, hdulist[i], i)
+
+
+def stsci_extension(phdr, hdu, extver):
+    """Do the extra steps of `stsci` for the extension "hdu" of group
+       "extver" only."""
+
+    instrument = phdr.get('INSTRUME', '')
 
     # Update extension header keywords
     if instrument in ("WFPC2", "FOC"):
-        rootname = hdulist[0].header.get('ROOTNAME', '')
-        filetype = hdulist[0].header.get('FILETYPE', '')
-        for i in range(1, len(hdulist)):
-            # Add name and extver attributes to match PyFITS data structure
-            hdulist[i].name = filetype
-            hdulist[i]._extver = i
-            # Add extension keywords for this chip to extension
-            hdulist[i].header['EXPNAME'] = (rootname, "9 character exposure identifier")
-            hdulist[i].header['EXTVER']= (i, "extension version number")
-            hdulist[i].header['EXTNAME'] = (filetype, "extension name")
-            hdulist[i].header['INHERIT'] = (True, "inherit the primary header")
-            hdulist[i].header['ROOTNAME'] = (rootname, "rootname of the observation set")
+        rootname = phdr.get('ROOTNAME', '')
+        filetype = phdr.get('FILETYPE', '')
+        # Add name and extver attributes to match PyFITS data structure
+        hdu.name = filetype
+        hdu._extver = extver
+        # Add extension keywords for this chip to extension
+        hdu.header['EXPNAME'] = (rootname, "9 character exposure identifier")
+        hdu.header['EXTVER']= (extver, "extension version number")
+        hdu.header['EXTNAME'] = (filetype, "extension name")
+        hdu.header['INHERIT'] = (True, "inherit the primary header")
+        hdu.header['ROOTNAME'] = (rootname, "rootname of the observation set")
 
 
 def stsci2(hdulist, filename):
@@ -106,217 +113,595 @@ def stsci2(hdulist, filename):
         hdulist[0].header['FILENAME'] = filename
 
 
-def readgeis(input):
 
-    """Input GEIS files "input" will be read and a HDUList object will
-       be returned.
+def gpb_dtype(formats, data_size, group_size, byteorder=None):
+    """Return a structured dtype describing a whole GEIS group record.
 
-       The user can use the writeto method to write the HDUList object to
-       a FITS file.
+    Only the group parameters are described as fields, at their offsets
+    after the ``data_size`` bytes of pixel data, while the dtype spans the
+    full ``group_size`` bytes of the group.  An array of ``gcount`` records
+    of this type therefore maps the group parameter blocks of every group
+    in the data file at once.
+
+    Parameters
+    ----------
+    formats : list
+        ``(PTYPE, format)`` pairs of the group parameters, in order.
+
+    data_size, group_size : int
+        Size in bytes of the pixel data and of a whole group.
+
+    byteorder : str, None
+        Byte order of the data file; `None` for native.
     """
 
-    global dat
-    cardLen = fits.Card.length
+    names = [f[0] for f in formats]
+    fmts = [f[1] for f in formats]
+    offsets = []
+    offset = data_size
+    for fmt in fmts:
+        offsets.append(offset)
+        offset += numpy.dtype(fmt).itemsize
 
-    # input file(s) must be of the form *.??h and *.??d
-    if input[-1] != 'h' or input[-4] != '.':
-        raise "Illegal input GEIS file name %s" % input
+    dtype = numpy.dtype({'names': names, 'formats': fmts,
+                         'offsets': offsets, 'itemsize': group_size})
+    if byteorder is not None:
+        dtype = dtype.newbyteorder(byteorder)
+    return dtype
 
-    data_file = input[:-1]+'d'
 
-    _os = sys.platform
-    if _os[:5] == 'linux' or _os[:5] == 'win32' or _os[:5] == 'sunos' or _os[:3] == 'osf' or _os[:6] == 'darwin':
-        bytes_per_line = cardLen+1
-    else:
-        raise "Platform %s is not supported (yet)." % _os
+def read_gpb(dat, formats, data_size, group_size, gcount, byteorder=None):
+    """Decode the group parameter blocks of all groups in one step.
+
+    Returns a structured array with one record per group and one field
+    per group parameter (see `gpb_dtype`).  No data is copied: the array
+    is a strided, read-only view into ``dat``, which may be the contents
+    of the data file or a memory-map of it.
+    """
+
+    dtype = gpb_dtype(formats, data_size, group_size, byteorder=byteorder)
+    return numpy.frombuffer(dat, dtype=dtype, count=gcount)
+
+
+def read_group_data(dat, dtype, shape, data_size, group_size, gcount):
+    """Return the pixel data of all groups as a single array.
+
+    The result has shape ``(gcount,) + shape`` and is a strided view into
+    ``dat`` which skips over the group parameter blocks; no data is
+    copied.
+    """
+
+    dtype = numpy.dtype(dtype)
+    shape = tuple(shape)
+    strides = [dtype.itemsize]
+    for n in shape[:0:-1]:
+        strides.insert(0, strides[0] * n)
+    return numpy.ndarray(shape=(gcount,) + shape, dtype=dtype, buffer=dat,
+                         strides=[group_size] + strides)
+
 
-    geis_fmt = {'REAL':'f', 'INTEGER':'i', 'LOGICAL':'i','CHARACTER':'S'}
-    end_card = 'END'+' '* (cardLen-3)
+def gpb_cards(gpb, comments, bools=(), floats=(), float_format='%20.7G'):
+    """Build header cards for the group parameters of every group.
 
-    # open input file
-    im = open(input)
+    Parameters
+    ----------
+    gpb : numpy.ndarray
+        Group parameters as returned by `read_gpb`.
+
+    comments : list
+        Comment for each group parameter.
+
+    bools, floats : list
+        Parameter numbers (1-based, as in ``PTYPEn``) of the LOGICAL and
+        REAL*4 group parameters.  The latter are written using
+        ``float_format``.
+
+    Returns
+    -------
+    cards : list
+        A list (one entry per group) of lists of `astropy.io.fits.Card`.
+    """
+
+    names = gpb.dtype.names
+    # Convert each column to Python values in bulk rather than
+    # extracting numpy scalars one group and parameter at a time
+    columns = []
+    for i, name in enumerate(names):
+        values = gpb[name].tolist()
+        if gpb.dtype[name].kind == 'S':
+            values = [v.decode('ascii') for v in values]
+        if i+1 in bools:
+            values = [bool(v) for v in values]
+        columns.append(values)
 
-    # Generate the primary HDU
     cards = []
-    while 1:
-        line = im.read(bytes_per_line)[:cardLen]
-        line = line[:8].upper() + line[8:]
-        if line == end_card:
-            break
-        cards.append(fits.Card.fromstring(line))
-
-    phdr = fits.Header(cards)
-    im.close()
-
-    _naxis0 = phdr.get('NAXIS', 0)
-    _naxis = [phdr['NAXIS'+str(j)] for j in range(1, _naxis0+1)]
-    _naxis.insert(0, _naxis0)
-    _bitpix = phdr['BITPIX']
-    _psize = phdr['PSIZE']
-    if phdr['DATATYPE'][:4] == 'REAL':
-        _bitpix = -_bitpix
-    if _naxis0 > 0:
-        size = reduce(lambda x,y:x*y, _naxis[1:])
-        data_size = abs(_bitpix) * size // 8
-    else:
-        data_size = 0
-    group_size = data_size + _psize // 8
-
-    # decode the group parameter definitions,
-    # group parameters will become extension header
-    groups = phdr['GROUPS']
-    gcount = phdr['GCOUNT']
-    pcount = phdr['PCOUNT']
-
-    formats = []
-    bools = []
-    floats = []
-    _range = range(1, pcount+1)
-    key = [phdr['PTYPE'+str(j)] for j in _range]
-    comm = [phdr.cards['PTYPE'+str(j)].comment for j in _range]
-
-    # delete group parameter definition header keywords
-    _list = ['PTYPE'+str(j) for j in _range] + \
-            ['PDTYPE'+str(j) for j in _range] + \
-            ['PSIZE'+str(j) for j in _range] + \
-            ['DATATYPE', 'PSIZE', 'GCOUNT', 'PCOUNT', 'BSCALE', 'BZERO']
-
-    # Construct record array formats for the group parameters
-    # as interpreted from the Primary header file
-    for i in range(1, pcount+1):
-        ptype = key[i-1]
-        pdtype = phdr['PDTYPE'+str(i)]
-        star = pdtype.find('*')
-        _type = pdtype[:star]
-        _bytes = pdtype[star+1:]
-
-        # collect boolean keywords since they need special attention later
-
-        if _type == 'LOGICAL':
-            bools.append(i)
-        if pdtype == 'REAL*4':
-            floats.append(i)
-
-        fmt = geis_fmt[_type] + _bytes
-        formats.append((ptype,fmt))
-
-    _shape = _naxis[1:]
-    _shape.reverse()
-    _code = fits.BITPIX2DTYPE[_bitpix]
-    _bscale = phdr.get('BSCALE', 1)
-    _bzero = phdr.get('BZERO', 0)
-    if phdr['DATATYPE'][:10] == 'UNSIGNED*2':
-        _uint16 = 1
-        _bzero = 32768
-    else:
-        _uint16 = 0
-
-    # delete from the end, so it will not conflict with previous delete
-    for i in range(len(phdr)-1, -1, -1):
-        if phdr.cards[i].keyword in _list:
-            del phdr[i]
-
-    # clean up other primary header keywords
-    phdr['SIMPLE'] = True
-    phdr['BITPIX'] = 16
-    phdr['GROUPS'] = False
-    _after = 'NAXIS'
-    if _naxis0 > 0:
-        _after += str(_naxis0)
-    phdr.set('EXTEND', value=True, comment="FITS dataset may contain extensions", after=_after)
-    phdr.set('NEXTEND', value=gcount, comment="Number of standard extensions")
-
-    hdulist = fits.HDUList([fits.PrimaryHDU(header=phdr, data=None)])
-
-    # Use copy-on-write for all data types since byteswap may be needed
-    # in some platforms.
-    f1 = open(data_file, mode='rb')
-    dat = f1.read()
-#    dat = memmap(data_file, mode='c')
-    hdulist.mmobject = dat
+    for k in range(len(gpb)):
+        group_cards = []
+        for i, name in enumerate(names):
+            val = columns[i][k]
+            if i+1 in floats:
+                # use fromstring, format in Card is deprecated in pyfits 0.9
+                _str = ('%-8s= ' + float_format + ' / %s') % \
+                       (name, val, comments[i])
+                group_cards.append(fits.Card.fromstring(_str))
+            else:
+                group_cards.append(fits.Card(keyword=name, value=val,
+                                             comment=comments[i]))
+        cards.append(group_cards)
+
+    return cards
+
+
+# Modes of the byte-order sanity check of the group data
+BYTEORDER_CHECKS = ('full', 'sampled', 'off')
+
+# Number of pixels examined at a time by the byte-order sanity check, and
+# (about) the number of pixels examined in 'sampled' mode
+_CHECK_CHUNK = 65536
+
+# Description of the byte-order problems reported by check_byteorder
+_BYTEORDER_PROBLEMS = {
+    'nonfinite': ["=  had floating point data values =\n",
+                  "=  of NaN and/or Inf.             =\n"],
+    'maxbits': ["=  had integer data values        =\n",
+                "=  with maximum bitvalues.        =\n"],
+}
+
+
+def check_byteorder(data, bitpix, mode='full'):
+    """Look for signs that group data were read with the wrong byte order.
+
+    Floating point data with NaN or Inf values, and integer data with
+    values using the most significant bits (magnitude of at least
+    ``2**(bitpix-2)``) are suspect.
+
+    Unsigned integer data (other than 8-bit) is checked as the signed
+    integers, offset by ``2**(bitpix-1)``, in which it is stored, so the
+    result is the same whether such data is given as unsigned values or as
+    the stored ones (as readgeis does with and without ``memmap``).
+
+    The data are examined in chunks of a fixed number of pixels, stopping
+    at the first suspect chunk, so temporary arrays never exceed the size
+    of a chunk.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Data of one group.
+
+    bitpix : int
+        BITPIX of the data.
+
+    mode : str
+        ``'full'`` examines every pixel, ``'sampled'`` a regularly strided
+        subset of about 65536 pixels and ``'off'`` nothing.
+
+    Returns
+    -------
+    problem : str, None
+        ``'nonfinite'`` or ``'maxbits'`` if the data are suspect, else `None`.
+    """
+
+    if mode not in BYTEORDER_CHECKS:
+        raise ValueError("Byte-order check must be one of %s, not %r" %
+                         (BYTEORDER_CHECKS, mode))
+    if mode == 'off' or data.dtype.kind not in 'fiu':
+        return None
+
+    flat = data.reshape(-1)
+    if mode == 'sampled':
+        flat = flat[::max(1, flat.size // _CHECK_CHUNK)]
+
+    offset = 0
+    if data.dtype.kind == 'u' and int(bitpix) > 8:
+        offset = 2**(int(bitpix) - 1)
+
+    for i in range(0, flat.size, _CHECK_CHUNK):
+        chunk = flat[i:i+_CHECK_CHUNK]
+        if offset:
+            chunk = chunk.astype(numpy.int64) - offset
+        if data.dtype.kind == 'f':
+            if not numpy.isfinite(chunk).all():
+                return 'nonfinite'
+        elif (numpy.frexp(chunk)[1] == int(bitpix) - 1).any():
+            return 'maxbits'
+    return None
+
+
+def byteorder_message(input, problems):
+    """Format the byte-order problems found in "input" as a warning.
+
+    ``problems`` is a list of ``(group, problem)`` tuples, with the group
+    numbered from 1 and the problem as returned by `check_byteorder`.
+    Returns an empty string if there are no problems.
+    """
+
+    if not problems:
+        return ""
 
     errormsg = ""
+    for group, problem in problems:
+        errormsg += "===================================\n"
+        errormsg += "= WARNING:                        =\n"
+        errormsg += "=  Input image:                   =\n"
+        errormsg += input+"[%d]\n"%group
+        errormsg += "".join(_BYTEORDER_PROBLEMS[problem])
+        errormsg += "===================================\n"
+    errormsg += "===================================\n"
+    errormsg += "=  This file may have been        =\n"
+    errormsg += "=  written out on a platform      =\n"
+    errormsg += "=  with a different byte-order.   =\n"
+    errormsg += "=                                 =\n"
+    errormsg += "=  Please verify that the values  =\n"
+    errormsg += "=  are correct or apply the       =\n"
+    errormsg += "=  '.byteswap()' method.          =\n"
+    errormsg += "===================================\n"
+    return errormsg
+
+
+class GeisFile(object):
+
+    """Lazy, read-only access to the groups of a GEIS file.
+
+       Only the header file "input" is read when the object is created.
+       The object is indexed like the HDUList returned by `readgeis`:
+       index 0 is the primary HDU and indices 1 to ``gcount`` are the
+       image HDUs of the groups.  The data and group parameters of a group
+       are only read from the data file, at the offset of that group, the
+       first time it is accessed, e.g.::
+
+           >>> geis = readgeis.GeisFile(GEISFileName)  # doctest: +SKIP
+           >>> geis[0].header['INSTRUME']  # doctest: +SKIP
+           >>> data = geis[3].data  # doctest: +SKIP
+
+       Parameters
+       ----------
+       input : str
+           Full filename with path of input GEIS image header file (``*.??h``).
+
+       memmap : bool
+           Memory-map the data file instead of reading the bytes of each
+           group; see `readgeis`. [Default: False]
+
+       byteorder : str, None
+           Byte order of the data file; see `readgeis`. [Default: None]
+    """
 
-    loc = 0
-    for k in range(gcount):
-        ext_dat = numpy.fromstring(dat[loc:loc+data_size], dtype=_code)
-        ext_dat = ext_dat.reshape(_shape)
-        if _uint16:
-            ext_dat += _bzero
-        # Check to see whether there are any NaN's or infs which might indicate
-        # a byte-swapping problem, such as being written out on little-endian
-        #   and being read in on big-endian or vice-versa.
-        if _code.find('float') >= 0 and \
-            (numpy.any(numpy.isnan(ext_dat)) or numpy.any(numpy.isinf(ext_dat))):
-            errormsg += "===================================\n"
-            errormsg += "= WARNING:                        =\n"
-            errormsg += "=  Input image:                   =\n"
-            errormsg += input+"[%d]\n"%(k+1)
-            errormsg += "=  had floating point data values =\n"
-            errormsg += "=  of NaN and/or Inf.             =\n"
-            errormsg += "===================================\n"
-        elif _code.find('int') >= 0:
-            # Check INT data for max values
-            ext_dat_frac,ext_dat_exp = numpy.frexp(ext_dat)
-            if ext_dat_exp.max() == int(_bitpix) - 1:
-                # Potential problems with byteswapping
-                errormsg += "===================================\n"
-                errormsg += "= WARNING:                        =\n"
-                errormsg += "=  Input image:                   =\n"
-                errormsg += input+"[%d]\n"%(k+1)
-                errormsg += "=  had integer data values        =\n"
-                errormsg += "=  with maximum bitvalues.        =\n"
-                errormsg += "===================================\n"
+    def __init__(self, input, memmap=False, byteorder=None):
 
-        ext_hdu = fits.ImageHDU(data=ext_dat)
+        cardLen = fits.Card.length
+
+        # input file(s) must be of the form *.??h and *.??d
+        if input[-1] != 'h' or input[-4] != '.':
+            raise ValueError("Illegal input GEIS file name %s" % input)
+
+        data_file = input[:-1]+'d'
 
-        rec = numpy.fromstring(dat[loc+data_size:loc+group_size], dtype=formats)
+        _os = sys.platform
+        if _os[:5] == 'linux' or _os[:5] == 'win32' or _os[:5] == 'sunos' or _os[:3] == 'osf' or _os[:6] == 'darwin':
+            bytes_per_line = cardLen+1
+        else:
+            raise IOError("Platform %s is not supported (yet)." % _os)
 
-        loc += group_size
+        geis_fmt = {'REAL':'f', 'INTEGER':'i', 'LOGICAL':'i','CHARACTER':'S'}
+        end_card = 'END'+' '* (cardLen-3)
 
-        # Create separate PyFITS Card objects for each entry in 'rec'
+        # open input file
+        im = open(input)
+
+        # Generate the primary HDU
+        cards = []
+        while 1:
+            line = im.read(bytes_per_line)[:cardLen]
+            line = line[:8].upper() + line[8:]
+            if line == end_card:
+                break
+            cards.append(fits.Card.fromstring(line))
+
+        phdr = fits.Header(cards)
+        im.close()
+
+        _naxis0 = phdr.get('NAXIS', 0)
+        _naxis = [phdr['NAXIS'+str(j)] for j in range(1, _naxis0+1)]
+        _naxis.insert(0, _naxis0)
+        _bitpix = phdr['BITPIX']
+        _psize = phdr['PSIZE']
+        if phdr['DATATYPE'][:4] == 'REAL':
+            _bitpix = -_bitpix
+        if _naxis0 > 0:
+            size = reduce(lambda x,y:x*y, _naxis[1:])
+            data_size = abs(_bitpix) * size // 8
+        else:
+            data_size = 0
+        group_size = data_size + _psize // 8
+
+        # decode the group parameter definitions,
+        # group parameters will become extension header
+        groups = phdr['GROUPS']
+        gcount = phdr['GCOUNT']
+        pcount = phdr['PCOUNT']
+
+        formats = []
+        bools = []
+        floats = []
+        _range = range(1, pcount+1)
+        key = [phdr['PTYPE'+str(j)] for j in _range]
+        comm = [phdr.cards['PTYPE'+str(j)].comment for j in _range]
+
+        # delete group parameter definition header keywords
+        _list = ['PTYPE'+str(j) for j in _range] + \
+                ['PDTYPE'+str(j) for j in _range] + \
+                ['PSIZE'+str(j) for j in _range] + \
+                ['DATATYPE', 'PSIZE', 'GCOUNT', 'PCOUNT', 'BSCALE', 'BZERO']
+
+        # Construct record array formats for the group parameters
+        # as interpreted from the Primary header file
         for i in range(1, pcount+1):
-            #val = rec.field(i-1)[0]
-            val = rec[0][i-1]
-            if val.dtype.kind == 'S':
-                val = val.decode('ascii')
-
-            if i in bools:
-                if val:
-                    val = True
-                else:
-                    val = False
-
-            if i in floats:
-                # use fromstring, format in Card is deprecated in pyfits 0.9
-                _str = '%-8s= %20.7G / %s' % (key[i-1], val, comm[i-1])
-                _card = fits.Card.fromstring(_str)
-            else:
-                _card = fits.Card(keyword=key[i-1], value=val, comment=comm[i-1])
+            ptype = key[i-1]
+            pdtype = phdr['PDTYPE'+str(i)]
+            star = pdtype.find('*')
+            _type = pdtype[:star]
+            _bytes = pdtype[star+1:]
+
+            # collect boolean keywords since they need special attention later
+
+            if _type == 'LOGICAL':
+                bools.append(i)
+            if pdtype == 'REAL*4':
+                floats.append(i)
+
+            fmt = geis_fmt[_type] + _bytes
+            formats.append((ptype,fmt))
+
+        _shape = _naxis[1:]
+        _shape.reverse()
+        _code = fits.BITPIX2DTYPE[_bitpix]
+        _bscale = phdr.get('BSCALE', 1)
+        _bzero = phdr.get('BZERO', 0)
+        if phdr['DATATYPE'][:10] == 'UNSIGNED*2':
+            _uint16 = 1
+            _bzero = 32768
+        else:
+            _uint16 = 0
+
+        # Data types used to interpret the data file, taking into account
+        # the byte order it was written with
+        if byteorder is None:
+            byteorder = '='
+        if memmap and _uint16:
+            _dtype = numpy.dtype('uint16').newbyteorder(byteorder)
+        else:
+            _dtype = numpy.dtype(_code).newbyteorder(byteorder)
+
+        # delete from the end, so it will not conflict with previous delete
+        for i in range(len(phdr)-1, -1, -1):
+            if phdr.cards[i].keyword in _list:
+                del phdr[i]
+
+        # clean up other primary header keywords
+        phdr['SIMPLE'] = True
+        phdr['BITPIX'] = 16
+        phdr['GROUPS'] = False
+        _after = 'NAXIS'
+        if _naxis0 > 0:
+            _after += str(_naxis0)
+        phdr.set('EXTEND', value=True, comment="FITS dataset may contain extensions", after=_after)
+        phdr.set('NEXTEND', value=gcount, comment="Number of standard extensions")
+
+        # An HDUList adds EXTEND back to the primary header once there are
+        # extensions; do it here so that the header of the primary HDU is
+        # the same whether or not it is part of an HDUList
+        primary = fits.PrimaryHDU(header=phdr, data=None)
+        if gcount > 0:
+            primary.header.set('EXTEND', True, after='NAXIS')
+
+        self.filename = input
+        self.header = primary.header
+        self.gcount = gcount
+        self.memmap = memmap
+        self.mmobject = None
+        self._data_file = data_file
+        self._data_size = data_size
+        self._group_size = group_size
+        self._formats = formats
+        self._bools = bools
+        self._floats = floats
+        self._comments = comm
+        self._shape = _shape
+        self._dtype = _dtype
+        self._bitpix = _bitpix
+        self._byteorder = byteorder
+        self._uint16 = _uint16
+        self._bscale = _bscale
+        self._bzero = _bzero
+        self._hdus = {0: primary}
+
+    def __len__(self):
+        return self.gcount + 1
+
+    def __getitem__(self, key):
+        if key < 0:
+            key += len(self)
+        if key < 0 or key >= len(self):
+            raise IndexError("GEIS group index out of range.")
+
+        if key not in self._hdus:
+            dat = self._read_group(key - 1)
+            gpb = read_gpb(dat, self._formats, self._data_size,
+                           self._group_size, 1, byteorder=self._byteorder)
+            cards = gpb_cards(gpb, self._comments, bools=self._bools,
+                              floats=self._floats)
+            self._hdus[key] = self._group_hdu(self._group_data(dat, 0),
+                                              cards[0], key)
+        return self._hdus[key]
+
+    def group_header(self, extver):
+        """Return the header of group "extver" (1-based).
+
+           Only the group parameter block of the group is read from the
+           data file; the header is the same as that of ``self[extver]``.
+        """
+        if extver < 1 or extver > self.gcount:
+            raise IndexError("GEIS group index out of range.")
+        if extver in self._hdus:
+            return self._hdus[extver].header
+
+        psize = self._group_size - self._data_size
+        f1 = open(self._data_file, mode='rb')
+        try:
+            f1.seek((extver - 1) * self._group_size + self._data_size)
+            dat = bytearray(f1.read(psize))
+        finally:
+            f1.close()
+        gpb = read_gpb(dat, self._formats, 0, psize, 1,
+                       byteorder=self._byteorder)
+        cards = gpb_cards(gpb, self._comments, bools=self._bools,
+                          floats=self._floats)
+
+        # Build the header from a zero-stride stand-in for the data
+        stand_in = numpy.lib.stride_tricks.as_strided(
+            numpy.zeros(1, dtype=self._dtype), shape=self._shape,
+            strides=[0] * len(self._shape))
+        return self._group_hdu(stand_in, cards[0], extver).header
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def close(self):
+        """Release the HDUs read so far and the memory-map, if any."""
+        self._hdus = {0: self._hdus[0]}
+        self.mmobject = None
+
+    def _read_group(self, k):
+        """Return a buffer with the bytes of group ``k`` (0-based)."""
+        loc = k * self._group_size
+        if self.memmap:
+            if self.mmobject is None:
+                self.mmobject = numpy.memmap(self._data_file, mode='r')
+            return self.mmobject[loc:loc+self._group_size]
+
+        f1 = open(self._data_file, mode='rb')
+        try:
+            f1.seek(loc)
+            return bytearray(f1.read(self._group_size))
+        finally:
+            f1.close()
+
+    def _group_data(self, dat, loc):
+        """Return the data of the group whose bytes start at offset
+           "loc" of the buffer "dat"."""
+
+        ext_dat = numpy.ndarray(shape=self._shape, dtype=self._dtype,
+                                buffer=dat, offset=loc)
+        if self._uint16 and not self.memmap:
+            ext_dat += self._bzero
+        return ext_dat
+
+    def _group_hdu(self, ext_dat, cards, extver):
+        """Build the image HDU of group "extver" (1-based) from its data
+           and group parameter cards."""
 
+        ext_hdu = fits.ImageHDU(data=ext_dat)
+
+        for _card in cards:
             ext_hdu.header.append(_card)
 
         # deal with bscale/bzero
-        if (_bscale != 1 or _bzero != 0):
-            ext_hdu.header['BSCALE'] = _bscale
-            ext_hdu.header['BZERO'] = _bzero
+        if (self._bscale != 1 or self._bzero != 0):
+            # astropy already added these for unsigned data, but they are
+            # expected after the group parameters
+            for _key in ['BSCALE', 'BZERO']:
+                if _key in ext_hdu.header:
+                    del ext_hdu.header[_key]
+            ext_hdu.header['BSCALE'] = self._bscale
+            ext_hdu.header['BZERO'] = self._bzero
+
+        stsci_extension(self.header, ext_hdu, extver)
+        return ext_hdu
+
+
+def readgeis(input, memmap=False, byteorder=None, check='full'):
+
+    """Input GEIS files "input" will be read and a HDUList object will
+       be returned.
+
+       The user can use the writeto method to write the HDUList object to
+       a FITS file.
+
+       Parameters
+       ----------
+       input : str
+           Full filename with path of input GEIS image header file (``*.??h``).
+
+       memmap : bool
+           If `True`, the data file (``*.??d``) is memory-mapped read-only
+           and the data of each extension is a view into the mapping at
+           the group offset instead of a copy.  Pages are only read from
+           disk when the data is accessed, so memory use is bounded by
+           the page cache rather than by the size of the file.  Unsigned
+           16-bit data is returned as ``uint16`` and scaled by
+           `astropy.io.fits` on output instead of being shifted in place.
+           [Default: False]
+
+       byteorder : str, None
+           Byte order of the data file: one of ``'<'``, ``'>'`` or ``'='``.
+           `None` (the default) assumes the native byte order of this
+           platform.  Data written out on a platform with a different
+           byte-order can be read by specifying its byte order; with
+           ``memmap=True`` the conversion is done by numpy on access,
+           without copying the data.
+
+       check : str
+           Byte-order sanity check of the group data: ``'full'``,
+           ``'sampled'`` or ``'off'`` (see `check_byteorder`).  Suspect
+           groups are reported in a printed warning and listed in the
+           ``byteorder_problems`` attribute of the returned HDUList, as
+           ``(group, problem)`` tuples.  [Default: 'full']
+    """
+
+    geis = GeisFile(input, memmap=memmap, byteorder=byteorder)
+    hdulist = fits.HDUList([geis[0]])
+
+    if memmap:
+        # Map the data file read-only: each group's data is a view into
+        # the mapping, so nothing is read until the data is accessed.
+        dat = numpy.memmap(geis._data_file, mode='r')
+    else:
+        # Read the data file once; each group's data is a view into it
+        f1 = open(geis._data_file, mode='rb')
+        dat = bytearray(f1.read())
+        f1.close()
+    hdulist.mmobject = dat
+
+    # Decode the group parameters of all groups at once
+    gpb = read_gpb(dat, geis._formats, geis._data_size, geis._group_size,
+                   geis.gcount, byteorder=geis._byteorder)
+    gpb_hdrs = gpb_cards(gpb, geis._comments, bools=geis._bools,
+                         floats=geis._floats)
+
+    problems = []
+
+    for k in range(geis.gcount):
+        ext_dat = geis._group_data(dat, k * geis._group_size)
+        ext_hdu = geis._group_hdu(ext_dat, gpb_hdrs[k], k+1)
+
+        # Check to see whether there are any NaN's or infs or integers with
+        # maximum bitvalues which might indicate a byte-swapping problem,
+        # such as being written out on little-endian and being read in on
+        # big-endian or vice-versa.
+        problem = check_byteorder(ext_hdu.data, geis._bitpix, mode=check)
+        if problem is not None:
+            problems.append((k+1, problem))
 
         hdulist.append(ext_hdu)
 
-    if errormsg != "":
-        errormsg += "===================================\n"
-        errormsg += "=  This file may have been        =\n"
-        errormsg += "=  written out on a platform      =\n"
-        errormsg += "=  with a different byte-order.   =\n"
-        errormsg += "=                                 =\n"
-        errormsg += "=  Please verify that the values  =\n"
-        errormsg += "=  are correct or apply the       =\n"
-        errormsg += "=  '.byteswap()' method.          =\n"
-        errormsg += "===================================\n"
-        print(errormsg)
+    if problems:
+        print(byteorder_message(input, problems))
+    hdulist.byteorder_problems = problems
 
-    f1.close()
-    stsci(hdulist)
     return hdulist
 
 def parse_path(f1, f2):
@@ -27,6 +27,10 @@
 
         -n     do NOT clobber pre-existing output files
 
+        -i     byteswap the data files in place instead of writing new files
+
+        -t N   use N threads when byteswapping in place
+
         :Example:
 
         If used in Pythons script, a user can, e. g.::
@@ -34,6 +38,10 @@
             >>> from stsci.tools import swapgeis
             >>> swapgeis.byteswap(GEISFileName)  # doctest: +SKIP
 
+        or, to fix the byte order of the data file without making a copy::
+
+            >>> swapgeis.byteswap(GEISFileName, inplace=True)  # doctest: +SKIP
+
         The most basic usage from the command line::
 
             swapgeis.py test1.hhh test1_swap.hhh
@@ -71,9 +79,12 @@ from __future__ import division, print_function # confidence high
 __version__ = "1.0 (25 Feb, 2011), \xa9 AURA"
 
 import os, sys, string, shutil
+from multiprocessing.pool import ThreadPool
 from astropy.io import fits
 import numpy
 from functools import reduce
+
+from stsci.tools import readgeis
 dat = None
 
 dat = None
@@ -89,7 +100,56 @@ cols_pfmt = {'REAL':'E', 'DOUBLE': 'D', 'INTEGER': 'J', 'LOGICAL':'A', 'CHARACTE
 # keywords which are output as long-floats without using exponential formatting
 kw_DOUBLE = ['CRVAL1','CRVAL2','FPKTTIME','LPKTTIME']
 
-def byteswap(input,output=None,clobber=True):
+# Default number of bytes of pixel data byteswapped at a time in place
+CHUNKSIZE = 4 * 1024 * 1024
+
+
+def _byteswap_inplace(data_file, dtype, npix, formats, data_size, group_size,
+                      gcount, chunksize=CHUNKSIZE, nthreads=1):
+    """Byteswap the pixels and group parameters of a GEIS data file in place.
+
+    The file is memory-mapped for writing and its pixel data are swapped
+    in chunks of about ``chunksize`` bytes (blocks of whole groups, or
+    pieces of a single group when a group is larger than a chunk), so
+    that no copy of the data is made.  With ``nthreads > 1`` the chunks
+    are distributed over a pool of threads.
+    """
+
+    dat = numpy.memmap(data_file, mode='r+')
+    pixels = readgeis.read_group_data(dat, dtype, (npix,), data_size,
+                                      group_size, gcount)
+
+    nitems = max(1, chunksize // pixels.itemsize)
+    ncols = max(1, min(npix, nitems))
+    nrows = max(1, nitems // max(npix, 1))
+    chunks = [(slice(k, k+nrows), slice(j, j+ncols))
+              for k in range(0, gcount, nrows)
+              for j in range(0, npix, ncols)]
+
+    def swap(chunk):
+        pixels[chunk].byteswap(True)
+
+    if nthreads > 1:
+        pool = ThreadPool(nthreads)
+        try:
+            pool.map(swap, chunks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for chunk in chunks:
+            swap(chunk)
+
+    # The group parameter blocks are small: swap them all at once
+    readgeis.read_gpb(dat, formats, data_size, group_size,
+                      gcount).byteswap(True)
+
+    dat.flush()
+    del pixels, dat
+
+
+def byteswap(input, output=None, clobber=True, inplace=False,
+             chunksize=CHUNKSIZE, nthreads=1):
 
     """Input GEIS files "input" will be read and converted to a new GEIS file
     whose byte-order has been swapped from its original state.
@@ -106,6 +166,20 @@ def byteswap(input,output=None,clobber=True):
     clobber - bool
         Overwrite any pre-existing output file? [Default: True]
 
+    inplace - bool
+        Byteswap the data file of "input" in place instead of writing a new
+        GEIS file, using a writable memory-map and without reading the
+        data into memory. "output" must be None. The header file is left
+        unchanged. [Default: False]
+
+    chunksize - int
+        Number of bytes of pixel data byteswapped at a time when
+        "inplace" is True. [Default: 4 MB]
+
+    nthreads - int
+        Number of threads used to byteswap the chunks when "inplace"
+        is True. [Default: 1]
+
     Notes
     -----
     This function will automatically read and write out the data file using the
@@ -122,12 +196,15 @@ def byteswap(input,output=None,clobber=True):
 
     data_file = input[:-1]+'d'
 
+    if inplace and output is not None:
+        raise ValueError("No output file can be given when byteswapping in place.")
+
     # Create default output name if no output name was specified by the user
     if output is None:
         output = input.replace('.','_swap.')
 
     out_data = output[:-1]+'d'
-    if os.path.exists(output) and not clobber:
+    if os.path.exists(output) and not clobber and not inplace:
         errstr = 'Output file already exists! Please remove or rename and start again...'
         raise IOError(errstr)
 
@@ -219,6 +296,12 @@ def byteswap(input,output=None,clobber=True):
     else:
         _uint16 = 0
 
+    if inplace:
+        _byteswap_inplace(data_file, _code, data_size * 8 // abs(_bitpix),
+                          formats, data_size, group_size, gcount,
+                          chunksize=chunksize, nthreads=nthreads)
+        print('Finished byte-swapping ',input,' in place')
+        return
 
     # Use copy-on-write for all data types since byteswap may be needed
     # in some platforms.
@@ -228,19 +311,18 @@ def byteswap(input,output=None,clobber=True):
 
     errormsg = ""
 
-    loc = 0
-    outdat = b''
-    for k in range(gcount):
-        ext_dat = numpy.fromstring(dat[loc:loc+data_size], dtype=_code)
-        ext_dat = ext_dat.reshape(_shape).byteswap()
-        outdat += ext_dat.tostring()
-
-        ext_hdu = fits.hdu.ImageHDU(data=ext_dat)
-
-        rec = numpy.fromstring(dat[loc+data_size:loc+group_size], dtype=formats).byteswap()
-        outdat += rec.tostring()
-
-        loc += group_size
+    # Byteswap the pixels and the group parameters of all groups at once
+    # by copying them into an output buffer with the same layout using
+    # the opposite byte order.
+    outdat = bytearray(gcount * group_size)
+    out_dat = readgeis.read_group_data(outdat, numpy.dtype(_code).newbyteorder('S'),
+                                       _shape, data_size, group_size, gcount)
+    out_dat[...] = readgeis.read_group_data(dat, _code, _shape, data_size,
+                                            group_size, gcount)
+    out_gpb = readgeis.read_gpb(outdat, formats, data_size, group_size,
+                                gcount, byteorder='S')
+    out_gpb[...] = readgeis.read_gpb(dat, formats, data_size, group_size,
+                                     gcount)
 
     if os.path.exists(output):
         os.remove(output)
@@ -566,7 +648,7 @@ if __name__ == "__main__":
     import getopt
 
     try:
-        optlist, args = getopt.getopt(sys.argv[1:], 'hn')
+        optlist, args = getopt.getopt(sys.argv[1:], 'hnit:')
     except getopt.error as e:
         print(str(e))
         print(__doc__)
@@ -575,15 +657,29 @@ if __name__ == "__main__":
     # initialize default values
     help = 0
     clobber = True
+    inplace = False
+    nthreads = 1
     # read options
     for opt, value in optlist:
         if opt == "-h":
             help = 1
         if opt == '-n':
             clobber = False
+        if opt == '-i':
+            inplace = True
+        if opt == '-t':
+            nthreads = int(value)
     if (help):
         print(__doc__)
         print("\t", __version__)
+    elif inplace:
+        list1, list2 = parse_path (args[0], '')
+        for input in list1:
+            try:
+                byteswap(input, inplace=True, nthreads=nthreads)
+            except Exception as e:
+                print("Conversion fails for %s: %s" % (input, str(e)))
+                break
     else:
         if len(args) == 1:
             args.append('')
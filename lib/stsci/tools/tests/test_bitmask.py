@@ -182,3 +182,224 @@ def test_bitfield_to_boolean_mask(data, flags, flip, goodval, dtype, ref):
 
     assert(mask.dtype == dtype)
     assert np.all(mask == ref)
+
+
+@pytest.mark.parametrize('nthreads', [1, 4])
+@pytest.mark.parametrize('goodval', [True, False])
+def test_bitfield_to_boolean_mask_chunked(monkeypatch, nthreads, goodval):
+    # use small chunks so that the arrays are split in many of them:
+    monkeypatch.setattr(bitmask, 'CHUNK_SIZE', 64)
+    data = np.arange(4000, dtype=np.uint16).reshape(50, 80)
+    ref = np.bitwise_and(data, ~np.uint16(6)) == 0
+    if not goodval:
+        ref = ~ref
+
+    views = [(data, ref), (data[::2, ::3], ref[::2, ::3]), (data.T, ref.T)]
+    for bitfield, expected in views:
+        mask = bitmask.bitfield_to_boolean_mask(
+            bitfield, ignore_flags=6, good_mask_value=goodval,
+            dtype=np.uint8, nthreads=nthreads
+        )
+        assert mask.dtype == np.uint8
+        assert np.array_equal(mask, expected)
+
+
+def test_bitfield_to_boolean_mask_out():
+    data = np.array([[0, 1, 2], [4, 6, 8]], dtype=np.int16)
+    out = np.full(data.shape, 7, dtype=np.float32)
+    mask = bitmask.bitfield_to_boolean_mask(data, ignore_flags=6, out=out,
+                                            dtype=np.bool_)
+    assert mask is out
+    assert np.array_equal(out, [[1, 0, 1], [1, 1, 0]])
+
+    bitmask.bitfield_to_boolean_mask(data, ignore_flags=None, out=out,
+                                     good_mask_value=False)
+    assert not out.any()
+
+    with pytest.raises(ValueError):
+        bitmask.bitfield_to_boolean_mask(data, out=np.empty(6))
+
+
+@pytest.mark.parametrize('goodval', [True, False])
+def test_bitfield_to_boolean_masks(monkeypatch, goodval):
+    monkeypatch.setattr(bitmask, 'CHUNK_SIZE', 64)
+    data = np.arange(4000, dtype=np.uint16).reshape(50, 80)[:, ::3]
+    flags = [0, 6, '~(2+4)', None, [1, 8]]
+
+    masks = bitmask.bitfield_to_boolean_masks(
+        data, flags, good_mask_value=goodval, dtype=np.int8, nthreads=2
+    )
+    packed = bitmask.bitfield_to_boolean_masks(
+        data, flags, good_mask_value=goodval, packed=True
+    )
+    assert masks.shape == (len(flags),) + data.shape
+    assert masks.dtype == np.int8
+    assert packed.shape == data.shape
+    assert packed.dtype == np.uint8
+
+    for k, flag in enumerate(flags):
+        ref = bitmask.bitfield_to_boolean_mask(data, ignore_flags=flag,
+                                               good_mask_value=goodval)
+        assert np.array_equal(masks[k], ref)
+        assert np.array_equal((packed >> k) & 1, ref)
+
+
+def test_bitfield_to_boolean_masks_packed_dtype():
+    data = np.arange(10, dtype=np.int32)
+    assert bitmask.bitfield_to_boolean_masks(
+        data, 9 * [0], packed=True).dtype == np.uint16
+    with pytest.raises(ValueError):
+        bitmask.bitfield_to_boolean_masks(data, 65 * [0], packed=True)
+
+
+DQ_FLAG_NAMES = {'HOT': 16, 'SATURATED': 256, 'CR': 4096}
+
+
+@pytest.mark.parametrize('flag,expected', [
+    ('HOT', 16),
+    ('~(SATURATED+hot)', ~272),
+    ('cr, 8', 4104),
+    ('~SATURATED', ~256),
+])
+def test_interpret_named_bit_flags(flag, expected):
+    assert bitmask.interpret_bit_flags(
+        flag, flag_name_map=DQ_FLAG_NAMES) == expected
+
+
+def test_interpret_unknown_bit_flag_name():
+    with pytest.raises(ValueError):
+        bitmask.interpret_bit_flags('HOT+WARM', flag_name_map=DQ_FLAG_NAMES)
+
+
+def test_compile_bit_flags_cache(monkeypatch):
+    monkeypatch.setattr(bitmask, 'BIT_FLAG_CACHE_SIZE', 2)
+    expr = bitmask.compile_bit_flags(' ~(2+4) ')
+    assert isinstance(expr, bitmask.BitFlagExpr)
+    assert expr.expression == '~(2+4)'
+    assert expr.bitmask == ~6
+    assert bitmask.compile_bit_flags('~(2+4)') is expr
+
+    # names are resolved with the map the expression was compiled with:
+    named = bitmask.compile_bit_flags('HOT', flag_name_map=DQ_FLAG_NAMES)
+    assert named.bitmask == 16
+    assert bitmask.compile_bit_flags(
+        'HOT', flag_name_map={'hot': 32}).bitmask == 32
+
+    # least recently used expressions are dropped:
+    assert bitmask.compile_bit_flags('~(2+4)') is not expr
+
+    assert bitmask.interpret_bit_flags(expr) == ~6
+    with pytest.raises(TypeError):
+        bitmask.interpret_bit_flags(expr, flip_bits=True)
+
+
+def test_bit_flag_expr_hashable():
+    exprs = set([bitmask.BitFlagExpr('4,8'), bitmask.BitFlagExpr('(8+4)'),
+                 bitmask.BitFlagExpr('~(4,8)'), bitmask.BitFlagExpr('None')])
+    assert len(exprs) == 3
+    assert bitmask.BitFlagExpr('None').bitmask is None
+
+
+def test_bitfield_to_boolean_mask_named_flags():
+    data = np.array([0, 16, 256, 272, 4096], dtype=np.uint16)
+    mask = bitmask.bitfield_to_boolean_mask(
+        data, ignore_flags='HOT,SATURATED', flag_name_map=DQ_FLAG_NAMES
+    )
+    assert np.array_equal(mask, [True, True, True, True, False])
+
+
+MASK_TEST_DATA = [
+    np.array([[0, 1, 1, 0, 0], [1, 1, 1, 1, 0], [0, 0, 0, 1, 1]], dtype=bool),
+    np.zeros((4, 3), dtype=bool),
+    np.ones(9, dtype=bool),
+    np.zeros(0, dtype=bool),
+]
+
+
+@pytest.mark.parametrize('mask_type', [bitmask.PackedMask, bitmask.RLEMask])
+@pytest.mark.parametrize('mask', MASK_TEST_DATA)
+def test_compact_mask_round_trip(mask_type, mask):
+    compact = mask_type.from_boolean(mask)
+    decoded = compact.to_boolean()
+    assert decoded.dtype == np.bool_
+    assert decoded.shape == mask.shape
+    assert np.array_equal(decoded, mask)
+    assert np.array_equal(np.asarray(compact), mask)
+    assert compact.count() == np.count_nonzero(mask)
+    assert np.array_equal((~compact).to_boolean(), ~mask)
+
+
+@pytest.mark.parametrize('mask_type', [bitmask.PackedMask, bitmask.RLEMask])
+def test_compact_mask_operators(mask_type):
+    mask1, mask2 = MASK_TEST_DATA[0], MASK_TEST_DATA[0][:, ::-1]
+    compact1 = mask_type.from_boolean(mask1)
+    compact2 = mask_type.from_boolean(mask2)
+
+    assert np.array_equal((compact1 & compact2).to_boolean(), mask1 & mask2)
+    assert np.array_equal((compact1 | compact2).to_boolean(), mask1 | mask2)
+    assert np.array_equal((compact1 ^ compact2).to_boolean(), mask1 ^ mask2)
+    assert np.array_equal((compact1 & mask2).to_boolean(), mask1 & mask2)
+    for result, expected in [(mask2 & compact1, mask1 & mask2),
+                             (mask2 | compact1, mask1 | mask2),
+                             (mask2 ^ compact1, mask1 ^ mask2)]:
+        assert isinstance(result, mask_type)
+        assert np.array_equal(result.to_boolean(), expected)
+    assert compact1 == mask_type.from_boolean(mask1.copy())
+    assert compact1 != compact2
+
+    with pytest.raises(ValueError):
+        compact1 & mask_type.from_boolean(MASK_TEST_DATA[1])
+
+
+def test_packed_mask_size():
+    mask = np.zeros((100, 100), dtype=bool)
+    mask[10:20, 30:] = True
+    packed = bitmask.PackedMask.from_boolean(mask)
+    assert packed.nbytes == mask.nbytes // 8
+    assert packed.size == mask.size
+
+
+@pytest.mark.parametrize('mask_type', [bitmask.PackedMask, bitmask.RLEMask])
+def test_compact_mask_fits_round_trip(tmpdir, mask_type):
+    from astropy.io import fits
+
+    mask = MASK_TEST_DATA[0]
+    fname = str(tmpdir.join('mask.fits'))
+    fits.HDUList([fits.PrimaryHDU(),
+                  mask_type.from_boolean(mask).to_hdu()]).writeto(fname)
+
+    with fits.open(fname) as hdulist:
+        compact = mask_type.from_hdu(hdulist['MASK'])
+        assert np.array_equal(compact.to_boolean(), mask)
+
+        other = (bitmask.RLEMask if mask_type is bitmask.PackedMask else
+                 bitmask.PackedMask)
+        with pytest.raises(ValueError):
+            other.from_hdu(hdulist['MASK'])
+
+
+@pytest.mark.parametrize('dtype', [np.uint8, np.int16, '>u2', '<i4', '>i8'])
+def test_flag_statistics(monkeypatch, dtype):
+    monkeypatch.setattr(bitmask, 'CHUNK_SIZE', 64)
+    data = (np.arange(-500, 1500).reshape(40, 50) * 37).astype(dtype)
+    nbits = 8 * data.dtype.itemsize
+    unsigned = data.view(data.dtype.str.replace('i', 'u'))
+
+    for bitfield, ubits in [(data, unsigned), (data.T[::3], unsigned.T[::3])]:
+        counts = bitmask.flag_statistics(bitfield, nthreads=2)
+        ref = [np.count_nonzero((ubits >> k) & 1) for k in range(nbits)]
+        assert counts.shape == (nbits,)
+        assert list(counts) == ref
+
+    flags = [4, '2+8', 'HOT', [1, 2]]
+    counts = bitmask.flag_statistics(data, flags=flags,
+                                     flag_name_map=DQ_FLAG_NAMES)
+    ref = [np.count_nonzero(unsigned & m) for m in [4, 10, 16, 3]]
+    assert list(counts) == ref
+
+
+def test_flag_statistics_errors():
+    with pytest.raises(TypeError):
+        bitmask.flag_statistics(np.ones(3))
+    with pytest.raises(ValueError):
+        bitmask.flag_statistics(np.ones(3, dtype=int), flags=[None])
@@ -0,0 +1,123 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from .. import check_files, fileutil, readgeis
+from .test_geis import write_geis
+
+
+def test_convert_batch_skips(tmpdir):
+    mef = str(tmpdir.join('j8bt06nyq_flt.fits'))
+    fits.HDUList([fits.PrimaryHDU(),
+                  fits.ImageHDU(np.zeros((2, 2)))]).writeto(mef)
+
+    # GEIS inputs whose MEF output is newer than the input are up to date
+    geisfiles = [write_geis(tmpdir.join('u2o9010%dt.c0h' % i))
+                 for i in range(2)]
+    for geisfile in geisfiles:
+        output = geisfile[:-4] + '_c0h.fits'
+        open(output, 'w').close()
+        t = os.path.getmtime(geisfile[:-1] + 'd') + 10
+        os.utime(output, (t, t))
+
+    results = check_files.convert_batch(
+        str(tmpdir.join('u*.c0h')) + ',' + mef, nprocs=2)
+    assert [r[0] for r in results] == sorted(geisfiles) + [mef]
+    assert [r[1] for r in results] == \
+        [f[:-4] + '_c0h.fits' for f in sorted(geisfiles)] + [mef]
+    assert [r[2] for r in results] == ['skipped'] * 3
+    assert [r[4] for r in results] == [None, None, 'already MEF']
+
+
+def test_convert_batch_failures(tmpdir):
+    missing = str(tmpdir.join('u2o90101t.c0h'))
+    pattern = str(tmpdir.join('*.c0h'))
+    results = check_files.convert_batch([missing, pattern])
+    assert [r[0] for r in results] == [missing, pattern]
+    assert [r[2] for r in results] == ['failed'] * 2
+    assert [r[4] for r in results] == ['file not found'] * 2
+
+    # A GEIS header without its data file cannot be converted
+    geisfile = write_geis(tmpdir.join('u2o90101t.c0h'))
+    os.remove(geisfile[:-1] + 'd')
+    results = check_files.convert_batch(geisfile, verbose=False)
+    assert len(results) == 1
+    filename, output, status, seconds, error = results[0]
+    assert status == 'failed'
+    assert output == geisfile[:-4] + '_c0h.fits'
+    assert error
+    assert seconds >= 0
+
+
+def test_convert_batch(tmpdir):
+    pytest.importorskip('stwcs')
+    geisfile = write_geis(tmpdir.join('u2o90101t.c0h'))
+    results = check_files.convert_batch(geisfile)
+    assert results[0][2] == 'converted'
+    assert os.path.exists(results[0][1])
+
+    results = check_files.convert_batch(geisfile)
+    assert results[0][2] == 'skipped'
+
+
+def readgeis2mef(sciname, convert_dq=True):
+    """Convert GEIS files to MEF as geis2mef does, without the WCS update
+    which needs stwcs."""
+    names = [sciname]
+    if convert_dq and os.path.exists(sciname.split('.')[0] + '.c1h'):
+        names.append(sciname.split('.')[0] + '.c1h')
+    for name in names:
+        hdulist = readgeis.readgeis(name)
+        hdulist.writeto(fileutil.buildFITSName(name), overwrite=True)
+        hdulist.close()
+    return fileutil.buildFITSName(sciname)
+
+
+@pytest.mark.parametrize('nprocs', [1, 2])
+def test_convert_batch_geis(tmpdir, monkeypatch, nprocs):
+    monkeypatch.setattr(check_files, 'geis2mef', readgeis2mef)
+    sci = [write_geis(tmpdir.join('u2o9010%dt.c0h' % i)) for i in range(2)]
+    dq = write_geis(tmpdir.join('u2o90100t.c1h'), datatype='INTEGER*2')
+    dqoutput = dq[:-4] + '_c1h.fits'
+
+    results = check_files.convert_batch(sci, nprocs=nprocs, verbose=False)
+    assert [r[2] for r in results] == ['converted'] * 2
+    assert [r[1] for r in results] == [f[:-4] + '_c0h.fits' for f in sci]
+    for output in [r[1] for r in results] + [dqoutput]:
+        with fits.open(output) as hdulist:
+            assert len(hdulist) == 3
+            assert hdulist[1].data.shape == (3, 4)
+
+    results = check_files.convert_batch(sci, nprocs=nprocs, verbose=False)
+    assert [r[2] for r in results] == ['skipped'] * 2
+
+    # A missing DQ output makes its science file out of date
+    os.remove(dqoutput)
+    results = check_files.convert_batch(sci, nprocs=nprocs, verbose=False)
+    assert [r[2] for r in results] == ['converted', 'skipped']
+    assert os.path.exists(dqoutput)
+
+
+def test_convert_batch_dq(tmpdir, monkeypatch):
+    converted = []
+
+    def geis2mef(sciname, convert_dq=True):
+        converted.append(sciname)
+        if convert_dq:
+            converted.append(sciname.split('.')[0] + '.c1h')
+        return sciname
+
+    monkeypatch.setattr(check_files, 'geis2mef', geis2mef)
+    sci = [write_geis(tmpdir.join('u2o9010%dt.c0h' % i)) for i in range(2)]
+    dq = write_geis(tmpdir.join('u2o90100t.c1h'))
+
+    # A DQ file listed with its science file, and a repeated input,
+    # are each converted only once
+    results = check_files.convert_batch(sci + [dq, sci[0]], verbose=False)
+    assert [r[0] for r in results] == sci + [dq]
+    assert [r[2] for r in results] == ['converted'] * 3
+    assert sorted(converted) == sorted(sci + [dq, sci[1][:-2] + '1h'])
@@ -0,0 +1,99 @@
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from .. import convertwaiveredfits
+
+
+def write_waivered(path, nrows=3, shape=(3, 4), dtype='float32',
+                   odattype='FLOATING'):
+    """Write a small WFPC2-like waivered FITS file and return its name."""
+    data = (np.arange(nrows * np.prod(shape)).reshape((nrows,) + shape)
+            .astype(dtype))
+    phdu = fits.PrimaryHDU(data)
+    phdu.header['INSTRUME'] = 'WFPC2'
+    phdu.header['ROOTNAME'] = 'U2O90101T'
+    phdu.header['FILETYPE'] = 'SCI'
+    phdu.header['ODATTYPE'] = odattype
+    phdu.header['CRPIX1'] = 1.0
+
+    cols = [
+        fits.Column(name='CRPIX1', format='E15.7',
+                    array=np.array([400.0, 400.25, 1.0e-10])[:nrows]),
+        fits.Column(name='DETECTOR', format='I11',
+                    array=np.arange(1, nrows + 1)),
+        fits.Column(name='DOFLAG', format='A1', unit='LOGICAL-',
+                    array=np.array(['T', 'F', 'T'])[:nrows]),
+        fits.Column(name='FILTNAM', format='A8',
+                    array=np.array(['F555W', 'F814W', 'F300W'])[:nrows]),
+    ]
+    table = fits.TableHDU.from_columns(cols)
+    table.header['CRPIX1'] = 'x-coordinate of reference pixel'
+    table.header['DETECTOR'] = 'detector number'
+
+    fname = str(path)
+    fits.HDUList([phdu, table]).writeto(fname)
+    return fname
+
+
+def test_toMultiExtensionFits(tmpdir):
+    fname = write_waivered(tmpdir.join('u2o90101t_c0f.fits'))
+    mhdul = convertwaiveredfits.toMultiExtensionFits(fname)
+
+    assert len(mhdul) == 4
+    assert mhdul[0].header['NEXTEND'] == 3
+    assert 'CRPIX1' not in mhdul[0].header
+    for i in range(1, 4):
+        hdr = mhdul[i].header
+        np.testing.assert_array_equal(
+            mhdul[i].data, np.arange(12).reshape(3, 4) + 12 * (i - 1))
+        assert list(hdr.keys())[:7] == ['XTENSION', 'BITPIX', 'NAXIS',
+                                        'NAXIS1', 'NAXIS2', 'PCOUNT',
+                                        'GCOUNT']
+        assert list(hdr.keys())[7:11] == ['CRPIX1', 'DETECTOR', 'DOFLAG',
+                                          'FILTNAM']
+        assert hdr['DETECTOR'] == i
+        assert hdr.comments['DETECTOR'] == 'detector number'
+        assert hdr['EXTNAME'] == 'SCI'
+        assert hdr['EXTVER'] == i
+
+    # Floats are rounded to the precision of the column format, and
+    # integral values are written as integers
+    assert mhdul[1].header['CRPIX1'] == 400
+    assert isinstance(mhdul[1].header['CRPIX1'], int)
+    assert mhdul[2].header['CRPIX1'] == 400.25
+    assert mhdul[3].header['CRPIX1'] == pytest.approx(1.0e-10)
+    assert [mhdul[i].header['DOFLAG'] for i in range(1, 4)] == \
+        [True, False, True]
+    assert [mhdul[i].header['FILTNAM'] for i in range(1, 4)] == \
+        ['F555W', 'F814W', 'F300W']
+
+
+@pytest.mark.parametrize(('dtype', 'odattype'),
+                         [('float32', 'FLOATING'), ('int16', 'USHORT')])
+def test_toMultiExtensionFits_stream(tmpdir, dtype, odattype):
+    fname = write_waivered(tmpdir.join('u2o90101t_c0f.fits'), dtype=dtype,
+                           odattype=odattype)
+    inmem = str(tmpdir.mkdir('inmem').join('u2o90101t_c0h.fits'))
+    streamed = str(tmpdir.mkdir('streamed').join('u2o90101t_c0h.fits'))
+
+    convertwaiveredfits.toMultiExtensionFits(fname, inmem).close()
+    mhdul = convertwaiveredfits.toMultiExtensionFits(fname, streamed,
+                                                     stream=True)
+    try:
+        assert len(mhdul) == 4
+        np.testing.assert_array_equal(mhdul[3].data,
+                                      np.arange(24, 36).reshape(3, 4))
+    finally:
+        mhdul.close()
+
+    with open(inmem, 'rb') as f1, open(streamed, 'rb') as f2:
+        assert f1.read() == f2.read()
+
+
+def test_toMultiExtensionFits_stream_no_output(tmpdir):
+    fname = write_waivered(tmpdir.join('u2o90101t_c0f.fits'))
+    with pytest.raises(ValueError):
+        convertwaiveredfits.toMultiExtensionFits(fname, stream=True)
@@ -0,0 +1,145 @@
+"""Tests for the header access functions of fileutil."""
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from .. import convertwaiveredfits, fileutil, readgeis
+from .test_convertwaiveredfits import write_waivered
+from .test_geis import write_geis
+
+
+def write_mef(path):
+    """Write a small multi-extension FITS file and return its name."""
+    phdu = fits.PrimaryHDU()
+    phdu.header['INSTRUME'] = 'ACS'
+    phdu.header['CD1_1'] = '9.2E-06/'
+    hdus = [phdu]
+    for extver in (1, 2):
+        hdu = fits.ImageHDU(np.zeros((4, 5), dtype='float32'), name='SCI')
+        hdu.header['EXTVER'] = extver
+        hdu.header['CCDCHIP'] = 3 - extver
+        hdus.append(hdu)
+    fname = str(path)
+    fits.HDUList(hdus).writeto(fname)
+    return fname
+
+
+def test_getKeyword_mef(tmpdir):
+    fname = write_mef(tmpdir.join('j8e601bkq_flt.fits'))
+
+    assert fileutil.getKeyword(fname, 'INSTRUME') == 'ACS'
+    assert fileutil.getKeyword(fname, 'CD1_1') == '9.2E-06'
+    assert fileutil.getKeyword(fname + '[sci,2]', 'CCDCHIP') == 1
+    assert fileutil.getKeyword(fname + '[2]', 'CCDCHIP') == 1
+    # Keywords missing from the extension are searched in the others
+    assert fileutil.getKeyword(fname, 'CCDCHIP') == 2
+    assert fileutil.getKeyword(fname, 'MISSING') is None
+    assert fileutil.getKeyword(fname, 'MISSING', default=0) == 0
+    with pytest.raises(KeyError):
+        fileutil.getKeyword(fname + '[sci,3]', 'CCDCHIP')
+
+    with fits.open(fname) as handle:
+        assert fileutil.getKeyword(fname + '[sci,1]', 'CCDCHIP',
+                                   handle=handle) == 2
+
+
+def test_getHeader_mef(tmpdir):
+    fname = write_mef(tmpdir.join('j8e601bkq_flt.fits'))
+
+    hdr = fileutil.getHeader(fname + '[sci,2]')
+    assert hdr['INSTRUME'] == 'ACS'
+    assert hdr['NAXIS'] == 2
+    assert hdr['NAXIS1'] == 5
+    assert hdr['CCDCHIP'] == 1
+    assert 'CCDCHIP' not in fileutil.getHeader(fname)
+
+
+def test_getHeaders_geis(tmpdir):
+    hname = write_geis(tmpdir.join('u2o90101t.c0h'), gcount=3,
+                       datatype='UNSIGNED*2')
+
+    headers = fileutil.getHeaders(hname)
+    hdulist = readgeis.readgeis(hname)
+    assert len(headers) == len(hdulist) == 4
+    for hdr, hdu in zip(headers, hdulist):
+        assert str(hdr) == str(hdu.header)
+
+    assert fileutil.getKeyword(hname + '[3]', 'FILTNAM') == 'F002W'
+    assert fileutil.getKeyword(hname + '[2/3]', 'DETECTOR') == 2
+    assert fileutil.getHeader(hname + '[1]')['NAXIS2'] == 3
+
+
+def test_getHeaders_waivered(tmpdir):
+    fname = write_waivered(tmpdir.join('u2o90101t_c0f.fits'))
+
+    headers = fileutil.getHeaders(fname)
+    mhdul = convertwaiveredfits.convertwaiveredfits(fname)
+    assert len(headers) == len(mhdul) == 4
+    for hdr, hdu in zip(headers, mhdul):
+        assert str(hdr) == str(hdu.header)
+
+    assert fileutil.getKeyword(fname + '[sci,2]', 'FILTNAM') == 'F814W'
+
+
+def test_getKeywords(tmpdir):
+    mef = write_mef(tmpdir.join('j8e601bkq_flt.fits'))
+    geis = write_geis(tmpdir.join('u2o90101t.c0h'))
+
+    table = fileutil.getKeywords([mef, geis + '[2]'],
+                                 ['INSTRUME', 'DETECTOR'], default=-1)
+    assert table.colnames == ['filename', 'INSTRUME', 'DETECTOR']
+    assert list(table['filename']) == [mef, geis + '[2]']
+    assert list(table['INSTRUME']) == ['ACS', 'WFPC2']
+    assert list(table['DETECTOR']) == [-1, 2]
+
+
+def test_Expand_cache(monkeypatch):
+    fileutil.clearExpandCache()
+    monkeypatch.setenv('EXPANDTEST', '/data/')
+    try:
+        assert fileutil.Expand('EXPANDTEST$a.fits') == '/data/a.fits'
+        assert fileutil.Expand('EXPANDTEST$a.fits') == '/data/a.fits'
+        info = fileutil.expandCacheInfo()
+        assert (info['hits'], info['misses'], info['currsize']) == (1, 1, 1)
+
+        # Strings without variables are not cached
+        assert fileutil.Expand('a.fits') == 'a.fits'
+        assert fileutil.expandCacheInfo()['currsize'] == 1
+
+        # IRAF variables take precedence over OS ones
+        fileutil.set(EXPANDTEST='/iraf/')
+        assert fileutil.expandCacheInfo()['currsize'] == 0
+        assert fileutil.Expand('EXPANDTEST$a.fits') == '/iraf/a.fits'
+        fileutil.unset('EXPANDTEST')
+        assert fileutil.Expand('EXPANDTEST$a.fits') == '/data/a.fits'
+
+        # Changes of the OS environment are picked up
+        monkeypatch.setenv('EXPANDTEST', '/other/')
+        assert fileutil.Expand('EXPANDTEST$a.fits') == '/other/a.fits'
+        monkeypatch.delenv('EXPANDTEST')
+        with pytest.raises(ValueError):
+            fileutil.Expand('EXPANDTEST$a.fits')
+        assert fileutil.Expand('EXPANDTEST$a.fits', noerror=1) == \
+            'EXPANDTESTa.fits'
+    finally:
+        fileutil.unset('EXPANDTEST')
+        fileutil.clearExpandCache()
+
+    info = fileutil.expandCacheInfo()
+    assert (info['hits'], info['misses'], info['currsize']) == (0, 0, 0)
+
+
+def test_Expand_cache_size(monkeypatch):
+    fileutil.clearExpandCache()
+    monkeypatch.setattr(fileutil, 'EXPAND_CACHE_SIZE', 2)
+    fileutil.set(EXPANDTEST='/iraf/')
+    try:
+        for name in ('a', 'b', 'a', 'c', 'b'):
+            fileutil.Expand('EXPANDTEST$' + name)
+        info = fileutil.expandCacheInfo()
+        assert (info['hits'], info['misses'], info['currsize']) == (1, 4, 2)
+    finally:
+        fileutil.unset('EXPANDTEST')
+        fileutil.clearExpandCache()
@@ -0,0 +1,360 @@
+"""Tests for reading and converting GEIS images."""
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from .. import convertgeis, readgeis, swapgeis
+
+# (PTYPE, PDTYPE, comment) of the group parameters written to test files
+GPB_PARAMS = [
+    ('CRVAL1', 'REAL*8', 'right ascension of reference pixel'),
+    ('CRPIX1', 'REAL*4', 'x-coordinate of reference pixel'),
+    ('DETECTOR', 'INTEGER*4', 'detector number'),
+    ('DOFLAG', 'LOGICAL*4', 'processing flag'),
+    ('FILTNAM', 'CHARACTER*8', 'filter name'),
+]
+
+GEIS_TYPES = {
+    'REAL*4': ('float32', 32),
+    'INTEGER*2': ('int16', 16),
+    'INTEGER*4': ('int32', 32),
+    'UNSIGNED*2': ('uint16', 16),
+}
+
+
+def gpb_values(k):
+    """Group parameter values written for group ``k`` (0-based)."""
+    return (10.0 + k / 3., 400.5 + k, k + 1, k % 2, 'F%03dW' % k)
+
+
+def group_data(k, shape, dtype):
+    """Pixel values written for group ``k`` (0-based)."""
+    return (np.arange(np.prod(shape)).reshape(shape) + 100 * k).astype(dtype)
+
+
+def write_geis(path, shape=(3, 4), gcount=2, datatype='REAL*4',
+               byteorder='='):
+    """Write a small WFPC2-like GEIS image and return the header name."""
+    dtype, bitpix = GEIS_TYPES[datatype]
+    dtype = np.dtype(dtype).newbyteorder(byteorder)
+
+    names, formats = [], []
+    for ptype, pdtype, comment in GPB_PARAMS:
+        _type, nbytes = pdtype.split('*')
+        names.append(ptype)
+        formats.append({'REAL': 'f', 'INTEGER': 'i', 'LOGICAL': 'i',
+                        'CHARACTER': 'S'}[_type] + nbytes)
+    gpb_dtype = np.dtype({'names': names, 'formats': formats})
+    gpb_dtype = gpb_dtype.newbyteorder(byteorder)
+
+    cards = [
+        ('SIMPLE', False, ''), ('BITPIX', bitpix, ''),
+        ('DATATYPE', datatype, ''), ('NAXIS', len(shape), ''),
+    ]
+    for i, n in enumerate(shape[::-1]):
+        cards.append(('NAXIS%d' % (i + 1), n, ''))
+    cards += [
+        ('GROUPS', True, ''), ('GCOUNT', gcount, ''),
+        ('PCOUNT', len(GPB_PARAMS), ''),
+        ('PSIZE', gpb_dtype.itemsize * 8, ''),
+    ]
+    for i, (ptype, pdtype, comment) in enumerate(GPB_PARAMS):
+        cards += [
+            ('PTYPE%d' % (i + 1), ptype, comment),
+            ('PDTYPE%d' % (i + 1), pdtype, ''),
+            ('PSIZE%d' % (i + 1), int(pdtype.split('*')[1]) * 8, ''),
+        ]
+    cards += [
+        ('DATE', '22/04/94', ''), ('INSTRUME', 'WFPC2', ''),
+        ('ROOTNAME', 'U2O90101T', ''),
+        ('FILETYPE', 'SCI', ''),
+    ]
+
+    hname = str(path)
+    with open(hname, 'w') as f:
+        for card in cards:
+            f.write(fits.Card(*card).image + '\n')
+        f.write('END'.ljust(80) + '\n')
+
+    with open(hname[:-1] + 'd', 'wb') as f:
+        for k in range(gcount):
+            f.write(group_data(k, shape, dtype).tobytes())
+            f.write(np.array([gpb_values(k)], dtype=gpb_dtype).tobytes())
+
+    return hname
+
+
+@pytest.fixture
+def geisfile(tmpdir):
+    return write_geis(tmpdir.join('u2o90101t.c0h'))
+
+
+def test_readgeis(geisfile):
+    hdul = readgeis.readgeis(geisfile)
+    assert len(hdul) == 3
+    assert hdul[0].header['NEXTEND'] == 2
+    for k in range(2):
+        hdr = hdul[k + 1].header
+        crval1, crpix1, detector, doflag, filtnam = gpb_values(k)
+        np.testing.assert_array_equal(hdul[k + 1].data,
+                                      group_data(k, (3, 4), 'float32'))
+        assert hdr['CRVAL1'] == crval1
+        assert hdr['CRPIX1'] == pytest.approx(crpix1)
+        assert hdr['DETECTOR'] == detector
+        assert hdr['DOFLAG'] is bool(doflag)
+        assert hdr['FILTNAM'] == filtnam
+        assert hdr['EXTNAME'] == 'SCI'
+        assert hdr['EXTVER'] == k + 1
+
+
+@pytest.mark.parametrize('datatype', ['REAL*4', 'INTEGER*4', 'UNSIGNED*2'])
+def test_readgeis_memmap(tmpdir, datatype):
+    geisfile = write_geis(tmpdir.join('u2o90101t.c0h'), datatype=datatype)
+    ref = readgeis.readgeis(geisfile)
+    hdul = readgeis.readgeis(geisfile, memmap=True)
+
+    assert isinstance(hdul.mmobject, np.memmap)
+    for k in range(1, 3):
+        assert not hdul[k].data.flags.owndata
+        assert hdul[k].header == ref[k].header
+
+    # Both modes must produce the same FITS file
+    hdul.writeto(str(tmpdir.join('memmap.fits')))
+    ref.writeto(str(tmpdir.join('ref.fits')))
+    with fits.open(str(tmpdir.join('memmap.fits'))) as out, \
+            fits.open(str(tmpdir.join('ref.fits'))) as expected:
+        for k in range(1, 3):
+            np.testing.assert_array_equal(out[k].data, expected[k].data)
+            np.testing.assert_array_equal(
+                out[k].data, group_data(k - 1, (3, 4),
+                                        GEIS_TYPES[datatype][0]))
+
+
+@pytest.mark.parametrize('memmap', [False, True])
+def test_readgeis_byteorder(tmpdir, memmap):
+    swapped = '<' if np.little_endian is False else '>'
+    geisfile = write_geis(tmpdir.join('u2o90101t.c0h'), byteorder=swapped)
+    hdul = readgeis.readgeis(geisfile, memmap=memmap, byteorder=swapped)
+    for k in range(2):
+        np.testing.assert_array_equal(hdul[k + 1].data,
+                                      group_data(k, (3, 4), 'float32'))
+        assert hdul[k + 1].header['DETECTOR'] == k + 1
+
+
+def test_read_gpb(geisfile):
+    with open(geisfile[:-1] + 'd', 'rb') as f:
+        dat = f.read()
+    formats = [('CRVAL1', 'f8'), ('CRPIX1', 'f4'), ('DETECTOR', 'i4'),
+               ('DOFLAG', 'i4'), ('FILTNAM', 'S8')]
+    data_size = 3 * 4 * 4
+    group_size = data_size + 28
+
+    gpb = readgeis.read_gpb(dat, formats, data_size, group_size, 2)
+    pixels = readgeis.read_group_data(dat, 'float32', (3, 4), data_size,
+                                      group_size, 2)
+    assert gpb.shape == (2,)
+    assert pixels.shape == (2, 3, 4)
+    for k in range(2):
+        crval1, crpix1, detector, doflag, filtnam = gpb_values(k)
+        assert gpb['CRVAL1'][k] == crval1
+        assert gpb['DETECTOR'][k] == detector
+        assert gpb['FILTNAM'][k] == filtnam.encode('ascii')
+        np.testing.assert_array_equal(pixels[k],
+                                      group_data(k, (3, 4), 'float32'))
+
+    cards = readgeis.gpb_cards(gpb, [p[2] for p in GPB_PARAMS],
+                               bools=[4], floats=[2])
+    assert [c.keyword for c in cards[1]] == [p[0] for p in GPB_PARAMS]
+    assert cards[1][3].value is True
+    assert cards[1][4].value == 'F001W'
+    assert cards[0][1].image[10:30] == '%20.7G' % 400.5
+
+
+def test_convertgeis(tmpdir):
+    geisfile = write_geis(tmpdir.join('u2o90101t.c0h'), shape=(4, 4),
+                          gcount=3)
+    hdul = convertgeis.convert(geisfile)
+    phdr = hdul[0].header
+    assert phdr['CRVAL1'] == gpb_values(0)[0]
+    assert phdr['DETECTOR'] == 1
+    assert phdr['DOFLAG'] is False
+    assert phdr['FILTNAM'] == 'F000W'
+
+    for k in range(3):
+        np.testing.assert_array_equal(hdul[0].data[k],
+                                      group_data(k, (4, 4), 'float32'))
+    table = hdul[1].data
+    np.testing.assert_array_equal(table['DETECTOR'], [1, 2, 3])
+    np.testing.assert_array_equal(table['DOFLAG'], ['F', 'T', 'F'])
+    np.testing.assert_array_equal(table['FILTNAM'],
+                                  ['F000W', 'F001W', 'F002W'])
+    np.testing.assert_allclose(table['CRPIX1'], [400.5, 401.5, 402.5])
+
+
+def test_swapgeis(tmpdir):
+    geisfile = write_geis(tmpdir.join('u2o90101t.c0h'), shape=(4, 4))
+    output = str(tmpdir.join('swapped.c0h'))
+    swapgeis.byteswap(geisfile, output)
+
+    swapped = '<' if np.little_endian is False else '>'
+    hdul = readgeis.readgeis(output, byteorder=swapped)
+    ref = readgeis.readgeis(geisfile)
+    for k in range(1, 3):
+        np.testing.assert_array_equal(hdul[k].data, ref[k].data)
+        assert hdul[k].header == ref[k].header
+
+
+@pytest.mark.parametrize('datatype', ['REAL*4', 'INTEGER*2', 'UNSIGNED*2'])
+def test_convertgeis_to_file(tmpdir, datatype):
+    geisfile = write_geis(tmpdir.join('u2o90101t.c0h'), shape=(3, 5),
+                          gcount=3, datatype=datatype)
+    output = str(tmpdir.join('u2o90101t_c0f.fits'))
+    convertgeis.convert_to_file(geisfile, output)
+
+    # Streaming the groups must give exactly the file written by convert
+    expected = str(tmpdir.join('expected.fits'))
+    convertgeis.convert(geisfile).writeto(expected)
+    with open(output, 'rb') as f1, open(expected, 'rb') as f2:
+        assert f1.read() == f2.read()
+
+    with fits.open(output) as hdul:
+        assert hdul[0].data.shape == (3, 3, 5)
+        assert isinstance(hdul[1], fits.TableHDU)
+        np.testing.assert_array_equal(hdul[1].data['DETECTOR'], [1, 2, 3])
+
+    with pytest.raises(IOError):
+        convertgeis.convert_to_file(geisfile, output, clobber=False)
+
+
+@pytest.mark.parametrize('nthreads', [1, 3])
+def test_swapgeis_inplace(tmpdir, nthreads):
+    geisfile = write_geis(tmpdir.join('u2o90101t.c0h'), gcount=5)
+    ref = readgeis.readgeis(geisfile)
+
+    # A tiny chunk size splits every group over several chunks
+    swapgeis.byteswap(geisfile, inplace=True, chunksize=20,
+                      nthreads=nthreads)
+
+    swapped = '<' if np.little_endian is False else '>'
+    hdul = readgeis.readgeis(geisfile, byteorder=swapped)
+    for k in range(1, 6):
+        np.testing.assert_array_equal(hdul[k].data, ref[k].data)
+        assert hdul[k].header == ref[k].header
+
+    # The data are unchanged after swapping them back in larger chunks
+    swapgeis.byteswap(geisfile, inplace=True)
+    hdul = readgeis.readgeis(geisfile)
+    for k in range(1, 6):
+        np.testing.assert_array_equal(hdul[k].data, ref[k].data)
+
+    with pytest.raises(ValueError):
+        swapgeis.byteswap(geisfile, str(tmpdir.join('out.c0h')),
+                          inplace=True)
+
+
+def test_check_byteorder():
+    data = np.ones(200000, dtype='float32')
+    assert readgeis.check_byteorder(data, -32) is None
+    data[100001] = np.inf
+    assert readgeis.check_byteorder(data, -32) == 'nonfinite'
+    # Only every 3rd pixel is examined when sampling
+    assert readgeis.check_byteorder(data, -32, mode='sampled') is None
+    data[99999] = np.nan
+    assert readgeis.check_byteorder(data, -32, mode='sampled') == 'nonfinite'
+    assert readgeis.check_byteorder(data, -32, mode='off') is None
+
+    data = np.arange(-100, 100, dtype='int16').reshape(10, 20)
+    assert readgeis.check_byteorder(data, 16) is None
+    data[5, 5] = -32768
+    assert readgeis.check_byteorder(data, 16) is None
+    data[5, 6] = 16384
+    assert readgeis.check_byteorder(data, 16) == 'maxbits'
+
+    with pytest.raises(ValueError):
+        readgeis.check_byteorder(data, 16, mode='partial')
+
+
+def test_check_byteorder_unsigned():
+    """Unsigned data is checked as the stored, offset, integers."""
+    raw = np.array([0, 100, 16384, 20000, 32768, 49152, 65535],
+                   dtype=np.uint16)
+    stored = (raw - 32768).astype(np.int16)
+    for value, expected in zip(raw, [None, 'maxbits', 'maxbits', None,
+                                     None, 'maxbits', 'maxbits']):
+        assert readgeis.check_byteorder(raw[raw == value], 16) == expected
+        assert readgeis.check_byteorder(stored[raw == value], 16) == expected
+
+
+def test_readgeis_byteorder_check_unsigned(tmpdir):
+    geisfile = write_geis(tmpdir.join('u2o90101t.c0h'), shape=(4, 4),
+                          gcount=3, datatype='UNSIGNED*2')
+    problems = [readgeis.readgeis(geisfile, memmap=memmap).byteorder_problems
+                for memmap in (False, True)]
+    assert problems[0] == problems[1]
+
+
+@pytest.mark.parametrize('memmap', [False, True])
+def test_readgeis_byteorder_check(tmpdir, capsys, memmap):
+    swapped = '<' if np.little_endian is False else '>'
+    geisfile = write_geis(tmpdir.join('u2o90101t.c0h'), shape=(4, 4),
+                          datatype='INTEGER*2', byteorder=swapped)
+
+    # Values of 100 and above use the top bits once byteswapped
+    hdul = readgeis.readgeis(geisfile, memmap=memmap)
+    assert hdul.byteorder_problems == [(2, 'maxbits')]
+    out = capsys.readouterr().out
+    assert geisfile + '[2]' in out
+    assert 'with maximum bitvalues' in out
+
+    hdul = readgeis.readgeis(geisfile, memmap=memmap, check='off')
+    assert hdul.byteorder_problems == []
+    assert capsys.readouterr().out == ''
+
+    hdul = readgeis.readgeis(geisfile, memmap=memmap, byteorder=swapped)
+    assert hdul.byteorder_problems == []
+
+    hdul = convertgeis.convert(geisfile)
+    assert hdul.byteorder_problems == [(2, 'maxbits')]
+    problems = convertgeis.convert_to_file(
+        geisfile, str(tmpdir.join('out.fits')), check='sampled')
+    assert problems == [(2, 'maxbits')]
+
+
+@pytest.mark.parametrize('memmap', [False, True])
+def test_geisfile(tmpdir, memmap):
+    geisfile = write_geis(tmpdir.join('u2o90101t.c0h'), gcount=4,
+                          datatype='UNSIGNED*2')
+    ref = readgeis.readgeis(geisfile, memmap=memmap)
+
+    with readgeis.GeisFile(geisfile, memmap=memmap) as geis:
+        assert len(geis) == 5
+        assert geis[0].header == ref[0].header
+        assert geis[3].header == ref[3].header
+        np.testing.assert_array_equal(geis[3].data, ref[3].data)
+        assert geis[-1].header['EXTVER'] == 4
+        assert geis[3] is geis[3]
+        assert [hdu.header['DETECTOR'] for hdu in list(geis)[1:]] == \
+            [1, 2, 3, 4]
+        with pytest.raises(IndexError):
+            geis[5]
+
+
+def test_geisfile_lazy(tmpdir):
+    geisfile = write_geis(tmpdir.join('u2o90101t.c0h'))
+    with open(geisfile[:-1] + 'd', 'r+b') as f:
+        f.truncate(1)
+
+    # Only the header file is read until a group is accessed
+    geis = readgeis.GeisFile(geisfile)
+    assert geis[0].header['INSTRUME'] == 'WFPC2'
+    assert geis[0].header['NEXTEND'] == 2
+    with pytest.raises(Exception):
+        geis[1].data
+
+
+def test_geisfile_bad_name(tmpdir):
+    fname = str(tmpdir.join('u2o90101t.fits'))
+    with pytest.raises(ValueError, match='Illegal input GEIS file name'):
+        readgeis.GeisFile(fname)
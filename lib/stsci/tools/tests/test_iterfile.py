@@ -0,0 +1,198 @@
+"""Tests for iterfile."""
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from .. import iterfile
+from ..iterfile import IterFitsFile
+
+
+def write_images(tmpdir, nfiles=3, shape=(5, 4), dtype='float32'):
+    """Write nfiles images with a SCI extension and return their names and
+    data."""
+    names = []
+    arrays = []
+    for i in range(nfiles):
+        data = (np.arange(np.prod(shape)).reshape(shape) + 100 * i)
+        data = data.astype(dtype)
+        fname = str(tmpdir.join('image{0}.fits'.format(i)))
+        fits.HDUList([fits.PrimaryHDU(),
+                      fits.ImageHDU(data, name='SCI')]).writeto(fname)
+        names.append(fname)
+        arrays.append(data)
+    return names, arrays
+
+
+@pytest.fixture
+def handle_pool():
+    maxfiles = iterfile.MAX_OPEN_FILES
+    iterfile.close_handle_pool()
+    yield
+    iterfile.set_max_open_files(maxfiles)
+    iterfile.close_handle_pool()
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    """Names of the files opened by iterfile."""
+    opened = []
+    fits_open = fits.open
+
+    def counting_open(name, *args, **kwargs):
+        opened.append(name)
+        return fits_open(name, *args, **kwargs)
+
+    monkeypatch.setattr(iterfile.fits, 'open', counting_open)
+    return opened
+
+
+def test_rows(tmpdir, handle_pool):
+    names, arrays = write_images(tmpdir)
+    files = [IterFitsFile(name + '[sci,1]') for name in names]
+    for f, data in zip(files, arrays):
+        assert f.shape == data.shape
+        assert f.type() == 'float32'
+        np.testing.assert_array_equal(f.data, data)
+    for row in range(5):
+        for f, data in zip(files, arrays):
+            np.testing.assert_array_equal(f[row:row + 1], data[row:row + 1])
+
+
+def test_handle_pool(tmpdir, handle_pool, opened):
+    names, arrays = write_images(tmpdir)
+    files = [IterFitsFile(name + '[1]') for name in names]
+    for row in range(5):
+        for f in files:
+            f[row:row + 1]
+    assert opened == names
+
+    # Least recently used files are closed beyond the limit
+    iterfile.set_max_open_files(2)
+    assert len(iterfile._handlePool) == 2
+    del opened[:]
+    for row in range(2):
+        for f, data in zip(files, arrays):
+            np.testing.assert_array_equal(f[row:row + 1], data[row:row + 1])
+    assert opened == names * 2
+
+    iterfile.close_handle_pool()
+    assert len(iterfile._handlePool) == 0
+
+
+def test_open(tmpdir, handle_pool, opened):
+    """An HDU returned by open() stays readable whatever else is read
+    through the pool, until close()."""
+    names, arrays = write_images(tmpdir)
+    iterfile.set_max_open_files(2)
+    files = [IterFitsFile(name + '[1]') for name in names]
+    hdus = [f.open() for f in files]
+    for f, data in zip(files, arrays):
+        np.testing.assert_array_equal(f.data, data)
+    for hdu, data in zip(hdus, arrays):
+        np.testing.assert_array_equal(hdu.data, data)
+    # Reads go through the files opened by open(), not the pool
+    assert opened == names
+    assert len(iterfile._handlePool) == 0
+
+    files[0].close()
+    assert files[0].handle is None
+    np.testing.assert_array_equal(files[0][1:2], arrays[0][1:2])
+    assert len(iterfile._handlePool) == 1
+    for f in files[1:]:
+        f.close()
+
+
+@pytest.mark.parametrize('readahead', [False, True])
+def test_StackIterator(tmpdir, handle_pool, readahead):
+    names, arrays = write_images(tmpdir, shape=(7, 4))
+    files = [IterFitsFile(name + '[sci,1]') for name in names[:2]]
+    stack = iterfile.StackIterator(files + [names[2] + '[1]'], 3,
+                                   readahead=readahead)
+    assert stack.shape == (3, 7, 4)
+    assert stack.dtype == np.float32
+    assert len(stack) == 3
+
+    expected = np.array(arrays)
+    blocks = [block.copy() for block in stack]
+    assert [block.shape for block in blocks] == [(3, 3, 4), (3, 3, 4),
+                                                 (3, 1, 4)]
+    np.testing.assert_array_equal(np.concatenate(blocks, axis=1), expected)
+
+    # Leaving early does not hang a read-ahead thread
+    for block in stack:
+        break
+    np.testing.assert_array_equal(block, expected[:, :3])
+
+
+@pytest.mark.parametrize('readahead', [False, True])
+def test_StackIterator_handles(tmpdir, handle_pool, opened, readahead):
+    """Each file is opened once per iteration, however small the pool."""
+    names, arrays = write_images(tmpdir, nfiles=10, shape=(6, 4))
+    iterfile.set_max_open_files(2)
+    stack = iterfile.StackIterator([name + '[1]' for name in names], 1,
+                                   readahead=readahead)
+    del opened[:]
+    blocks = [block.copy() for block in stack]
+    np.testing.assert_array_equal(np.concatenate(blocks, axis=1), arrays)
+    assert opened == names
+    assert len(iterfile._handlePool) <= 2
+
+
+def test_StackIterator_scaled(tmpdir, handle_pool):
+    data = np.arange(20, dtype=np.uint16).reshape(5, 4) + 40000
+    fname = str(tmpdir.join('uint16.fits'))
+    fits.PrimaryHDU(data).writeto(fname)
+    names, arrays = write_images(tmpdir, nfiles=1, shape=(5, 4),
+                                 dtype='int16')
+
+    stack = iterfile.StackIterator([fname, names[0] + '[1]'], 2)
+    assert stack.dtype == np.int32
+    result = np.concatenate([block.copy() for block in stack], axis=1)
+    np.testing.assert_array_equal(result, [data, arrays[0]])
+
+    stack = iterfile.StackIterator([fname], 5, dtype=np.float64)
+    np.testing.assert_array_equal(next(iter(stack)), [data])
+
+
+def test_StackIterator_shape_mismatch(tmpdir, handle_pool):
+    names, arrays = write_images(tmpdir, nfiles=1, shape=(7, 4))
+    fname = str(tmpdir.join('other.fits'))
+    fits.PrimaryHDU(np.zeros((7, 5))).writeto(fname)
+    with pytest.raises(ValueError, match='differs'):
+        iterfile.StackIterator([names[0] + '[1]', fname], 3)
+
+
+@pytest.mark.parametrize(('dtype', 'keywords'), [
+    ('uint8', {}), ('int16', {}), ('float64', {}),
+    ('int16', {'BZERO': 32768}), ('int32', {'BZERO': 2**31}),
+    ('uint8', {'BZERO': -128}), ('int16', {'BSCALE': 2.}),
+    ('int32', {'BZERO': 5}), ('int16', {'BLANK': -1}),
+    ('float32', {'BZERO': 1.})])
+def test_header_shape_and_type(tmpdir, handle_pool, dtype, keywords):
+    hdu = fits.PrimaryHDU(np.arange(24, dtype=dtype).reshape(2, 3, 4))
+    hdu.header.update(keywords)
+    fname = str(tmpdir.join('image.fits'))
+    hdu.writeto(fname)
+
+    f = IterFitsFile(fname)
+    with fits.open(fname) as hdulist:
+        expected = hdulist[0].data
+        assert f.shape == expected.shape
+        assert f.type() == expected.dtype.name
+        # Answered from the header only
+        assert 'data' not in f.open().__dict__
+        assert f.data.dtype == expected.dtype
+        np.testing.assert_array_equal(f.data, expected)
+
+
+def test_data_view(tmpdir, handle_pool):
+    names, arrays = write_images(tmpdir, nfiles=1)
+    data = IterFitsFile(names[0] + '[1]').data
+    assert not data.flags.writeable
+    assert not data.flags.owndata
+    with pytest.raises(ValueError):
+        data[0, 0] = 1
+    iterfile.close_handle_pool()
+    np.testing.assert_array_equal(data, arrays[0])
@@ -1,9 +1,18 @@
 from __future__ import absolute_import, print_function, division
 
 import multiprocessing
+import os
+import sys
+import threading
 import time
 
-from ..mputil import launch_and_wait, best_tile_layout
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from .. import mputil
+from ..mputil import (launch_and_wait, best_tile_layout, ResultProcess,
+                      TiledExecutor, tile_layout)
 
 
 def takes_time(x):
@@ -30,6 +39,156 @@ def test_launch_and_wait():
     # print("All subprocs should be finished and joined.")
 
 
+def test_launch_and_wait_no_polling_delay():
+    """Short-lived processes should not each cost a polling interval."""
+    subprocs = [multiprocessing.Process(target=takes_time, args=(item,))
+                for item in range(20)]
+    t0 = time.time()
+    launch_and_wait(subprocs, 2)
+    assert time.time() - t0 < 10.
+    assert all(p.exitcode == 0 for p in subprocs)
+
+
+def test_launch_and_wait_failure():
+    """A nonzero exit code from any child is reported after all finish."""
+    subprocs = [multiprocessing.Process(target=sys.exit, args=(code,),
+                                        name='exit' + str(code))
+                for code in (0, 3, 0)]
+    with pytest.raises(RuntimeError, match='exit3, exitcode: 3'):
+        launch_and_wait(subprocs, 2)
+    assert [p.exitcode for p in subprocs] == [0, 3, 0]
+
+
+def make_array(n, fill):
+    """Return an array of n float64 values, optionally too large for
+    the pipe."""
+    return np.full(n, fill)
+
+
+def fails(x):
+    raise ValueError('bad value: ' + str(x))
+
+
+def test_launch_and_wait_results():
+    n = mputil.SHARED_RESULT_NBYTES // 8 + 1
+    subprocs = [ResultProcess(target=make_array, args=(n, 1.)),
+                multiprocessing.Process(target=takes_time, args=(0,)),
+                ResultProcess(target=make_array, args=(3,), kwargs={'fill': 2.}),
+                ResultProcess(target=takes_time, args=(0,))]
+    results = launch_and_wait(subprocs, 2)
+    assert len(results) == 4
+    np.testing.assert_array_equal(results[0], np.ones(n))
+    assert results[1] is None
+    np.testing.assert_array_equal(results[2], [2., 2., 2.])
+    assert results[3] is None
+
+
+def test_launch_and_wait_exception():
+    subprocs = [ResultProcess(target=takes_time, args=(0,)),
+                ResultProcess(target=fails, args=(7,))]
+    with pytest.raises(ValueError, match='bad value: 7') as excinfo:
+        launch_and_wait(subprocs, 2)
+    cause = excinfo.value.__cause__
+    assert isinstance(cause, mputil.RemoteTraceback)
+    assert 'in fails' in str(cause)
+    assert subprocs[0].exitcode == 0
+
+
+def make_list(n):
+    return list(range(n))
+
+
+def test_launch_and_wait_early_exit():
+    """A child exiting without a result, while a sibling sends one too large
+    for the pipe buffer, is reported by its exit code."""
+    n = 10 ** 6
+    subprocs = [ResultProcess(target=os._exit, args=(1,), name='early'),
+                ResultProcess(target=make_list, args=(n,)),
+                ResultProcess(target=sys.exit, args=(2,), name='exits')]
+    outcome = []
+
+    def launch():
+        try:
+            launch_and_wait(subprocs, 2)
+        except Exception as e:
+            outcome.append(e)
+
+    thread = threading.Thread(target=launch)
+    thread.daemon = True
+    thread.start()
+    thread.join(60.)
+    deadlocked = thread.is_alive()
+    if deadlocked:
+        for p in subprocs:
+            if p.is_alive():
+                p.terminate()
+    assert not deadlocked, 'launch_and_wait is deadlocked'
+    assert subprocs[1].result == list(range(n))
+    assert subprocs[2].exitcode == 2
+    assert isinstance(subprocs[2].error[0], RuntimeError)
+    assert 'early, exitcode: 1' in str(outcome[0])
+    assert 'raised SystemExit(2)' in str(subprocs[2].error[0])
+
+
+def box_sum(image, size=3):
+    """Sum over size x size boxes, with the edges extended."""
+    half = size // 2
+    padded = np.pad(image.astype(np.float64), half, mode='edge')
+    result = np.zeros(image.shape)
+    for dy in range(size):
+        for dx in range(size):
+            result += padded[dy:dy + image.shape[0], dx:dx + image.shape[1]]
+    return result
+
+
+def drop_row(image):
+    return image[1:]
+
+
+@pytest.mark.parametrize('pool_size', [1, 4, 7])
+def test_TiledExecutor_tiles(pool_size):
+    shape = (101, 37)
+    tiles = TiledExecutor(np.negative, pool_size=pool_size,
+                          halo=(2, 1)).tiles(shape)
+    assert len(tiles) <= pool_size
+    covered = np.zeros(shape, dtype=int)
+    for tile in tiles:
+        covered[tile.core] += 1
+        for npix, halo, region, core, inner in zip(shape, (2, 1), tile.region,
+                                                   tile.core, tile.inner):
+            assert region.start == max(0, core.start - halo)
+            assert region.stop == min(npix, core.stop + halo)
+            assert inner.start == core.start - region.start
+            assert inner.stop == core.stop - region.start
+    assert (covered == 1).all()
+
+
+def test_TiledExecutor_halo(tmpdir):
+    image = np.random.RandomState(0).normal(size=(61, 45)).astype('>f4')
+    expected = box_sum(image, size=5)
+
+    smooth = TiledExecutor(box_sum, pool_size=4, halo=2, dtype=np.float64)
+    assert smooth.layout(image.shape) == (2, 2)
+    np.testing.assert_array_equal(smooth(image, size=5), expected)
+
+    # Without a wide enough halo the tile edges show
+    narrow = TiledExecutor(box_sum, pool_size=4, halo=1, dtype=np.float64)
+    assert not np.array_equal(narrow(image, size=5), expected)
+
+    fname = str(tmpdir.join('image.fits'))
+    fits.PrimaryHDU(image).writeto(fname)
+    with fits.open(fname, memmap=True) as hdulist:
+        result = smooth(hdulist[0], size=5)
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_TiledExecutor_bad_shape():
+    with pytest.raises(ValueError, match='returned shape'):
+        TiledExecutor(drop_row, pool_size=2)(np.zeros((10, 10)))
+    with pytest.raises(ValueError, match='2-D'):
+        TiledExecutor(np.negative)(np.zeros(10))
+
+
 def test_best_tile_layout():
     """Loop though some numbers and make sure we get expected results."""
     for i in range(257):
@@ -43,3 +202,60 @@ def test_best_tile_layout():
         else:
             percent_unused = 100. * ((unused_cores * 1.) / i)
             assert percent_unused < 14., "Too many idles cores at i: " + str(i)
+
+
+@pytest.mark.parametrize('shape', [(2048, 4096), (1024, 1024), (100, 7)])
+def test_tile_layout(shape):
+    """No idle cores where best_tile_layout leaves some, for no more
+    pixels per tile."""
+    for pool_size in range(1, 33):
+        x, y = tile_layout(shape, pool_size)
+        assert x * y <= pool_size
+        bx, by = best_tile_layout(pool_size)
+        largest = -(-shape[0] // y) * -(-shape[1] // x)
+        assert largest <= -(-shape[0] // by) * -(-shape[1] // bx)
+
+
+def test_tile_layout_halo():
+    assert tile_layout((2048, 4096), 7) == (1, 7)
+    # A halo along X only does not cost anything for strips of rows
+    assert tile_layout((2048, 4096), 7, halo=(0, 10)) == (1, 7)
+    # but one along Y makes them more expensive than columns
+    assert tile_layout((2048, 4096), 7, halo=(10, 0)) == (7, 1)
+
+
+def test_tile_layout_memory():
+    # 8 Mb of data for 1 Mb workers needs 2 rounds of 4 tiles
+    x, y = tile_layout((1024, 1024), 4, memory_per_worker=1024 ** 2)
+    assert x * y == 8
+    # With a halo, the tiles overflow 1 Mb and 12 of them are needed
+    x, y = tile_layout((1024, 1024), 4, memory_per_worker=1024 ** 2, halo=2)
+    assert x * y == 12
+    with pytest.raises(ValueError):
+        tile_layout((10, 10), 2, memory_per_worker=4)
+
+
+def test_tile_layout_overhead():
+    """An expensive tile start-up keeps small images in fewer tiles."""
+    assert tile_layout((1024, 1024), 8) == (1, 8)
+    # 1 ms per tile against ~10 ms for the whole image
+    x, y = tile_layout((1024, 1024), 8, tile_overhead=1e-3)
+    assert 1 < x * y < 8
+    assert tile_layout((1024, 1024), 8, tile_overhead=1.) == (1, 1)
+
+
+@pytest.mark.parametrize('shape,pool_size', [((64, 64), 4), ((1024, 1024), 8)])
+def test_tile_layout_infeasible(shape, pool_size):
+    """A budget which even single pixel tiles overflow is rejected at once."""
+    t0 = time.time()
+    with pytest.raises(ValueError, match='bytes per worker'):
+        tile_layout(shape, pool_size, memory_per_worker=3200, halo=10)
+    assert time.time() - t0 < 1.
+
+
+def test_tile_layout_many_rounds():
+    """The fewest rounds which fit are found without trying each."""
+    # 6 pixels per tile, with a halo of a row above and below, leave room
+    # for tiles of at most 4 rows by 1 column: 256 of them, or 32 rounds
+    assert tile_layout((32, 32), 8, memory_per_worker=48, halo=(1, 0)) == \
+        (32, 8)
@@ -0,0 +1,117 @@
+"""Tests for the coordinate transformations of wcsutil.WCSObject."""
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+import pytest
+from astropy.io import fits
+
+from ..wcsutil import WCSObject
+
+
+def make_wcs():
+    hdr = fits.Header()
+    for key, value in [('NAXIS', 2), ('NAXIS1', 400), ('NAXIS2', 200),
+                       ('CRPIX1', 200.5), ('CRPIX2', 100.5),
+                       ('CRVAL1', 150.1), ('CRVAL2', 2.2),
+                       ('CTYPE1', 'RA---TAN'), ('CTYPE2', 'DEC--TAN'),
+                       ('CD1_1', -1.1e-05), ('CD1_2', 3.0e-06),
+                       ('CD2_1', 2.9e-06), ('CD2_2', 1.09e-05),
+                       ('ORIENTAT', 15.)]:
+        hdr[key] = value
+    return WCSObject('test.fits', header=hdr)
+
+
+def test_xy2rd_rd2xy_arrays():
+    wcs = make_wcs()
+    xy = np.random.RandomState(0).uniform(0, 400, size=(50, 2))
+
+    ra, dec = wcs.xy2rd(xy)
+    assert ra.shape == dec.shape == (50,)
+    for i in (0, 17, 49):
+        assert wcs.xy2rd(tuple(xy[i])) == (ra[i], dec[i])
+    rax, decx = wcs.xy2rd((xy[:, 0], xy[:, 1]))
+    np.testing.assert_array_equal(rax, ra)
+    np.testing.assert_array_equal(decx, dec)
+
+    x, y = wcs.rd2xy(np.column_stack([ra, dec]))
+    np.testing.assert_allclose(x, xy[:, 0], atol=1e-6)
+    np.testing.assert_allclose(y, xy[:, 1], atol=1e-6)
+    for i in (0, 17, 49):
+        assert wcs.rd2xy((ra[i], dec[i])) == (x[i], y[i])
+    xh, yh = wcs.rd2xy((list(ra / 15.), list(dec)), hour=True)
+    np.testing.assert_allclose(xh, x)
+    np.testing.assert_allclose(yh, y)
+
+
+def test_list_of_positions():
+    wcs = make_wcs()
+    skypos = [(150.1, 2.2), (150.101, 2.201), (150.102, 2.2)]
+    x, y = wcs.rd2xy(skypos)
+    assert x.shape == y.shape == (3,)
+    for i, pos in enumerate(skypos):
+        assert wcs.rd2xy(pos) == (x[i], y[i])
+    np.testing.assert_allclose(wcs.xy2rd([[x[1], y[1]], [x[2], y[2]]]),
+                               np.transpose(skypos[1:]))
+
+    # A tuple of two sequences is a pair of coordinate arrays
+    x2, y2 = wcs.rd2xy(((150.1, 150.101), (2.2, 2.201)))
+    np.testing.assert_array_equal(x2, x[:2])
+    np.testing.assert_array_equal(y2, y[:2])
+
+
+def test_transform_cache():
+    wcs = make_wcs()
+    assert wcs.rd2xy((150.1, 2.2)) == (200.5, 100.5)
+    # Direct changes to the WCS are picked up
+    wcs.crval1 = 150.2
+    assert wcs.rd2xy((150.2, 2.2)) == (200.5, 100.5)
+    wcs.updateWCS(refval=(150.3, 2.3))
+    assert wcs.rd2xy((150.3, 2.3)) == (200.5, 100.5)
+    np.testing.assert_allclose(wcs.xy2rd((200.5, 100.5)), (150.3, 2.3))
+
+    wcs.cd11 = wcs.cd12 = 0.
+    with pytest.raises(ArithmeticError):
+        wcs.rd2xy((150.3, 2.3))
+
+
+def check_transform(wcs):
+    """The cached transformation agrees with the active WCS values."""
+    x, y = wcs.rd2xy((wcs.crval1, wcs.crval2))
+    np.testing.assert_allclose((x, y), (wcs.crpix1, wcs.crpix2), atol=1e-8)
+    ra, dec = wcs.xy2rd((wcs.crpix1, wcs.crpix2))
+    np.testing.assert_allclose((ra, dec), (wcs.crval1, wcs.crval2),
+                               rtol=1e-12)
+    assert wcs.get_orient() == pytest.approx(
+        np.degrees(np.arctan2(wcs.cd12, wcs.cd22)), rel=1e-14)
+    assert wcs.pscale == pytest.approx(
+        wcs.compute_pscale(wcs.cd11, wcs.cd21), rel=1e-14)
+
+
+@pytest.mark.parametrize('change', [
+    lambda wcs: wcs.updateWCS(pixel_scale=0.1, orient=30.),
+    lambda wcs: wcs.updateWCS(refval=(150.3, 2.3), refpos=(10., 20.)),
+    lambda wcs: wcs.rotateCD(45.),
+    lambda wcs: wcs.scale_WCS(0.08),
+    lambda wcs: wcs.scale_WCS(0.08, retain=False),
+    lambda wcs: wcs.recenter(),
+    lambda wcs: wcs.restore()])
+def test_transform_cache_invalidation(change):
+    wcs = make_wcs()
+    wcs.updateWCS(refval=(150.2, 2.25), refpos=(10., 20.), orient=20.)
+    check_transform(wcs)
+    change(wcs)
+    check_transform(wcs)
+
+
+def test_xy2rd_grid():
+    wcs = make_wcs()
+    ra, dec = wcs.xy2rd_grid()
+    assert ra.shape == dec.shape == (200, 400)
+    y, x = np.mgrid[1:201, 1:401]
+    rax, decx = wcs.xy2rd((x.ravel().astype(float), y.ravel().astype(float)))
+    np.testing.assert_array_equal(ra.ravel(), rax)
+    np.testing.assert_array_equal(dec.ravel(), decx)
+
+    ra, dec = wcs.xy2rd_grid(size=(3, 2))
+    assert ra.shape == (2, 3)
+    assert (ra[1, 2], dec[1, 2]) == wcs.xy2rd((3., 2.))
@@ -54,11 +54,17 @@ DEFAULT_PREFIX = 'O'
 # 29-June-2005 WJH: Multiple WCS extensions are not created when running
 #                   'createReferenceWCS'.
 #
+# 18-Oct-2026:     'xy2rd' and 'rd2xy' accept (N,2) arrays or separate arrays
+#                   of coordinates, and share terms of the transformation
+#                   cached on the object until the WCS changes.
+#                   Pixel scale and orientation are cached along with them,
+#                   and 'xy2rd_grid' computes RA/Dec for every pixel.
+#
 
 
 
 
-__version__ = '1.2.3 (11-Feb-2011)'
+__version__ = '1.4.0 (18-Oct-2026)'
 
 def help():
     print('wcsutil Version '+str(__version__)+':\n')
@@ -142,6 +148,31 @@ def troll(roll, dec, v2, v3):
 #
 #################
 
+# WCSObject attributes from which the cached transformation terms are derived
+_TRANSFORM_ATTRS = ('crval1', 'crval2', 'cd11', 'cd12', 'cd21', 'cd22')
+
+# Number of rows of pixels converted at a time by WCSObject.xy2rd_grid
+GRID_BLOCK_ROWS = 64
+
+
+def _split_pos(pos):
+    """ Return the two coordinates from a single position, from a pair of
+        sequences/arrays of coordinates, or from an (N,2) array or sequence
+        of positions.  A tuple of two items is always taken as the pair of
+        coordinates, even when each of them holds two values.
+    """
+    if not (isinstance(pos, tuple) and len(pos) == 2):
+        pos = N.asarray(pos)
+        if pos.ndim == 2 and pos.shape[-1] == 2:
+            return pos[:,0], pos[:,1]
+    coords = []
+    for c in (pos[0], pos[1]):
+        if isinstance(c, (list, tuple)):
+            c = N.asarray(c, dtype=N.float64)
+        coords.append(c)
+    return coords
+
+
 class WCSObject:
     """ This class should contain the WCS information from the
         input exposure's header and provide conversion functionality
@@ -198,9 +229,11 @@ class WCSObject:
         updateWCS(pixel_scale=None,orient=None,refpos=None,refval=None,size=None)
             reset entire WCS based on given values
         xy2rd(pos)
-            compute RA/Dec position for given (x,y) tuple
+            compute RA/Dec position(s) for given (x,y) tuple or arrays
+        xy2rd_grid(size=None)
+            compute RA/Dec arrays for every pixel of the image
         rd2xy(skypos,hour=no)
-            compute X,Y position for given (RA,Dec)
+            compute X,Y position(s) for given (RA,Dec) tuple or arrays
         rotateCD(orient)
             rotate CD matrix to new orientation given by 'orient'
         recenter()
@@ -226,6 +259,10 @@ class WCSObject:
             prints out this help message
 
     """
+    # Terms of the transformation computed from the active WCS, see
+    # _get_transform(); reset whenever one of _TRANSFORM_ATTRS is set.
+    _transform = None
+
     def __init__(self, rootname,header=None,shape=None,pa_key='PA_V3',new=no,prefix=None):
         # Initialize wcs dictionaries:
         #   wcsdef - default values for new images
@@ -391,6 +428,40 @@ class WCSObject:
         # Read in any archived WCS keyword values, if they exist
         self.read_archive(_header,prepend=prefix)
 
+    def __setattr__(self, name, value):
+        if name in _TRANSFORM_ATTRS:
+            self._invalidate_transform()
+        self.__dict__[name] = value
+
+    def _invalidate_transform(self):
+        """ Discard the cached transformation terms.  Done whenever the
+            reference point or CD matrix is set, and by update() for values
+            set directly in __dict__ (as by restore()).
+        """
+        self.__dict__['_transform'] = None
+
+    def _get_transform(self):
+        """ Return a dictionary with the terms of the TAN transformation
+            which only depend on the reference point and CD matrix (trig
+            of the reference point, CD inverse, pixel scale and
+            orientation), computing them the first time they are needed
+            after a change.
+        """
+        if self._transform is None:
+            ra0 = DEGTORAD(self.crval1)
+            dec0 = DEGTORAD(self.crval2)
+            det = self.cd11*self.cd22 - self.cd12*self.cd21
+            _transform = {'ra0':ra0, 'dec0':dec0,
+                          'sindec0':N.sin(dec0), 'cosdec0':N.cos(dec0),
+                          'det':det, 'cdinv':None,
+                          'pscale':self.compute_pscale(self.cd11,self.cd21),
+                          'orient':RADTODEG(N.arctan2(self.cd12,self.cd22))}
+            if det != 0.0:
+                _transform['cdinv'] = (self.cd22 / det, -self.cd12 / det,
+                                       -self.cd21 / det, self.cd11 / det)
+            self._transform = _transform
+        return self._transform
+
     # You never know when you want to print out the WCS keywords...
     def __str__(self):
         block = 'WCS Keywords for ' + self.rootname + ': \n'
@@ -447,7 +518,7 @@ class WCSObject:
         if self.new:
             self.pscale = 1.0
         else:
-            self.pscale = self.compute_pscale(self.cd11,self.cd21)
+            self.pscale = self._get_transform()['pscale']
 
     def compute_pscale(self,cd11,cd21):
         """ Compute the pixel scale based on active WCS values. """
@@ -455,14 +526,16 @@ class WCSObject:
 
     def get_orient(self):
         """ Return the computed orientation based on CD matrix. """
-        return RADTODEG(N.arctan2(self.cd12,self.cd22))
+        return self._get_transform()['orient']
 
     def set_orient(self):
         """ Return the computed orientation based on CD matrix. """
-        self.orient = RADTODEG(N.arctan2(self.cd12,self.cd22))
+        self.orient = self._get_transform()['orient']
 
     def update(self):
         """ Update computed values of WCS based on current CD matrix."""
+        # Values may have been set directly in __dict__ (see restore)
+        self._invalidate_transform()
         self.set_pscale()
         self.set_orient()
 
@@ -559,6 +632,7 @@ class WCSObject:
             self.cd21 *= _ratio
             self.cd22 *= _ratio
         else:
+            pa = DEGTORAD(self.orient)
             pscale = pixel_scale / 3600.
             self.cd11 = -pscale * N.cos(pa)
             self.cd12 = pscale * N.sin(pa)
@@ -577,32 +651,29 @@ class WCSObject:
         The algorithm comes directly from 'imgtools.xy2rd'
 
         translate (x,y) to (ra, dec)
+
+        'pos' can be a single (x,y) position, an (N,2) array or list of
+        positions or a tuple of arrays (x,y); in the latter cases, arrays
+        of RA and Dec are returned.
         """
         if self.ctype1.find('TAN') < 0 or self.ctype2.find('TAN') < 0:
             print('XY2RD only supported for TAN projections.')
             raise TypeError
 
-        if isinstance(pos,N.ndarray):
-            # If we are working with an array of positions,
-            # point to just X and Y values
-            posx = pos[:,0]
-            posy = pos[:,1]
-        else:
-            # Otherwise, we are working with a single X,Y tuple
-            posx = pos[0]
-            posy = pos[1]
+        posx, posy = _split_pos(pos)
+        _t = self._get_transform()
 
         xi = self.cd11 * (posx - self.crpix1) + self.cd12 * (posy - self.crpix2)
         eta = self.cd21 * (posx - self.crpix1) + self.cd22 * (posy - self.crpix2)
 
         xi = DEGTORAD(xi)
         eta = DEGTORAD(eta)
-        ra0 = DEGTORAD(self.crval1)
-        dec0 = DEGTORAD(self.crval2)
+        cosdec0 = _t['cosdec0']
+        sindec0 = _t['sindec0']
 
-        ra = N.arctan((xi / (N.cos(dec0)-eta*N.sin(dec0)))) + ra0
-        dec = N.arctan( ((eta*N.cos(dec0)+N.sin(dec0)) /
-                (N.sqrt((N.cos(dec0)-eta*N.sin(dec0))**2 + xi**2))) )
+        ra = N.arctan((xi / (cosdec0-eta*sindec0))) + _t['ra0']
+        dec = N.arctan( ((eta*cosdec0+sindec0) /
+                (N.sqrt((cosdec0-eta*sindec0)**2 + xi**2))) )
 
         ra = RADTODEG(ra)
         dec = RADTODEG(dec)
@@ -612,44 +683,109 @@ class WCSObject:
         return ra,dec
 
 
+    def xy2rd_grid(self,size=None):
+        """
+        Compute the RA and Dec of every pixel of the image, or of an image
+        of the given size (nx,ny), as arrays of shape (ny,nx) where element
+        [j,i] corresponds to the position (x,y) = (i+1,j+1).  The values are
+        the same as returned by 'xy2rd' for these positions.
+
+        """
+        if self.ctype1.find('TAN') < 0 or self.ctype2.find('TAN') < 0:
+            print('XY2RD only supported for TAN projections.')
+            raise TypeError
+
+        if size is None:
+            size = (self.naxis1,self.naxis2)
+        nx, ny = int(size[0]), int(size[1])
+        _t = self._get_transform()
+        cosdec0 = _t['cosdec0']
+        sindec0 = _t['sindec0']
+
+        ra = N.empty((ny,nx),dtype=N.float64)
+        dec = N.empty((ny,nx),dtype=N.float64)
+
+        # xi and eta are linear in x and y: only their terms along each
+        # axis need computing, the rest is done in place, a block of rows
+        # at a time to keep the temporary arrays small.
+        dx = N.arange(1,nx+1,dtype=N.float64) - self.crpix1
+        dy = (N.arange(1,ny+1,dtype=N.float64) - self.crpix2)[:,N.newaxis]
+        xi_x, eta_x = self.cd11 * dx, self.cd21 * dx
+        xi_y, eta_y = self.cd12 * dy, self.cd22 * dy
+
+        for start in range(0,ny,GRID_BLOCK_ROWS):
+            rows = slice(start,min(start+GRID_BLOCK_ROWS,ny))
+            _ra = ra[rows]
+            _dec = dec[rows]
+            xi = xi_x + xi_y[rows]
+            eta = eta_x + eta_y[rows]
+            xi *= N.pi
+            xi /= 180.
+            eta *= N.pi
+            eta /= 180.
+
+            # _dec temporarily holds cosdec0 - eta*sindec0
+            N.multiply(eta,sindec0,out=_dec)
+            N.subtract(cosdec0,_dec,out=_dec)
+            N.divide(xi,_dec,out=_ra)
+            N.arctan(_ra,out=_ra)
+            _ra += _t['ra0']
+
+            N.square(_dec,out=_dec)
+            N.square(xi,out=xi)
+            _dec += xi
+            N.sqrt(_dec,out=_dec)
+            eta *= cosdec0
+            eta += sindec0
+            N.divide(eta,_dec,out=_dec)
+            N.arctan(_dec,out=_dec)
+
+        ra *= 180.
+        ra /= N.pi
+        dec *= 180.
+        dec /= N.pi
+        N.remainder(ra,360.,out=ra)
+
+        return ra,dec
+
     def rd2xy(self,skypos,hour=no):
         """
         This method would use the WCS keywords to compute the XY position
         from a given RA/Dec tuple (in deg).
 
-        NOTE: Investigate how to let this function accept arrays as well
-        as single positions. WJH 27Mar03
+        'skypos' can be a single (RA,Dec) position, an (N,2) array or list
+        of positions or a tuple of arrays (RA,Dec); in the latter cases,
+        arrays of X and Y are returned.  If 'hour' is set, RA is given in hours.
 
         """
         if self.ctype1.find('TAN') < 0 or self.ctype2.find('TAN') < 0:
             print('RD2XY only supported for TAN projections.')
             raise TypeError
 
-        det = self.cd11*self.cd22 - self.cd12*self.cd21
-
-        if det == 0.0:
+        _t = self._get_transform()
+        if _t['cdinv'] is None:
             raise ArithmeticError("singular CD matrix!")
-
-        cdinv11 = self.cd22 / det
-        cdinv12 = -self.cd12 / det
-        cdinv21 = -self.cd21 / det
-        cdinv22 = self.cd11 / det
+        cdinv11, cdinv12, cdinv21, cdinv22 = _t['cdinv']
 
         # translate (ra, dec) to (x, y)
 
-        ra0 = DEGTORAD(self.crval1)
-        dec0 = DEGTORAD(self.crval2)
+        ra, dec = _split_pos(skypos)
         if hour:
-            skypos[0] = skypos[0] * 15.
-        ra = DEGTORAD(skypos[0])
-        dec = DEGTORAD(skypos[1])
-
-        bottom = float(N.sin(dec)*N.sin(dec0) + N.cos(dec)*N.cos(dec0)*N.cos(ra-ra0))
-        if bottom == 0.0:
+            ra = ra * 15.
+        ra = DEGTORAD(ra)
+        dec = DEGTORAD(dec)
+        cosdec0 = _t['cosdec0']
+        sindec0 = _t['sindec0']
+
+        cosdec = N.cos(dec)
+        sindec = N.sin(dec)
+        cosdra = N.cos(ra-_t['ra0'])
+        bottom = sindec*sindec0 + cosdec*cosdec0*cosdra
+        if N.any(bottom == 0.0):
             raise ArithmeticError("Unreasonable RA/Dec range!")
 
-        xi = RADTODEG((N.cos(dec) * N.sin(ra-ra0) / bottom))
-        eta = RADTODEG((N.sin(dec)*N.cos(dec0) - N.cos(dec)*N.sin(dec0)*N.cos(ra-ra0)) / bottom)
+        xi = RADTODEG((cosdec * N.sin(ra-_t['ra0']) / bottom))
+        eta = RADTODEG((sindec*cosdec0 - cosdec*sindec0*cosdra) / bottom)
 
         x = cdinv11 * xi + cdinv12 * eta + self.crpix1
         y = cdinv21 * xi + cdinv22 * eta + self.crpix2
@@ -60,7 +60,8 @@ setup(
     entry_points = {
         'console_scripts': [
             'convertwaiveredfits=stsci.tools.convertwaiveredfits:main',
-            'convertlog=stsci.tools.convertlog:main'
+            'convertlog=stsci.tools.convertlog:main',
+            'convert-batch=stsci.tools.check_files:main'
         ],
     },
 )